@@ -0,0 +1,120 @@
+import asyncio
+import logging
+from collections import deque
+
+log = logging.getLogger("levels.actors")
+
+DROP_NEWEST = "drop_newest"
+DROP_OLDEST = "drop_oldest"
+POLICIES = (DROP_NEWEST, DROP_OLDEST)
+
+
+class ShardStats:
+    __slots__ = ("processed", "dropped", "high_water")
+
+    def __init__(self):
+        self.processed = 0
+        self.dropped = 0
+        self.high_water = 0
+
+
+class GuildActors:
+    """
+    Bounded event queues, each drained by a single worker task.
+
+    Members of a guild are spread over ``shards`` queues by member ID, so all events of a member are handled in order
+    by the same worker and its in-memory state needs no locks. Workers are started when their queue gets an event and
+    end once it's empty. A queue holding ``max_depth`` events applies ``policy``: ``drop_newest`` refuses the new
+    event and ``drop_oldest`` makes room by discarding the oldest waiting one.
+    """
+
+    def __init__(self, handler, shards: int = 4, max_depth: int = 1000, policy: str = DROP_NEWEST):
+        self.handler = handler
+        self.shards = shards
+        self.max_depth = max_depth
+        self.policy = policy
+        self.queues = {}
+        self.tasks = {}
+        self.stats = {}
+
+    def submit(self, guild_id: int, member_id: int, event) -> bool:
+        """
+        Queues an event without waiting for it to be handled and returns False if it was dropped
+        """
+        key = (guild_id, member_id % self.shards)
+        queue = self.queues.get(key)
+        if queue is None:
+            queue = self.queues[key] = deque()
+            self.stats.setdefault(key, ShardStats())
+        stats = self.stats[key]
+        accepted = True
+
+        # If queue is full, apply the backpressure policy
+        if len(queue) >= self.max_depth:
+            stats.dropped += 1
+            if self.policy == DROP_OLDEST:
+                queue.popleft()
+                queue.append(event)
+            else:
+                accepted = False
+        else:
+            queue.append(event)
+            stats.high_water = max(stats.high_water, len(queue))
+
+        # Start a worker for the shard if there isn't one
+        if key not in self.tasks:
+            self.tasks[key] = asyncio.ensure_future(self._work(key))
+
+        return accepted
+
+    async def _work(self, key):
+        queue = self.queues[key]
+        stats = self.stats[key]
+
+        try:
+            while queue:
+                event = queue.popleft()
+                try:
+                    await self.handler(event)
+                except Exception:
+                    log.exception("Failed to handle an event of guild {}".format(key[0]))
+                stats.processed += 1
+        finally:
+            del self.tasks[key]
+            if not queue:
+                del self.queues[key]
+
+    def depth(self, guild_id: int = None) -> int:
+        """
+        Returns how many events are waiting, in one guild or overall
+        """
+        return sum(len(queue) for key, queue in self.queues.items() if guild_id is None or key[0] == guild_id)
+
+    def report(self) -> str:
+        processed = sum(stats.processed for stats in self.stats.values())
+        dropped = sum(stats.dropped for stats in self.stats.values())
+        high_water = max((stats.high_water for stats in self.stats.values()), default=0)
+        busiest = sorted(self.queues.items(), key=lambda item: len(item[1]), reverse=True)[:5]
+
+        lines = ["{} events waiting in {} queues, {} workers running".format(self.depth(), len(self.queues),
+                                                                           len(self.tasks)),
+                 "{} handled, {} dropped ({}), deepest queue {} of {}".format(processed, dropped, self.policy,
+                                                                            high_water, self.max_depth)]
+        for (guild_id, shard), queue in busiest:
+            lines.append("guild {} shard {}: {} waiting".format(guild_id, shard, len(queue)))
+
+        return "\n".join(lines)
+
+    def reset(self):
+        self.stats = {key: ShardStats() for key in self.queues}
+
+    async def join(self):
+        """
+        Waits until every queue is empty
+        """
+        while self.tasks:
+            await asyncio.gather(*self.tasks.values(), return_exceptions=True)
+
+    def close(self):
+        for task in self.tasks.values():
+            task.cancel()
@@ -0,0 +1,46 @@
+"""
+Guild-wide reports built from snapshot copies of member data.
+
+Functions here only read the lists they're given, so the cog can run them in an executor for large guilds.
+"""
+from bisect import bisect_right
+
+# Lower bounds of the level ranges shown in the distribution
+LEVEL_RANGES = (0, 1, 5, 10, 20, 30, 50, 75, 100, 200)
+BAR_WIDTH = 30
+
+
+def _percentile(values: list, fraction: float):
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def level_distribution(members: list) -> str:
+    """
+    Formats a histogram of levels and activity totals from ``(member_id, level, exp, message_count, message_with_xp)``
+    tuples
+    """
+    if not members:
+        return "No member activity registered."
+
+    levels = sorted(member[1] for member in members)
+    counts = [0] * len(LEVEL_RANGES)
+    for level in levels:
+        counts[bisect_right(LEVEL_RANGES, level) - 1] += 1
+
+    messages = sum(member[3] for member in members)
+    xp_messages = sum(member[4] for member in members)
+
+    lines = ["{} members, median level {}, p90 {}, p99 {}, highest {}".format(
+        len(levels), _percentile(levels, 0.5), _percentile(levels, 0.9), _percentile(levels, 0.99), levels[-1]),
+        "{:,} messages, {:.0%} of them awarded XP".format(messages, xp_messages / messages if messages else 0),
+        ""]
+
+    # One bar per level range, scaled to the largest range
+    largest = max(counts)
+    bounds = LEVEL_RANGES + (None,)
+    for low, high, count in zip(bounds, bounds[1:], counts):
+        label = str(low) if high == low + 1 else "{}+".format(low) if high is None else "{}-{}".format(low, high - 1)
+        lines.append("{:>8} {:<{width}} {}".format(label, "#" * round(BAR_WIDTH * count / largest), count,
+                                                   width=BAR_WIDTH))
+
+    return "\n".join(lines)
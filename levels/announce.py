@@ -0,0 +1,93 @@
+import asyncio
+import logging
+from collections import deque
+
+import discord
+
+log = logging.getLogger("levels.announce")
+
+MESSAGE_LIMIT = 2000
+
+
+class AnnouncementDispatcher:
+    """
+    Per-channel queues that send level-up announcements in the background.
+
+    Announcements queued for a channel within ``window`` seconds are merged into as few messages as the 2000
+    character limit allows. Past ``max_backlog`` waiting announcements, new ones are dropped and summarized in a
+    single line so a burst of level-ups can't pile up sends.
+    """
+
+    def __init__(self, window: float = 2.0, max_backlog: int = 50):
+        self.window = window
+        self.max_backlog = max_backlog
+        self.queues = {}
+        self.dropped = {}
+        self.tasks = {}
+
+    def announce(self, channel: discord.abc.Messageable, text: str):
+        """
+        Queues an announcement without waiting for it to be sent
+        """
+        queue = self.queues.setdefault(channel.id, deque())
+
+        # If backlog is full, only count it
+        if len(queue) >= self.max_backlog:
+            self.dropped[channel.id] = self.dropped.get(channel.id, 0) + 1
+        else:
+            queue.append(text)
+
+        # Start a sender for the channel if there isn't one
+        if channel.id not in self.tasks:
+            self.tasks[channel.id] = asyncio.ensure_future(self._drain(channel))
+
+    async def _drain(self, channel: discord.abc.Messageable):
+        queue = self.queues[channel.id]
+
+        try:
+            while queue:
+                # Let announcements arriving shortly after gather before sending
+                await asyncio.sleep(self.window)
+                texts = list(queue)
+                queue.clear()
+                dropped = self.dropped.pop(channel.id, 0)
+
+                for content in self.pack(texts, dropped):
+                    try:
+                        await channel.send(content)
+                    except discord.HTTPException:
+                        log.debug("Failed to send level up announcement in channel {}".format(channel.id))
+        finally:
+            del self.tasks[channel.id]
+            if not queue:
+                del self.queues[channel.id]
+
+    @staticmethod
+    def pack(texts: list, dropped: int = 0) -> list:
+        """
+        Merges announcements into messages of at most 2000 characters, one announcement per line
+        """
+        if dropped:
+            texts = texts + ["...and {} more level ups".format(dropped)]
+
+        messages = []
+        content = ""
+
+        for text in texts:
+            text = text[:MESSAGE_LIMIT]
+
+            # Start a new message if this one would get too long
+            if content and len(content) + 1 + len(text) > MESSAGE_LIMIT:
+                messages.append(content)
+                content = ""
+
+            content = content + "\n" + text if content else text
+
+        if content:
+            messages.append(content)
+
+        return messages
+
+    def close(self):
+        for task in self.tasks.values():
+            task.cancel()
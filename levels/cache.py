@@ -0,0 +1,388 @@
+import asyncio
+import logging
+
+import discord
+
+from . import record
+
+log = logging.getLogger("levels.cache")
+
+
+class MemberEntry:
+    """
+    A cached member record.
+
+    It exposes the same ``get_raw``/``set_raw`` accessors as a Config group so the XP pipeline can use it in place of
+    ``config.member(member)``. Writes stay in memory and are only marked dirty until the cache flushes them. ``data``
+    holds the unpacked stored fields and is None for members that were looked up but never initialized.
+    """
+    __slots__ = ("cache", "guild_id", "member_id", "data")
+
+    def __init__(self, cache, guild_id: int, member_id: int, data: dict):
+        self.cache = cache
+        self.guild_id = guild_id
+        self.member_id = member_id
+        self.data = data
+
+    @property
+    def tracked(self) -> bool:
+        return self.data is not None
+
+    def track(self, data: dict):
+        """
+        Initializes the record of a member seen for the first time
+        """
+        self.data = data
+        self.cache.mark_dirty(self)
+
+    async def get_raw(self, key):
+        return self.data[key]
+
+    async def set_raw(self, key, value):
+        self.data[key] = value
+        self.cache.mark_dirty(self)
+
+    async def update(self, values: dict):
+        self.data.update(values)
+        self.cache.mark_dirty(self)
+
+    async def all(self):
+        return dict(self.data)
+
+
+class MemberCache:
+    """
+    Write-back cache of member records, grouped by guild.
+
+    Every member is loaded once, either in bulk by ``load_all`` or lazily by ``get``. Changes are kept in memory and
+    written back to Config by ``flush``, one write per guild, which runs on a timer, on unload and whenever
+    ``max_dirty`` members are waiting to be written. Config calls are counted on ``counter``, anything with ``reads`` and ``writes`` attributes.
+    Records are stored in the compact format of ``record`` and members still stored in the legacy format are
+    remembered in ``legacy`` until ``migrate`` rewrites them. With a ``store``, a ``SqliteStore``, records are read
+    from and written to it instead of Config, each flush in a single transaction.
+    """
+
+    def __init__(self, config, counter, max_dirty: int = 500):
+        self.config = config
+        self.counter = counter
+        self.max_dirty = max_dirty
+        self.guilds = {}
+        self.dirty = set()
+        self.legacy = set()
+        self.store = None
+        self.loaded = asyncio.Event()
+        self._flushing = None
+
+        # Held by every write and reset, so a reset can't land between the read and the write of a guild
+        self._lock = asyncio.Lock()
+
+    async def load_all(self):
+        """
+        Loads every stored member of every guild with a single Config or store read
+        """
+        try:
+            self.counter.reads += 1
+            if self.store is not None:
+                await self._load_store()
+                return
+
+            all_members = await self.config.all_members()
+            for guild_id, members in all_members.items():
+                guild = self.guilds.setdefault(int(guild_id), {})
+                for member_id, stored in members.items():
+                    # Don't overwrite entries that were lazily loaded and changed while this was running
+                    if int(member_id) not in guild:
+                        guild[int(member_id)] = self._entry(int(guild_id), int(member_id), stored)
+            log.debug("Loaded {} guilds into the member cache".format(len(all_members)))
+        except Exception:
+            # Members will be loaded lazily instead
+            log.exception("Failed to preload the member cache")
+        finally:
+            self.loaded.set()
+
+    async def _load_store(self) -> int:
+        """
+        Caches the members of the store that aren't cached yet and returns how many there were
+        """
+        count = 0
+        for guild_id, members in (await self.store.load_all()).items():
+            guild = self.guilds.setdefault(guild_id, {})
+            for member_id, data in members.items():
+                if member_id not in guild:
+                    guild[member_id] = MemberEntry(self, guild_id, member_id, data)
+                    count += 1
+
+        log.debug("Loaded {} members from the store into the member cache".format(count))
+        return count
+
+    async def get(self, guild_id: int, member_id: int) -> MemberEntry:
+        """
+        Returns the cached entry of a member, loading it from Config if it isn't cached yet
+        """
+        guild = self.guilds.setdefault(guild_id, {})
+        entry = guild.get(member_id)
+
+        if entry is None:
+            self.counter.reads += 1
+            if self.store is not None:
+                data = await self.store.get(guild_id, member_id)
+            else:
+                # Config.member_from_ids only exists since Red 3.2
+                group = self.config._get_base_group(self.config.MEMBER, str(guild_id), str(member_id))
+                stored = await group.all()
+
+            # Another task may have loaded it while this one was waiting
+            entry = guild.get(member_id)
+            if entry is None and self.store is not None:
+                entry = guild[member_id] = MemberEntry(self, guild_id, member_id, data)
+            elif entry is None:
+                entry = guild[member_id] = self._entry(guild_id, member_id, stored)
+
+        return entry
+
+    def _entry(self, guild_id: int, member_id: int, stored: dict) -> MemberEntry:
+        if record.is_legacy(stored):
+            self.legacy.add((guild_id, member_id))
+        return MemberEntry(self, guild_id, member_id, record.unpack(stored))
+
+    def put(self, guild_id: int, member_id: int, data: dict):
+        """
+        Replaces the record of a member without marking it dirty, for bulk loads followed by ``write_guild``
+        """
+        guild = self.guilds.setdefault(guild_id, {})
+        entry = guild.get(member_id)
+
+        if entry is None:
+            guild[member_id] = MemberEntry(self, guild_id, member_id, data)
+        else:
+            entry.data = data
+        self.legacy.discard((guild_id, member_id))
+
+    async def write_guild(self, guild_id: int, member_ids=None):
+        """
+        Writes every cached member of a guild with a single Config write, or the given ones in a single transaction
+
+        Config stores a guild as one group, so every tracked cached record is written over what was stored, members
+        only stored in Config are kept, and member_ids only decides which dirty marks the write clears. The cached
+        records are packed right before the write, so changes made while reading go out with it too, and members
+        stored in the legacy format are rewritten in the compact one. If the write fails, the members it cleared are
+        marked dirty again.
+        """
+        async with self._lock:
+            await self._write_guild(guild_id, member_ids)
+
+    async def _write_guild(self, guild_id: int, member_ids):
+        members = self.members(guild_id)
+        if member_ids is None:
+            member_ids = set(members)
+
+        if self.store is not None:
+            written = {(guild_id, member_id) for member_id in member_ids if member_id in members}
+            rows = [(guild_id, member_id, members[member_id].data) for _, member_id in written
+                    if members[member_id].tracked]
+        else:
+            # The group of a whole guild merges the member defaults into its members on Red 3.1, all_members doesn't
+            group = self.config._get_base_group(self.config.MEMBER, str(guild_id))
+            self.counter.reads += 1
+            all_members = await self.config.all_members(discord.Object(id=guild_id))
+            stored = {str(member_id): data for member_id, data in all_members.items()}
+
+            # Members may have been discarded while reading
+            tracked = [entry for entry in members.values() if entry.tracked]
+            stored.update({str(entry.member_id): record.pack(entry.data) for entry in tracked})
+            written = {(guild_id, member_id) for member_id in member_ids if member_id in members}
+
+        self.dirty -= written
+        self.counter.writes += 1
+        try:
+            if self.store is not None:
+                await self.store.write(rows)
+            else:
+                await group.set(stored)
+        except BaseException:
+            self.dirty |= written
+            raise
+
+        if self.store is None:
+            self.legacy -= {(guild_id, entry.member_id) for entry in tracked}
+
+    def members(self, guild_id: int) -> dict:
+        """
+        Returns the cached entries of a guild keyed by member ID
+        """
+        return self.guilds.get(guild_id, {})
+
+    def mark_dirty(self, entry: MemberEntry):
+        self.dirty.add((entry.guild_id, entry.member_id))
+
+        # Start an early flush if too many members are waiting
+        if len(self.dirty) >= self.max_dirty and self._flushing is None:
+            self._flushing = asyncio.ensure_future(self._flush())
+
+    def discard(self, guild_id: int, member_id: int):
+        """
+        Drops a member from the cache without writing its pending changes
+        """
+        self.guilds.get(guild_id, {}).pop(member_id, None)
+        self.dirty.discard((guild_id, member_id))
+        self.legacy.discard((guild_id, member_id))
+
+    def discard_guild(self, guild_id: int):
+        """
+        Drops a whole guild from the cache without writing its pending changes
+        """
+        self.guilds.pop(guild_id, None)
+        self.dirty = {key for key in self.dirty if key[0] != guild_id}
+        self.legacy = {key for key in self.legacy if key[0] != guild_id}
+
+    async def reset_member(self, guild_id: int, member_id: int):
+        """
+        Drops a member from the cache and deletes it from storage
+
+        A write already running finishes first, so it can't store the member again after the delete.
+        """
+        async with self._lock:
+            self.discard(guild_id, member_id)
+            self.counter.writes += 1
+            await self.config._get_base_group(self.config.MEMBER, str(guild_id), str(member_id)).clear()
+            if self.store is not None:
+                await self.store.delete(guild_id, member_id)
+
+    async def reset_guild(self, guild_id: int):
+        """
+        Drops a whole guild from the cache and deletes it from storage, after any write already running
+        """
+        async with self._lock:
+            self.discard_guild(guild_id)
+            self.counter.writes += 1
+            await self.config.clear_all_members(discord.Object(id=guild_id))
+            if self.store is not None:
+                await self.store.delete_guild(guild_id)
+
+    async def migrate(self) -> int:
+        """
+        Rewrites every member still stored in the legacy format and returns how many there were
+
+        Each guild is rewritten with a single ``write_guild``, which replaces every record as a whole, so the keys of
+        the legacy format are dropped with the same write.
+        """
+        legacy = set(self.legacy)
+        guilds = {}
+        for guild_id, member_id in legacy:
+            guilds.setdefault(guild_id, []).append(member_id)
+
+        for guild_id, member_ids in guilds.items():
+            await self.write_guild(guild_id, member_ids)
+
+        return len(legacy)
+
+    async def flush(self):
+        """
+        Writes every dirty member back to Config, with one write per guild like ``write_guild``, or to the store in a
+        single transaction
+
+        Only one flush runs at a time: a flush already running is waited for first, then whatever is still dirty is
+        written. The flush itself is shielded, so cancelling the caller, like unloading the cog does with the flush
+        loop, doesn't stop it halfway.
+        """
+        if self._flushing is not None:
+            await asyncio.wait([self._flushing])
+
+        if self._flushing is None:
+            self._flushing = asyncio.ensure_future(self._flush())
+        await asyncio.shield(self._flushing)
+
+    async def _flush(self):
+        # Swap the dirty set so changes made while flushing go to the next flush
+        dirty, self.dirty = self.dirty, set()
+        pending = set(dirty)
+
+        try:
+            if self.store is not None:
+                await self._flush_store(dirty)
+                pending.clear()
+                return
+
+            # Every write rewrites a whole blob with the JSON driver, so each guild is written once
+            guilds = {}
+            for guild_id, member_id in dirty:
+                guilds.setdefault(guild_id, set()).add(member_id)
+
+            for guild_id, member_ids in guilds.items():
+                written = {(guild_id, member_id) for member_id in member_ids}
+                try:
+                    await self.write_guild(guild_id, member_ids)
+                except Exception:
+                    log.exception("Failed to flush {} members of guild {}".format(len(member_ids), guild_id))
+                    self.dirty |= written
+                pending -= written
+
+            if dirty:
+                log.debug("Flushed {} members".format(len(dirty)))
+        finally:
+            # Members left unwritten by a cancelled flush go to the next one
+            self.dirty |= pending
+            self._flushing = None
+
+    async def _flush_store(self, dirty: set):
+        async with self._lock:
+            await self._write_store(dirty)
+
+    async def _write_store(self, dirty: set):
+        members = []
+        for guild_id, member_id in dirty:
+            entry = self.guilds.get(guild_id, {}).get(member_id)
+            if entry is not None and entry.tracked:
+                members.append((guild_id, member_id, entry.data))
+
+        try:
+            self.counter.writes += 1
+            await self.store.write(members)
+        except Exception:
+            log.exception("Failed to flush {} members to the store".format(len(members)))
+            self.dirty |= dirty
+            return
+
+        if dirty:
+            log.debug("Flushed {} members".format(len(dirty)))
+
+    async def switch(self, store) -> int:
+        """
+        Moves every member to a ``SqliteStore``, or back to Config with None, and returns how many were moved
+
+        Members stored but not cached are cached first, then the store is emptied, since rows of members reset while it
+        wasn't used would come back, and every cached member is written to the new storage, which every write goes to
+        from then on. Members stay where they were in the old storage.
+        """
+        await self.flush()
+
+        # Cache the members only the old storage has
+        if self.store is not None:
+            await self._load_store()
+        else:
+            self.counter.reads += 1
+            for guild_id, members in (await self.config.all_members()).items():
+                guild = self.guilds.setdefault(int(guild_id), {})
+                for member_id, stored in members.items():
+                    if int(member_id) not in guild:
+                        guild[int(member_id)] = self._entry(int(guild_id), int(member_id), stored)
+
+        if store is not None:
+            await store.clear()
+
+        # Writes made from here on go to the new storage after the copy
+        self.store = store
+        count = sum(1 for members in self.guilds.values() for entry in members.values() if entry.tracked)
+        for guild_id in list(self.guilds):
+            await self.write_guild(guild_id)
+        self.legacy.clear()
+
+        return count
+
+    async def close(self):
+        """
+        Writes every dirty member then closes the store
+        """
+        await self.flush()
+        if self.store is not None:
+            await self.store.close()
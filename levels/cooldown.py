@@ -0,0 +1,88 @@
+class CooldownTable:
+    """
+    Per-guild XP cooldowns kept in memory and keyed by member ID.
+
+    Expiry times come from a monotonic clock. Every entry is also filed in a hashed timing wheel under the tick it
+    expires on, so expired entries are evicted in bulk by walking the slots passed since the last sweep, and memory
+    stays proportional to the members who earned XP recently.
+    """
+
+    def __init__(self, tick: float = 1.0, slots: int = 64):
+        self.tick = tick
+        self.slots = [set() for _ in range(slots)]
+        self.guilds = {}
+        self.last_tick = None
+
+    def __len__(self):
+        return sum(len(members) for members in self.guilds.values())
+
+    def expiry(self, guild_id: int, member_id: int):
+        """
+        Returns when the member's cooldown ends or None if there's no entry
+        """
+        members = self.guilds.get(guild_id)
+        return members.get(member_id) if members else None
+
+    def is_cooling(self, guild_id: int, member_id: int, now: float) -> bool:
+        expires = self.expiry(guild_id, member_id)
+        return expires is not None and now < expires
+
+    def trigger(self, guild_id: int, member_id: int, cooldown: float, now: float):
+        """
+        Starts a member's cooldown
+        """
+        self.set_expiry(guild_id, member_id, now + cooldown)
+        self.sweep(now)
+
+    def set_expiry(self, guild_id: int, member_id: int, expires: float):
+        self.guilds.setdefault(guild_id, {})[member_id] = expires
+        self.slots[int(expires // self.tick) % len(self.slots)].add((guild_id, member_id))
+
+    def discard(self, guild_id: int, member_id: int):
+        """
+        Ends a member's cooldown, its wheel slot is cleaned up by the sweep
+        """
+        members = self.guilds.get(guild_id)
+        if members:
+            members.pop(member_id, None)
+
+    def discard_guild(self, guild_id: int):
+        self.guilds.pop(guild_id, None)
+
+    def sweep(self, now: float):
+        """
+        Evicts every entry expired since the last sweep
+        """
+        current_tick = int(now // self.tick)
+
+        # Start counting ticks from the first sweep
+        if self.last_tick is None:
+            self.last_tick = current_tick
+            return
+
+        # Walk each passed slot once, even if more than a full turn went by
+        first_tick = max(self.last_tick + 1, current_tick - len(self.slots) + 1)
+        for tick in range(first_tick, current_tick + 1):
+            slot = self.slots[tick % len(self.slots)]
+            kept = set()
+
+            for guild_id, member_id in slot:
+                members = self.guilds.get(guild_id)
+                expires = members.get(member_id) if members else None
+
+                # Entries filed in this slot by an older trigger are dropped from it
+                if expires is None or int(expires // self.tick) % len(self.slots) != tick % len(self.slots):
+                    continue
+
+                # Entries due on a later turn of the wheel stay
+                if expires > now:
+                    kept.add((guild_id, member_id))
+                    continue
+
+                del members[member_id]
+                if not members:
+                    del self.guilds[guild_id]
+
+            self.slots[tick % len(self.slots)] = kept
+
+        self.last_tick = current_tick
@@ -0,0 +1,107 @@
+import math
+from bisect import bisect_right
+from functools import lru_cache
+
+MAX_LEVEL = 1000
+MAX_GOAL = 10 ** 12
+
+POLYNOMIAL = "polynomial"
+EXPONENTIAL = "exponential"
+TABLE = "table"
+CURVE_TYPES = (POLYNOMIAL, EXPONENTIAL, TABLE)
+
+
+class LevelCurve:
+    """
+    A guild's XP curve compiled into lookup tables up to ``MAX_LEVEL``.
+
+    ``goals[level]`` is the XP needed to complete ``level``, ``cumulative[level]`` the XP needed to go from the start
+    of level 0 to the start of ``level`` and ``bonus[level]`` the extra XP per message given by the gain factor.
+    Goals and bonuses are read in O(1) and the level reached with a given amount of XP is found with one bisect.
+    """
+    __slots__ = ("goals", "cumulative", "bonus")
+
+    def __init__(self, goals: list, gain_factor: float):
+        self.goals = goals
+        self.cumulative = [0]
+        for goal in goals:
+            self.cumulative.append(self.cumulative[-1] + goal)
+        if not math.isfinite(gain_factor):
+            gain_factor = 0.0
+        self.bonus = [int(min(max(gain_factor * level, -MAX_GOAL), MAX_GOAL)) for level in range(MAX_LEVEL + 1)]
+
+    def goal(self, level: int) -> int:
+        return self.goals[min(level, MAX_LEVEL)]
+
+    def bonus_xp(self, level: int) -> int:
+        return self.bonus[min(level, MAX_LEVEL)]
+
+    def advance(self, level: int, exp: int):
+        """
+        Returns the level, left over XP and goal reached from the given state
+        """
+        # If goal isn't reached or there's no level left, nothing changes
+        if level >= MAX_LEVEL or exp < self.goals[level]:
+            return level, exp, self.goal(level)
+
+        # Place the member's total XP on the table
+        total = self.cumulative[level] + exp
+        level = min(bisect_right(self.cumulative, total) - 1, MAX_LEVEL)
+
+        return level, total - self.cumulative[level], self.goal(level)
+
+
+def _polynomial_goals(base: int, params: tuple):
+    """
+    base + params[0] * level + params[1] * level ** 2 + ...
+    """
+    for level in range(MAX_LEVEL + 1):
+        yield base + sum(coefficient * level ** (power + 1) for power, coefficient in enumerate(params))
+
+
+def _exponential_goals(base: int, params: tuple):
+    """
+    base * params[0] ** level
+    """
+    goal = float(base)
+    for level in range(MAX_LEVEL + 1):
+        yield goal
+        goal = min(goal * params[0], MAX_GOAL)
+
+
+def _table_goals(base: int, params: tuple):
+    """
+    base then the goals of levels 1, 2, ... as listed, growing by the last listed step afterwards
+    """
+    goals = (base,) + params
+    step = goals[-1] - goals[-2]
+    for level in range(MAX_LEVEL + 1):
+        if level < len(goals):
+            yield goals[level]
+        else:
+            yield goals[-1] + step * (level - len(goals) + 1)
+
+
+CURVE_GOALS = {
+    POLYNOMIAL: _polynomial_goals,
+    EXPONENTIAL: _exponential_goals,
+    TABLE: _table_goals
+}
+
+
+def _clamp_goal(goal: float) -> int:
+    """
+    Rounds a goal into 1..MAX_GOAL, infinities and NaN from huge parameters included
+    """
+    if math.isnan(goal):
+        return MAX_GOAL
+    return int(round(min(max(goal, 1), MAX_GOAL)))
+
+
+@lru_cache(maxsize=64)
+def compile_curve(base: int, kind: str, params: tuple, gain_factor: float) -> LevelCurve:
+    """
+    Compiles a curve definition, guilds with the same definition share the same tables
+    """
+    goals = [_clamp_goal(goal) for goal in CURVE_GOALS[kind](base, params)]
+    return LevelCurve(goals, gain_factor)
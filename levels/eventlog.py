@@ -0,0 +1,237 @@
+"""
+Append-only log of member record changes, with snapshots and replay.
+
+Every change is one fixed-size binary event holding the member's record after it, so replaying events in order
+rebuilds the state at any moment and replaying one twice changes nothing. Events are packed into an in-memory buffer
+and written in batches by ``flush``, with a single fsync per batch, to numbered segment files that are rotated by size.
+A snapshot holds every record at a point of the log, so a replay starts from the latest snapshot before the moment it
+rebuilds and segments from before the retained period can be deleted. The first snapshot is taken when the log
+starts, members stored before then aren't in any event.
+"""
+import os
+import struct
+from pathlib import Path
+
+from . import record
+
+MESSAGE = 1
+GIVE = 2
+SET_LEVEL = 3
+RESET = 4
+GUILD_RESET = 5
+RECOMPUTE = 6
+IMPORT = 7
+REPAIR = 8
+REWIND = 9
+KIND_NAMES = {MESSAGE: "message", GIVE: "givexp", SET_LEVEL: "setlevel", RESET: "reset", GUILD_RESET: "guild reset",
+              RECOMPUTE: "recompute", IMPORT: "import", REPAIR: "repair", REWIND: "rewind"}
+
+# Time, kind, guild ID, member ID, level, exp, message count, message with xp and the XP change of the event
+EVENT = struct.Struct("<dBQQqqqqq")
+
+# Magic, version, time, segment and offset the snapshot was taken at, then guild ID, member ID and record per member
+MAGIC = b"LVLP"
+VERSION = 1
+SNAPSHOT_HEADER = struct.Struct("<4sBdIQ")
+SNAPSHOT_RECORD = struct.Struct("<QQqqqq")
+
+SEGMENT_SUFFIX = ".log"
+SNAPSHOT_SUFFIX = ".snap"
+
+
+class ReplayError(Exception):
+    pass
+
+
+class EventLog:
+    """
+    Buffered writer of the event log in ``folder``.
+
+    ``append`` only packs the event in memory. ``flush`` is meant to run in a thread and writes the buffer to the
+    current segment, starting a new one past ``segment_size`` bytes. Each run starts a new segment so an event cut
+    short by a crash is never followed by others in the same file. Past ``max_buffer`` bytes waiting, for instance when
+    the disk is full, new events are dropped and counted.
+    """
+
+    def __init__(self, segment_size: int = 16 * 1024 * 1024, max_buffer: int = 16 * 1024 * 1024):
+        self.folder = None
+        self.segment_size = segment_size
+        self.max_buffer = max_buffer
+        self.buffer = bytearray()
+        self.segment = 0
+        self.offset = 0
+        self.dropped = 0
+
+    def open(self, folder: Path):
+        self.folder = folder
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self.segment = max(segment_numbers(folder), default=0) + 1
+        self.offset = 0
+
+    def append(self, kind: int, guild_id: int, member_id: int, data: dict = None, delta: int = 0, now: float = 0.0):
+        """
+        Packs an event with the member's record after it, None for members whose record was removed
+        """
+        if len(self.buffer) >= self.max_buffer:
+            self.dropped += 1
+            return
+
+        if data is None:
+            self.buffer += EVENT.pack(now, kind, guild_id, member_id, 0, 0, 0, 0, delta)
+        else:
+            self.buffer += EVENT.pack(now, kind, guild_id, member_id, data[record.LEVEL], data[record.EXP],
+                                      data[record.MESSAGE_COUNT], data[record.MESSAGE_WITH_XP], delta)
+
+    def take(self) -> bytes:
+        """
+        Empties the buffer and returns what it held, for a flush in another thread
+        """
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+    def flush(self, data: bytes):
+        """
+        Writes taken events to the current segment then syncs it to disk once
+        """
+        if not data or self.folder is None:
+            return
+
+        if self.offset and self.offset + len(data) > self.segment_size:
+            self.segment += 1
+            self.offset = 0
+
+        with open(segment_path(self.folder, self.segment), "ab") as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        self.offset += len(data)
+
+    def snapshot(self, now: float, records) -> Path:
+        """
+        Writes records copied after the last flush as a snapshot of the log's current position
+
+        Records are ``(guild_id, member_id, level, exp, message_count, message_with_xp)`` tuples and now is when the
+        copy ended. Records changed while it was copied are fine: their events come after the position and replaying
+        them gives the same record.
+        """
+        path = self.folder / "{:015.3f}{}".format(now, SNAPSHOT_SUFFIX)
+        temporary = path.with_suffix(".tmp")
+
+        with open(temporary, "wb") as file:
+            file.write(SNAPSHOT_HEADER.pack(MAGIC, VERSION, now, self.segment, self.offset))
+            for guild_id, member_id, level, exp, message_count, message_with_xp in records:
+                file.write(SNAPSHOT_RECORD.pack(guild_id, member_id, level, exp, message_count, message_with_xp))
+            file.flush()
+            os.fsync(file.fileno())
+
+        temporary.replace(path)
+        return path
+
+    def compact(self, now: float, retention: float):
+        """
+        Deletes the snapshots and segments no longer needed to replay any moment of the last retention seconds
+
+        Snapshots taken in that period are kept with the latest one before it, which a replay of its start begins
+        from, however many snapshots restarts took meanwhile. Segments are deleted if they only hold events from before
+        the oldest kept snapshot.
+        """
+        snapshots = [(read_snapshot_header(path)[0], path) for path in self.folder.glob("*" + SNAPSHOT_SUFFIX)]
+        snapshots.sort()
+        older = [path for taken, path in snapshots if taken < now - retention]
+        if len(older) <= 1:
+            return 0
+
+        for path in older[:-1]:
+            path.unlink()
+
+        _, segment, _ = read_snapshot_header(older[-1])
+        removed = 0
+        for number in segment_numbers(self.folder):
+            if number < segment:
+                segment_path(self.folder, number).unlink()
+                removed += 1
+
+        return removed
+
+
+def segment_path(folder: Path, number: int) -> Path:
+    return folder / "{:08d}{}".format(number, SEGMENT_SUFFIX)
+
+
+def segment_numbers(folder: Path) -> list:
+    return sorted(int(path.stem) for path in folder.glob("*" + SEGMENT_SUFFIX) if path.stem.isdigit())
+
+
+def read_snapshot_header(path: Path):
+    with open(path, "rb") as file:
+        magic, version, taken, segment, offset = SNAPSHOT_HEADER.unpack(file.read(SNAPSHOT_HEADER.size))
+
+    if magic != MAGIC or version != VERSION:
+        raise ReplayError("{} isn't a levels snapshot".format(path.name))
+    return taken, segment, offset
+
+
+def _fields(level: int, exp: int, message_count: int, message_with_xp: int, last_trigger: int = 0) -> dict:
+    return {record.EXP: exp, record.LEVEL: level, record.LAST_TRIGGER: last_trigger,
+            record.MESSAGE_COUNT: message_count, record.MESSAGE_WITH_XP: message_with_xp}
+
+
+def replay(folder: Path, guild_id: int, until: float, chunk_size: int = 4096) -> dict:
+    """
+    Rebuilds the records of a guild's members at a moment, keyed by member ID
+
+    Starts from the latest snapshot taken at or before until then applies the guild's events up to until. Only the
+    guild's records and a chunk of events are in memory at once.
+    """
+    members = {}
+
+    # Find where to start
+    snapshots = []
+    for path in sorted(folder.glob("*" + SNAPSHOT_SUFFIX)):
+        taken, segment, offset = read_snapshot_header(path)
+        if taken <= until:
+            snapshots.append((path, segment, offset))
+
+    # Members stored before the log started are only in snapshots
+    if not snapshots:
+        raise ReplayError("The log doesn't go back that far")
+
+    path, start_segment, start_offset = snapshots[-1]
+    with open(path, "rb") as file:
+        file.seek(SNAPSHOT_HEADER.size)
+        while True:
+            chunk = file.read(SNAPSHOT_RECORD.size * chunk_size)
+            for record_guild, member_id, level, exp, message_count, message_with_xp in \
+                    SNAPSHOT_RECORD.iter_unpack(chunk[:len(chunk) - len(chunk) % SNAPSHOT_RECORD.size]):
+                if record_guild == guild_id:
+                    members[member_id] = _fields(level, exp, message_count, message_with_xp)
+            if len(chunk) < SNAPSHOT_RECORD.size * chunk_size:
+                break
+
+    # Apply the guild's events in order
+    for number in [number for number in segment_numbers(folder) if number >= start_segment]:
+        with open(segment_path(folder, number), "rb") as file:
+            if number == start_segment:
+                file.seek(start_offset)
+
+            while True:
+                chunk = file.read(EVENT.size * chunk_size)
+                usable = len(chunk) - len(chunk) % EVENT.size
+                for event in EVENT.iter_unpack(chunk[:usable]):
+                    when, kind, event_guild, member_id, level, exp, message_count, message_with_xp, _ = event
+                    if event_guild != guild_id or when > until:
+                        continue
+
+                    if kind == GUILD_RESET:
+                        members.clear()
+                    elif kind == RESET:
+                        members.pop(member_id, None)
+                    else:
+                        members[member_id] = _fields(level, exp, message_count, message_with_xp, int(when))
+
+                # A short read is the end of the segment, a partial event at the end was cut short by a crash
+                if len(chunk) < EVENT.size * chunk_size:
+                    break
+
+    return members
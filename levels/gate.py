@@ -0,0 +1,55 @@
+import re
+
+
+class MessageGate:
+    """
+    In-memory filter deciding which messages can earn XP.
+
+    It holds the bot's prefixes compiled into one anchored pattern, the IDs of ignored channels and the IDs of guilds
+    where XP tracking is off, so messages can be rejected without touching Config. Channel IDs are unique across
+    guilds, so a single set covers every guild.
+    """
+    __slots__ = ("prefix_pattern", "ignored_channels", "inactive_guilds")
+
+    def __init__(self):
+        self.prefix_pattern = None
+        self.ignored_channels = set()
+        self.inactive_guilds = set()
+
+    def compile_prefixes(self, prefixes):
+        """
+        Compiles the prefixes into a single pattern matching at the start of a message
+        """
+        # Longest first so a prefix is never shadowed by a shorter one it starts with
+        prefixes = sorted(set(prefixes), key=len, reverse=True)
+        self.prefix_pattern = re.compile("|".join(map(re.escape, prefixes))) if prefixes else None
+
+    def set_ignored(self, channel_id: int, ignored: bool):
+        if ignored:
+            self.ignored_channels.add(channel_id)
+        else:
+            self.ignored_channels.discard(channel_id)
+
+    def set_active(self, guild_id: int, active: bool):
+        if active:
+            self.inactive_guilds.discard(guild_id)
+        else:
+            self.inactive_guilds.add(guild_id)
+
+    def is_command(self, content: str) -> bool:
+        return self.prefix_pattern is not None and self.prefix_pattern.match(content) is not None
+
+    def accepts(self, message) -> bool:
+        """
+        Checks if a message can earn XP
+        """
+        # If bot or private
+        if message.author.bot or message.guild is None:
+            return False
+
+        # If XP tracking is off or channel is ignored
+        if message.guild.id in self.inactive_guilds or message.channel.id in self.ignored_channels:
+            return False
+
+        # If message starts by prefix (to ignore red command)
+        return not self.is_command(message.content)
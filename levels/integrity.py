@@ -0,0 +1,102 @@
+"""
+Integrity checks of member records.
+
+``check`` classifies what's wrong with a single record against the guild's curve and ``repair`` returns the fixed
+fields, so a sweep can walk a guild a chunk at a time and write every fix of the sweep in one batch. Anomalies the cog
+finds outside the record, a stale leaderboard entry, a legacy stored format or autoroles that don't match the level,
+are counted on the same report.
+"""
+from .curve import MAX_LEVEL
+from . import record
+
+LEVEL_RANGE = "level_range"
+NEGATIVE = "negative"
+COUNTS = "counts"
+OVER_GOAL = "over_goal"
+RANK = "rank"
+LEGACY = "legacy"
+ROLE = "role"
+KINDS = (LEVEL_RANGE, NEGATIVE, COUNTS, OVER_GOAL, RANK, LEGACY, ROLE)
+
+LABELS = {
+    LEVEL_RANGE: "level below 0 or past {}".format(MAX_LEVEL),
+    NEGATIVE: "negative XP or message counts",
+    COUNTS: "more messages with XP than messages",
+    OVER_GOAL: "XP past the goal of their level",
+    RANK: "leaderboard entry out of date",
+    LEGACY: "stored in the legacy format",
+    ROLE: "level role doesn't match their level"
+}
+
+# Member IDs kept per anomaly for the report
+SAMPLES = 5
+
+
+def check(data: dict, curve) -> list:
+    """
+    Returns the anomalies of a record
+    """
+    kinds = []
+    level = data[record.LEVEL]
+
+    if not 0 <= level <= MAX_LEVEL:
+        kinds.append(LEVEL_RANGE)
+    if min(data[record.EXP], data[record.MESSAGE_COUNT], data[record.MESSAGE_WITH_XP]) < 0:
+        kinds.append(NEGATIVE)
+    if data[record.MESSAGE_WITH_XP] > data[record.MESSAGE_COUNT]:
+        kinds.append(COUNTS)
+    if 0 <= level < MAX_LEVEL and data[record.EXP] >= curve.goal(level):
+        kinds.append(OVER_GOAL)
+
+    return kinds
+
+
+def repair(data: dict, curve) -> dict:
+    """
+    Returns the fields of a record with every anomaly ``check`` finds fixed
+
+    Levels are clamped, negative values set to 0, message counts raised to the messages with XP and XP past the goal
+    levels the member up like ``LevelCurve.advance``, without touching roles.
+    """
+    level = min(max(data[record.LEVEL], 0), MAX_LEVEL)
+    exp = max(data[record.EXP], 0)
+    message_with_xp = max(data[record.MESSAGE_WITH_XP], 0)
+    level, exp, _ = curve.advance(level, exp)
+
+    return {record.LEVEL: level, record.EXP: exp, record.MESSAGE_WITH_XP: message_with_xp,
+            record.MESSAGE_COUNT: max(data[record.MESSAGE_COUNT], message_with_xp)}
+
+
+class IntegrityReport:
+    """
+    Counts of the anomalies found by a sweep, with a few member IDs of each
+    """
+
+    def __init__(self, guild_id: int):
+        self.guild_id = guild_id
+        self.scanned = 0
+        self.found = dict.fromkeys(KINDS, 0)
+        self.samples = {kind: [] for kind in KINDS}
+        self.repaired = 0
+        self.elapsed = 0.0
+
+    def add(self, member_id: int, kinds):
+        for kind in kinds:
+            self.found[kind] += 1
+            if len(self.samples[kind]) < SAMPLES:
+                self.samples[kind].append(member_id)
+
+    @property
+    def anomalies(self) -> int:
+        return sum(self.found.values())
+
+    def format(self) -> str:
+        lines = ["{} members checked in {:.1f}s, {} anomalies found, {} members repaired".format(
+            self.scanned, self.elapsed, self.anomalies, self.repaired)]
+
+        for kind in KINDS:
+            if self.found[kind]:
+                lines.append("{:>8} {} (e.g. {})".format(self.found[kind], LABELS[kind],
+                                                        ", ".join(str(member_id) for member_id in self.samples[kind])))
+
+        return "\n".join(lines)
@@ -3,9 +3,21 @@ from redbot.core.bot import Red
 from redbot.core.commands import Context
 from random import randint
 from datetime import datetime
+import asyncio
 import discord
 import time
 import logging
+from . import record, windows
+from .actors import DROP_NEWEST, GuildActors
+from .announce import AnnouncementDispatcher
+from .cache import MemberCache
+from .cooldown import CooldownTable
+from .curve import POLYNOMIAL
+from .eventlog import EventLog
+from .gate import MessageGate
+from .pages import browse, clamp_page_size
+from .perf import PerfMonitor
+from .storage import CONFIG
 from .lvladmin import Lvladmin
 from .x import X
 
@@ -33,6 +45,9 @@ class Levels(BaseCog, Lvladmin, X):
     # Constants for data access
     XP_GOAL_BASE = "xp_goal_base"
     XP_GAIN_FACTOR = "xp_gain_factor"
+    XP_CURVE = "xp_curve"
+    CURVE_TYPE = "type"
+    CURVE_PARAMS = "params"
     XP_MIN = "xp_min"
     XP_MAX = "xp_max"
     COOLDOWN = "cooldown"
@@ -49,13 +64,9 @@ class Levels(BaseCog, Lvladmin, X):
     DEFAULT_ROLE = "No level roles"
 
     MEMBER_DATA = "member_data"
-    MEMBER_ID = "member_id"
-    DEFAULT_ID = "000000000000000000"
-    USERNAME = "username"
-    DEFAULT_USERNAME = "unknown"
+    RECORD = "record"
     EXP = "exp"
     LEVEL = "level"
-    GOAL = "goal"
     LAST_TRIGGER = "last_trigger"
     MESSAGE_COUNT = "message_count"
     MESSAGE_WITH_XP = "message_with_xp"
@@ -65,13 +76,45 @@ class Levels(BaseCog, Lvladmin, X):
     IGNORED_CHANNEL = "ignored_channel"
 
     GUILD_CONFIG = "guild_config"
+    SETTINGS = "settings"
     MEMBER = "member"
 
+    FLUSH_INTERVAL = "flush_interval"
+    QUEUE_POLICY = "queue_policy"
+    QUEUE_SIZE = "queue_size"
+    OFFLOAD_THRESHOLD = "offload_threshold"
+    CHECK_INTERVAL = "check_interval"
+    STORAGE = "storage"
+    SNAPSHOT_CHUNK = 10000
+
+    WINDOWS_FILE = "windows.bin"
+    WINDOWS_SAVE_INTERVAL = 3600
+
+    EVENTS_FOLDER = "events"
+    EVENTS_SNAPSHOT_INTERVAL = 86400
+    EVENTS_RETENTION = 7 * 86400
+
+    SQLITE_FILE = "members.sqlite3"
+
     def __init__(self, bot: Red):
+        self.bot = bot
         self.config = Config.get_conf(self, 4712468135468475)
+        default_global = {
+            self.FLUSH_INTERVAL: 30,
+            self.QUEUE_POLICY: DROP_NEWEST,
+            self.QUEUE_SIZE: 1000,
+            self.OFFLOAD_THRESHOLD: 5000,
+            self.CHECK_INTERVAL: 24,
+            self.STORAGE: CONFIG
+        }
+
         default_guild = {
             self.XP_GOAL_BASE: 100,
             self.XP_GAIN_FACTOR: 0.1,
+            self.XP_CURVE: {
+                self.CURVE_TYPE: POLYNOMIAL,
+                self.CURVE_PARAMS: [50, 5]
+            },
             self.XP_MIN: 15,
             self.XP_MAX: 25,
             self.COOLDOWN: 60,
@@ -88,22 +131,83 @@ class Levels(BaseCog, Lvladmin, X):
             self.IGNORED_CHANNEL: False
         }
 
+        # Members are stored as compact versioned records, see record.py
         default_member = {
-            self.MEMBER_ID: self.DEFAULT_ID,
-            self.USERNAME: self.DEFAULT_USERNAME,
-            self.ROLE_NAME: self.DEFAULT_ROLE,
-            self.EXP: 0,
-            self.LEVEL: 0,
-            self.GOAL: 100,
-            self.LAST_TRIGGER: 0,
-            self.MESSAGE_COUNT: 0,
-            self.MESSAGE_WITH_XP: 0
+            self.RECORD: None
         }
 
+        self.config.register_global(**default_global, force_registration=True)
         self.config.register_guild(**default_guild, force_registration=True)
         self.config.register_channel(**default_channel, force_registration=True)
         self.config.register_member(**default_member, force_registration=True)
 
+        # Stage latencies and Config calls of the XP pipeline, off until enabled
+        self._perf = PerfMonitor()
+
+        # Member data is served from memory and written back by the flush loop
+        self._members = MemberCache(self.config, self._perf)
+
+        # XP cooldowns by guild and member on the monotonic clock
+        self._cooldowns = CooldownTable()
+
+        # Guild settings snapshots, dropped by the admin setters
+        self._settings = {}
+
+        # Per-guild leaderboards ordered by level and XP, members moved while one is rebuilt and the latest rebuild
+        self._ranks = {}
+        self._rank_changes = {}
+        self._rank_generations = {}
+
+        # Rendered leaderboard pages per guild, dropped page by page as ranks change
+        self._pages = {}
+
+        # Rolling 24 hour, 7 day and 30 day XP per guild, saved to the data folder
+        self._windows = {}
+        self._windows_saved = time.monotonic()
+
+        # Every change of a member record, buffered then written to the data folder by the flush loop
+        self._events = EventLog()
+        self._events_snapshot = time.monotonic()
+
+        # When the member data of every guild was last checked for anomalies
+        self._checked = time.monotonic()
+
+        # Member count from which sorting and reports run in an executor
+        self._offload_threshold = 5000
+
+        # Per-guild autoroles by level, dropped when roles change
+        self._role_maps = {}
+
+        # Role syncs running per guild and removed autoroles they should take away
+        self._role_syncs = {}
+        self._stale_roles = {}
+
+        # Level up announcements merged and sent in the background
+        self._announcer = AnnouncementDispatcher()
+
+        # Valid messages are handled by one worker per shard of each guild's members
+        self._actors = GuildActors(self._handle_message)
+
+        # Prefixes, ignored channels and inactive guilds checked before any message is processed
+        self._gate = MessageGate()
+
+        # Set once members are loaded and ranked
+        self._ready = asyncio.Event()
+
+        # Loads all of the above then writes member data back periodically
+        self._flush_task = self.bot.loop.create_task(self._flush_loop())
+
+    def cog_unload(self):
+        # Stop the timer, workers and senders then write whatever is still pending
+        self._flush_task.cancel()
+        self._actors.close()
+        self._announcer.close()
+        self.bot.loop.create_task(self._members.close())
+        self._save_windows(windows.dump_all(self._windows))
+        self._write_events(self._events.take())
+
+    __unload = cog_unload
+
     @commands.guild_only()
     @commands.command(name="level", aliases=["lvl"])
     async def level_check(self, ctx: Context, member: discord.Member = None):
@@ -122,28 +226,33 @@ class Levels(BaseCog, Lvladmin, X):
             await ctx.send("Bots can't play levels =(")
             return
 
-        # Get guild then get guild config then get member_data based on that
-        guild = ctx.guild
-        guild_config = self.config.guild(guild)
-        member_data = await self._get_member_data(guild_config=guild_config, member=member)
+        # Get member data, members who never chatted are shown at level 0 without creating a record for them
+        member_data = await self._members.get(ctx.guild.id, member.id)
+        data = member_data.data if member_data.tracked else record.new()
 
         # Build Embed and show it
-        embed = await self._level_embed(ctx, member, member_data)
+        embed = await self._level_embed(ctx, member, data)
         await ctx.send(embed=embed)
 
-    async def _level_embed(self, ctx: Context, member: discord.Member, member_data):
+    async def _level_embed(self, ctx: Context, member: discord.Member, data: dict):
         """
         Internal method to format the level card embed
         """
-        # Get member information
-        current_lvl = await member_data.get_raw(self.LEVEL)
-        current_exp = await member_data.get_raw(self.EXP)
-        next_goal = await member_data.get_raw(self.GOAL)
-        level_role = await member_data.get_raw(self.ROLE_NAME)
-        username = await member_data.get_raw(self.USERNAME)
+        # Get member information, goal and role are derived from the level
+        settings = await self._get_settings(ctx.guild)
+        role_map = await self._get_role_map(ctx.guild)
+        current_lvl = data[self.LEVEL]
+        current_exp = data[self.EXP]
+        next_goal = settings.curve.goal(current_lvl)
+        level_role = role_map.name(current_lvl, self.DEFAULT_ROLE)
+
+        # Get rank from the guild's leaderboard once every stored member is indexed
+        await self._ready.wait()
+        leaderboard = self._get_leaderboard(ctx.guild.id)
+        rank = leaderboard.rank(member.id)
 
         # Build Embed based on information just queried
-        embed = discord.Embed(title=username, color=member.color)
+        embed = discord.Embed(title=member.display_name, color=member.color)
 
         # If highest level is not @everyone then show it
         if member.top_role.name != "@everyone":
@@ -154,48 +263,64 @@ class Levels(BaseCog, Lvladmin, X):
         embed.add_field(name="Level", value=current_lvl, inline=True)
         embed.add_field(name="Role", value=level_role, inline=True)
         embed.add_field(name="Current XP", value="{} / {}".format(current_exp, next_goal), inline=True)
+
+        # If member is ranked then show it
+        if rank is not None:
+            embed.add_field(name="Rank", value="#{} of {}".format(rank, len(leaderboard)), inline=True)
+
         embed.timestamp = datetime.utcnow()
 
         return embed
 
+    @commands.guild_only()
     @commands.command(name="levelboard", aliases=["lb", "lvlboard"])
-    async def leaderboard(self, ctx: Context):
+    async def leaderboard(self, ctx: Context, page: int = 1):
         """
-        Display a leaderboard of the top 20 members in the guild
+        Display the guild's leaderboard, 20 members per page
+
+        React with the arrows to turn pages or give the page to start from.
         """
-        # Get members data and leaderboard configuration
-        guild_config = await self._get_guild_config(ctx.guild)
-        leaderboard_max = await guild_config.get_raw(self.LEADERBOARD_MAX)
-        guild_members = await self._get_members(ctx.guild)
-        all_members = guild_members.values()
+        # Get leaderboard configuration
+        settings = await self._get_settings(ctx.guild)
+        page_size = clamp_page_size(settings.leaderboard_max)
+
+        # Wait for the bulk load so the leaderboard holds every stored member
+        await self._ready.wait()
 
         # If no members then don't show it
-        if len(all_members) == 0:
+        if len(self._get_leaderboard(ctx.guild.id)) == 0:
             await ctx.send("No member activity registered.")
             return
 
-        # Sort members by level and XP
-        all_members = sorted(all_members, key=lambda u: (u[self.LEVEL], u[self.EXP]), reverse=True)
-        top_member = discord.utils.find(lambda m: str(m.id) == all_members[0][self.MEMBER_ID], ctx.guild.members)
+        # Pages only show ranks and levels, so they're reused until those change
+        render, pages = self._leaderboard_menu(ctx.guild, "#{number} <@!{ID}> - Level : {LVL}", page_size,
+                                               cached=True)
+        await browse(ctx, render, pages, page - 1)
 
-        # Set variable to be appended to
-        member_list = ""
+    @commands.guild_only()
+    @commands.command(name="activeboard", aliases=["ab"])
+    async def active_leaderboard(self, ctx: Context, window: str = windows.WEEK, page: int = 1):
+        """
+        Display who gained the most XP recently, 20 members per page
 
-        # Start building Embed
-        embed = discord.Embed()
-        embed.set_author(name=ctx.guild.name + " Leaderboard")
-        embed.set_thumbnail(url=ctx.guild.icon_url)
-        embed.timestamp = datetime.utcnow()
+        window: day for the last 24 hours, week for the last 7 days or month for the last 30 days
+        """
+        # Checks window
+        window = window.lower()
+        if window not in windows.WINDOWS:
+            await ctx.send("The window must be one of: {}".format(", ".join(windows.WINDOWS)))
+            return
 
-        # Loop to create member_list
-        for i in range(0, len(all_members[:leaderboard_max])):
-            member = all_members[i]
-            member_list += "\n#{number} <@!{ID}> - Level : {LVL}".format(number=i+1, ID=member[self.MEMBER_ID], LVL=member[self.LEVEL])
+        # Get leaderboard configuration
+        settings = await self._get_settings(ctx.guild)
+        page_size = clamp_page_size(settings.leaderboard_max)
 
-        # Try to set and send embed and tell user if it excepts
-        try:
-            embed.description = member_list
-            await ctx.send(embed=embed)
-        except discord.errors.HTTPException:
-            await ctx.send("The list is too long. Please set a lower limit with `!la config set leaderboard_max`")
+        # If nobody gained XP in the window then don't show it
+        await self._ready.wait()
+        if self._get_windows(ctx.guild.id).count(window) == 0:
+            await ctx.send("No XP gained in the last {}.".format(windows.LABELS[window]))
+            return
 
+        render, pages = self._leaderboard_menu(ctx.guild, "#{number} <@!{ID}> - XP : {GAINED}", page_size,
+                                               window=window)
+        await browse(ctx, render, pages, page - 1)
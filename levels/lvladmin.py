@@ -1,11 +1,23 @@
 from redbot.core import commands, Config, checks
 from redbot.core.bot import Red
 from redbot.core.commands import Context
+from redbot.core.data_manager import cog_data_path
 from random import randint
-from datetime import datetime
+from datetime import datetime, timezone
+import asyncio
 import discord
+import functools
+import math
 import time
+from pathlib import Path
 import logging
+from . import analytics, eventlog, simulate, transfer
+from .actors import POLICIES
+from .curve import CURVE_TYPES, EXPONENTIAL, MAX_GOAL, MAX_LEVEL, POLYNOMIAL, TABLE
+from .pages import MAX_PAGE_SIZE, browse, clamp_page_size
+from .reconcile import RoleReconciler
+from .settings import GuildSettings
+from .storage import BACKENDS
 
 log = logging.getLogger("lvladmin")  # Thanks to Sinbad for the example code for logging
 log.setLevel(logging.DEBUG)
@@ -100,7 +112,9 @@ class Lvladmin:
 
         # Set it and send message to notify of success
         await guild_config.set_raw(self.GUILD_ROLES, value=guild_roles)
-        await ctx.send("{0} will be automatically earned at level {1}".format(new_role.name, level))
+        self._invalidate_role_map(ctx.guild)
+        await ctx.send("{0} will be automatically earned at level {1}. Use `!la guild roles sync` to update existing "
+                       "members".format(new_role.name, level))
 
     @roles.command(name="remove", aliases=["rm"])
     async def roles_remove(self, ctx: Context, old_role: discord.Role):
@@ -121,11 +135,80 @@ class Lvladmin:
             if role_id == role[self.ROLE_ID]:
                 guild_roles.remove(role)
                 await guild_config.set_raw(self.GUILD_ROLES, value=guild_roles)
-                await ctx.send("The role {} has been removed".format(role[self.ROLE_NAME]))
+                self._invalidate_role_map(ctx.guild)
+
+                # Remember it so the next sync takes it away from members
+                self._stale_roles.setdefault(ctx.guild.id, set()).add(old_role.id)
+                await ctx.send("The role {} has been removed. Use `!la guild roles sync` to take it away from "
+                               "members".format(role[self.ROLE_NAME]))
                 return
 
         await ctx.send("Role not found in database")
 
+    @roles.command(name="sync")
+    async def roles_sync(self, ctx: Context, dry_run: bool = False):
+        """
+        Gives every member the level role matching their level
+
+        Roles of removed autoroles are taken away too. Role edits are spread out to respect Discord's rate limits and
+        progress is shown while it runs.
+
+        dry_run: if true, only tells how many members would be updated
+        """
+        # Checks if a sync is already running
+        if ctx.guild.id in self._role_syncs:
+            await ctx.send("A role sync is already running in this guild")
+            return
+
+        # Get role map and stored levels
+        await self._ready.wait()
+        role_map = await self._get_role_map(ctx.guild)
+        levels = {member_id: member_data.data[self.LEVEL]
+                  for member_id, member_data in self._members.members(ctx.guild.id).items()
+                  if member_data.tracked}
+        stale_roles = self._stale_roles.get(ctx.guild.id, set())
+
+        # Plan the changes
+        reconciler = RoleReconciler(ctx.guild, role_map, levels, stale_role_ids=stale_roles, dry_run=dry_run)
+
+        # If nothing to do, say it
+        if reconciler.total == 0:
+            self._stale_roles.pop(ctx.guild.id, None)
+            await ctx.send("Every member already has the right level role")
+            return
+
+        # If dry run, only tell what would change
+        if dry_run:
+            await ctx.send("{} members would be updated: {} would get a role and {} would lose one. This would take about "
+                           "{} seconds".format(reconciler.total, reconciler.added, reconciler.removed,
+                                               int(reconciler.eta())))
+            return
+
+        # Run it in the background and report progress until it's done
+        status = await ctx.send("Syncing level roles: " + reconciler.progress())
+        task = self._role_syncs[ctx.guild.id] = asyncio.ensure_future(self._run_role_sync(ctx.guild, reconciler))
+
+        while not task.done():
+            await asyncio.wait([task], timeout=5)
+            await status.edit(content="Syncing level roles: " + reconciler.progress())
+        task.result()
+
+        # Removed roles are gone from every member that could be edited
+        if not reconciler.failed:
+            self._stale_roles.pop(ctx.guild.id, None)
+
+        await status.edit(content="Level roles synced: {} members updated, {} failed".format(reconciler.done,
+                                                                                           len(reconciler.failed)))
+
+    async def _run_role_sync(self, guild: discord.Guild, reconciler: RoleReconciler):
+        """
+        Runs a role sync then lets the guild start another one, however it ended
+        """
+        try:
+            await reconciler.run()
+        finally:
+            self._role_syncs.pop(guild.id, None)
+
     @guild.command(name="reset")
     async def guild_reset(self, ctx: Context):
         """
@@ -133,52 +216,211 @@ class Lvladmin:
 
         This doesn't ask for confirmation and deletes the whole player database
         """
-        # Clear every user in guild
-        await self.config.clear_all_members(ctx.guild)
+        # Clear every user in guild, cached and ranked ones included
+        await self._members.reset_guild(ctx.guild.id)
+        self._drop_ranks(ctx.guild.id)
+        self._windows.pop(ctx.guild.id, None)
+        self._cooldowns.discard_guild(ctx.guild.id)
+        self._events.append(eventlog.GUILD_RESET, ctx.guild.id, 0, now=time.time())
         await ctx.send("The guild's data has been wiped.")
 
+    @guild.command(name="check")
+    async def guild_check(self, ctx: Context, repair: bool = False):
+        """
+        Looks for anomalies in the guild's member data
+
+        Records are checked for levels off the curve, XP past their goal, bad message counts, stale leaderboard entries
+        and the legacy format. The bot does this with repair for every guild on its own, see `!la config set check`.
+
+        repair: if true, fixes the records too, level roles are fixed by `!la guild roles sync`
+        """
+        async with ctx.typing():
+            report = await self._check_guild(ctx.guild, repair=repair)
+
+        await ctx.send("```\n{}\n```".format(report.format()))
+
+    @guild.command(name="distribution", aliases=["dist"])
+    async def guild_distribution(self, ctx: Context):
+        """
+        Shows how members are spread across levels
+
+        Large guilds are counted in a thread, see `!la config set offload`.
+        """
+        # Snapshot member data then build the report
+        await self._ready.wait()
+        members = await self._snapshot(ctx.guild.id, self.LEVEL, self.EXP, self.MESSAGE_COUNT, self.MESSAGE_WITH_XP)
+        report = await self._offload(len(members), analytics.level_distribution, members)
+        await ctx.send("```\n{}\n```".format(report))
+
+    @guild.command(name="recompute")
+    async def guild_recompute(self, ctx: Context):
+        """
+        Moves members whose XP is past their level's goal to the level it reaches
+
+        Changing the goal or the curve does this on its own, members keep their total XP and only their level follows.
+        """
+        settings = await self._get_settings(ctx.guild)
+        await self._send_relevel(ctx, settings, "Levels recomputed")
+
+    async def _send_relevel(self, ctx: Context, old_settings, message: str):
+        """
+        Moves the guild's members from the curve of the old settings to the configured one then reports it after message
+
+        Messages keep using the old settings until every member is moved, so callers change Config without
+        invalidating them.
+        """
+        async with ctx.typing():
+            moved = await self._recompute_levels(ctx.guild, old_settings)
+
+        if moved:
+            message += ", {} members changed level. Run `!la guild roles sync` to update their roles.".format(moved)
+        else:
+            message += ", no member changed level."
+        await ctx.send(message)
+
+    @guild.command(name="rewind")
+    async def guild_rewind(self, ctx: Context, when: str, apply: bool = False):
+        """
+        Shows or restores the guild's levels as they were at a moment
+
+        Records are rebuilt from the XP event log in the cog's data folder, which can go back a week. Members
+        without data then are kept and the 24 hour, 7 day and 30 day leaderboards don't change.
+
+        when: a UTC date and time like `2019-05-01T18:30`, `2019-05-01` for midnight or a Unix timestamp
+
+        apply: if true, restores the members whose data changed since, else only counts them
+        """
+        # Get the moment
+        until = None
+        for fmt in ("%Y-%m-%dT%H:%M", "%Y-%m-%d %H:%M", "%Y-%m-%d"):
+            try:
+                until = datetime.strptime(when, fmt).replace(tzinfo=timezone.utc).timestamp()
+                break
+            except ValueError:
+                pass
+        if until is None:
+            try:
+                until = float(when)
+            except ValueError:
+                await ctx.send("The moment must be a date like 2019-05-01T18:30 or a Unix timestamp")
+                return
+
+        if until > time.time():
+            await ctx.send("The moment must be in the past")
+            return
+
+        # Replay the log
+        async with ctx.typing():
+            try:
+                members, changed = await self._rewind_guild(ctx.guild, until, apply=apply)
+            except (eventlog.ReplayError, OSError) as error:
+                await ctx.send("The guild can't be rewound: {}".format(error))
+                return
+
+        if apply:
+            message = "{} of the {} members with data then were restored.".format(changed, members)
+            if changed:
+                message += " Run `!la guild roles sync` to update their roles."
+        else:
+            message = "{} members had data then, {} of them changed since. Add `true` to restore them.".format(
+                members, changed)
+        await ctx.send(message)
+
+    @checks.is_owner()
+    @guild.command(name="export")
+    async def guild_export(self, ctx: Context, fmt: str = transfer.JSONL):
+        """
+        Saves the levels of every member to a file
+
+        The file goes to the cog's data folder, in `exports`, on the bot's host, so only the bot owner can do this. It
+        can be loaded back with `!la guild import`.
+
+        fmt: jsonl for one JSON member per line or binary for a compact packed file
+        """
+        # Checks format
+        fmt = fmt.lower()
+        if fmt not in transfer.EXPORT_FORMATS:
+            await ctx.send("The format must be one of: {}".format(", ".join(transfer.EXPORT_FORMATS)))
+            return
+
+        # Build path
+        folder = cog_data_path(self) / "exports"
+        folder.mkdir(parents=True, exist_ok=True)
+        path = folder / "{}-{}.{}".format(ctx.guild.id, datetime.utcnow().strftime("%Y%m%d-%H%M%S"),
+                                          transfer.EXTENSIONS[fmt])
+
+        # Write members
+        async with ctx.typing():
+            with path.open("wb") as file:
+                count = await self._export_members(ctx.guild, fmt, file)
+
+        await ctx.send("{} members exported to `{}`".format(count, path))
+
+    @checks.is_owner()
+    @guild.command(name="import")
+    async def guild_import(self, ctx: Context, fmt: str, filename: str):
+        """
+        Loads member levels from a file
+
+        Put the file in the cog's data folder, in `imports`. Every guild shares that folder, so only the bot owner can
+        do this. Members in the file replace the stored ones, others are kept. Levels from other levelers are kept as
+        is and their XP is capped to the goal of the level.
+
+        fmt: jsonl or binary for files made by `!la guild export`, leveler for a dump of the users collection of
+        AznStevy's V2 Leveler or mee6 for a Mee6-style leaderboard JSON
+
+        filename: name of the file in the imports folder
+        """
+        # Checks format
+        fmt = fmt.lower()
+        if fmt not in transfer.IMPORT_FORMATS:
+            await ctx.send("The format must be one of: {}".format(", ".join(transfer.IMPORT_FORMATS)))
+            return
+
+        # Get file, only from the imports folder
+        folder = cog_data_path(self) / "imports"
+        path = folder / Path(filename).name
+        if not path.is_file():
+            await ctx.send("No file named `{}` in `{}`".format(path.name, folder))
+            return
+
+        # Read and load members
+        async with ctx.typing():
+            try:
+                with path.open("rb") if fmt == transfer.BINARY else path.open(encoding="utf-8") as file:
+                    count = await self._import_members(ctx.guild, transfer.READERS[fmt](file, ctx.guild.id))
+            except (transfer.TransferError, ValueError, KeyError, TypeError) as error:
+                await ctx.send("The import stopped on a bad record ({}: {}), members of the chunks read before it "
+                               "were imported".format(type(error).__name__, error))
+                return
+
+        await ctx.send("{} members imported".format(count))
+
     @guild.command(name="levelboard", aliases=["lb", "lvlboard"])
-    async def admin_leaderboard(self, ctx: Context):
+    async def admin_leaderboard(self, ctx: Context, page: int = 1):
         """
-        Display a leaderboard with the top 20 members of the guild
+        Display the guild's leaderboard, 20 members per page
 
         this one contains a xpmsgs / msgs column for statistics. Msgs is the total amount of messages sent by a member
         and xpmsgs is the amount of those messages sent off cooldown and awarded xp. It helps when tuning the cooldown
         and xp settings.
         """
-        # Get configuration and member data
-        guild_config = await self._get_guild_config(ctx.guild)
-        leaderboard_max = await guild_config.get_raw(self.LEADERBOARD_MAX)
-        guild_members = await self._get_members(ctx.guild)
-        all_members = guild_members.values()
+        # Get configuration data
+        settings = await self._get_settings(ctx.guild)
+        page_size = clamp_page_size(settings.leaderboard_max)
+
+        # Wait for the bulk load so the leaderboard holds every stored member
+        await self._ready.wait()
 
         # Checks if there is any members
-        if len(all_members) == 0:
+        if len(self._get_leaderboard(ctx.guild.id)) == 0:
             await ctx.send("No member activity registered.")
             return
 
-        # Sorts members in order with level and XP
-        all_members = sorted(all_members, key=lambda u: (u[self.LEVEL], u[self.EXP]), reverse=True)
-        top_member = discord.utils.find(lambda m: m.display_name == all_members[0][self.USERNAME], ctx.guild.members)
-        member_list = ""
-
-        # Build Embed
-        embed = discord.Embed()
-        embed.set_author(name=ctx.guild.name + " Leaderboard")
-        embed.set_thumbnail(url=ctx.guild.icon_url)
-        embed.timestamp = datetime.utcnow()
-
-        # Loop to create member_list
-        for i in range(0, len(all_members[:leaderboard_max])):
-            member = all_members[i]
-            member_list += "\n#{number} <@!{ID}> - Level : {LVL} - Messages : {XP}/{COUNT}".format(number=i+1, ID=member[self.MEMBER_ID], LVL=member[self.LEVEL], XP=member[self.MESSAGE_WITH_XP], COUNT=member[self.MESSAGE_COUNT])
-
-        # Try to set and send the embed and tells user if it excepts
-        try:
-            embed.description = member_list
-            await ctx.send(embed=embed)
-        except discord.errors.HTTPException:
-            await ctx.send("The list is too long. Please set a lower limit with `!la config set leaderboard_max`")
+        # Message counts change with every message, so these pages are rendered each time they're shown
+        render, pages = self._leaderboard_menu(ctx.guild, "#{number} <@!{ID}> - Level : {LVL} - Messages : {XP}/{COUNT}",
+                                               page_size)
+        await browse(ctx, render, pages, page - 1)
 
     @guild.command(name="channelignore", aliases=["chignore", "ci"])
     async def channel_ignore(self, ctx: Context, channel: discord.TextChannel = None):
@@ -198,9 +440,11 @@ class Lvladmin:
         # Checks config if already ignored or not and reacts based on that
         if not await channel_config.get_raw(self.IGNORED_CHANNEL):
             await channel_config.set_raw(self.IGNORED_CHANNEL, value=True)
+            self._gate.set_ignored(channel.id, True)
             await ctx.send("Channel {0.mention} will now be ignored.".format(channel))
         else:
             await channel_config.set_raw(self.IGNORED_CHANNEL, value=False)
+            self._gate.set_ignored(channel.id, False)
             await ctx.send("Channel {0.mention} no longer being ignored".format(channel))
 
     @lvladmin.group()
@@ -218,15 +462,19 @@ class Lvladmin:
         member: Mention the member whose data you want to delete.
         """
         # Get member data
-        member_data = self.config.member(member)
+        member_data = await self._members.get(ctx.guild.id, member.id)
 
-        # Checks if ID is 000000000 and says it has no data if so
-        if await member_data.get_raw(self.MEMBER_ID) == self.DEFAULT_ID:
+        # Checks if the member was ever initialized and says it has no data if not
+        if not member_data.tracked:
             await ctx.send("No data for {} has been found".format(member.mention))
             return
 
-        # Else it deletes the data
-        await self.config.member(member).clear()
+        # Else it deletes the data, cached copy and rank included
+        await self._members.reset_member(ctx.guild.id, member.id)
+        self._remove_rank(ctx.guild.id, member.id)
+        self._get_windows(ctx.guild.id).discard(member.id)
+        self._cooldowns.discard(ctx.guild.id, member.id)
+        self._events.append(eventlog.RESET, ctx.guild.id, member.id, now=time.time())
         await ctx.send("Data for {} has been deleted!".format(member.mention))
 
     @member.command(name="setlevel", aliases=["lvl", "level"])
@@ -236,19 +484,28 @@ class Lvladmin:
 
         member: Mention the member to which you want to change the level.
 
-        level: The new member level.
+        level: The new member level. XP past its goal is dropped, or the member would level up again.
         """
 
+        # Checks level is on the curve
+        if not 0 <= level <= MAX_LEVEL:
+            await ctx.send("The level must be between 0 and {}".format(MAX_LEVEL))
+            return
+
         # Get guild data and member data
-        guild_config = await self._get_guild_config(ctx.guild)
-        member_data = await self._get_member_data(guild_config=guild_config, member=member)
+        settings = await self._get_settings(ctx.guild)
+        member_data = await self._get_member_data(settings=settings, member=member)
 
-        # Sets level
+        # Sets level, XP is capped to the goal of the level like `!la guild check` expects
         await member_data.set_raw(self.LEVEL, value=level)
+        exp = await member_data.get_raw(self.EXP)
+        if level < MAX_LEVEL and exp >= settings.curve.goal(level):
+            await member_data.set_raw(self.EXP, value=settings.curve.goal(level) - 1)
 
-        # Checks role and goal then send message
+        # Checks role then rank and send message, the goal follows the level
         await self._level_role(member_data=member_data, member=member)
-        await self._level_goal(member_data=member_data)
+        self._update_rank(member_data)
+        self._log_event(eventlog.SET_LEVEL, member_data)
         await ctx.send("Level of {0} has been changed to {1}".format(member.mention, level))
 
     @member.command(name="givexp", aliases=["xp"])
@@ -266,11 +523,11 @@ class Lvladmin:
         """
 
         # Get guild config and member data
-        guild_config = await self._get_guild_config(ctx.guild)
-        member_data = await self._get_member_data(guild_config=guild_config, member=member)
+        settings = await self._get_settings(ctx.guild)
+        member_data = await self._get_member_data(settings=settings, member=member)
 
         # Give XP and set count which is level
-        count = await self._give_xp(member_data=member_data, member=member, exp=xp)
+        count = await self._give_xp(settings=settings, member_data=member_data, member=member, exp=xp)
 
         # If reason is set, add for to reason
         if reason is not None:
@@ -289,6 +546,148 @@ class Lvladmin:
             levels = "level" if count == 1 else "levels"
             await ctx.send("{0} {1} were earned by that. New shiny level: {2}".format(count, levels, lvl))
 
+    @checks.is_owner()
+    @lvladmin.group()
+    async def stats(self, ctx: Context):
+        """Bot-wide statistics"""
+        pass
+
+    @stats.group(name="perf", invoke_without_command=True)
+    async def stats_perf(self, ctx: Context):
+        """
+        Shows how long each stage of XP processing takes
+
+        Latencies are grouped in fixed buckets so p50 and p99 are upper bounds. Reads and writes are Config calls made
+        during the stage. Use `!la stats perf toggle` to start recording.
+        """
+        # Get state and report
+        state = "enabled" if self._perf.enabled else "disabled"
+        await ctx.send("Performance recording is {}\n```\n{}\n```".format(state, self._perf.report()))
+
+    @stats_perf.command(name="toggle")
+    async def stats_perf_toggle(self, ctx: Context):
+        """
+        Toggles performance recording
+
+        Recording costs very little, but it's off by default.
+        """
+        # Switch state and tell it
+        self._perf.enabled = not self._perf.enabled
+        state = "enabled" if self._perf.enabled else "disabled"
+        await ctx.send("Performance recording is now {}".format(state))
+
+    @stats_perf.command(name="reset")
+    async def stats_perf_reset(self, ctx: Context):
+        """
+        Clears recorded performance data
+        """
+        # Reset histograms
+        self._perf.reset()
+        await ctx.send("Performance data has been cleared")
+
+    @stats.group(name="queues", invoke_without_command=True)
+    async def stats_queues(self, ctx: Context):
+        """
+        Shows the message queues waiting for their workers
+
+        Each guild's members are split over a few queues, each handled by a single worker. Dropped messages were
+        refused by the backpressure policy, see `!la config set backpressure`.
+        """
+        # Get queue report
+        await ctx.send("```\n{}\n```".format(self._actors.report()))
+
+    @stats_queues.command(name="reset")
+    async def stats_queues_reset(self, ctx: Context):
+        """
+        Clears the handled and dropped counters
+        """
+        # Reset counters
+        self._actors.reset()
+        await ctx.send("Queue counters have been cleared")
+
+    @lvladmin.command(name="simulate", aliases=["sim"])
+    async def simulate_settings(self, ctx: Context, profile: str = simulate.SYNTHETIC, days: int = 30,
+                                *settings: str):
+        """
+        Simulates how members would level up under candidate settings
+
+        Nothing is changed, the guild's current settings are used for anything not given. Needs NumPy.
+
+        profile: synthetic for made up members or recorded to spread activity like the guild's stored message counts
+
+        days: how many days of activity to simulate, up to 365
+
+        settings: changes to try as key=value, among minxp, maxxp, gainfactor, cooldown and goal, plus members (for
+        synthetic, default 1000) and daily (messages per day in the guild, default 5000)
+
+        Example: `!la simulate synthetic 60 cooldown=30 goal=150 daily=20000`
+        """
+        # Checks NumPy is there
+        if simulate.np is None:
+            await ctx.send("The simulator needs NumPy, install it with `{}pipinstall numpy`".format(ctx.prefix))
+            return
+
+        # Checks profile and days
+        profile = profile.lower()
+        if profile not in simulate.PROFILES:
+            await ctx.send("The profile must be one of: {}".format(", ".join(simulate.PROFILES)))
+            return
+
+        if not 1 <= days <= 365:
+            await ctx.send("The simulation must last between 1 and 365 days")
+            return
+
+        # Apply candidate settings on a copy of the guild's config
+        guild_config = await self.config.guild(ctx.guild).all()
+        keys = {"minxp": (self.XP_MIN, int), "maxxp": (self.XP_MAX, int), "gainfactor": (self.XP_GAIN_FACTOR, float),
+                "cooldown": (self.COOLDOWN, int), "goal": (self.XP_GOAL_BASE, int)}
+        activity = {"members": 1000, "daily": 5000}
+
+        for setting in settings:
+            key, _, value = setting.partition("=")
+            key = key.lower()
+            try:
+                if key in keys:
+                    guild_config[keys[key][0]] = keys[key][1](value)
+                elif key in activity:
+                    activity[key] = int(value)
+                else:
+                    raise ValueError
+            except ValueError:
+                await ctx.send("`{}` isn't a valid setting, see `{}help la simulate`".format(setting, ctx.prefix))
+                return
+
+        # Checks values make sense
+        candidate = GuildSettings.from_config(guild_config)
+        if not 0 <= candidate.xp_min <= candidate.xp_max or candidate.cooldown < 0 or candidate.xp_goal_base < 1:
+            await ctx.send("The minimum xp must be positive and at most the maximum, the goal at least 1 and the "
+                           "cooldown positive")
+            return
+
+        if not 1 <= activity["members"] <= 100000 or not 1 <= activity["daily"] <= 10000000:
+            await ctx.send("Members must be between 1 and 100000 and daily messages between 1 and 10000000")
+            return
+
+        # Get activity profile
+        if profile == simulate.RECORDED:
+            message_counts = [member[self.MESSAGE_COUNT] for member in (await self._get_members(ctx.guild)).values()]
+            if not message_counts:
+                await ctx.send("No member activity registered.")
+                return
+            rates = simulate.recorded_rates(message_counts, activity["daily"])
+        else:
+            rates = simulate.synthetic_rates(activity["members"], activity["daily"])
+
+        # Run it away from the event loop
+        async with ctx.typing():
+            result = await self.bot.loop.run_in_executor(None, functools.partial(
+                simulate.simulate, candidate.curve, candidate.xp_min, candidate.xp_max, candidate.cooldown, rates,
+                days))
+
+        await ctx.send("Simulated with {}-{} xp, gain factor {}, goal base {} and {}s cooldown\n```\n{}\n```".format(
+            candidate.xp_min, candidate.xp_max, candidate.xp_gain_factor, candidate.xp_goal_base, candidate.cooldown,
+            simulate.report(result)))
+
     @lvladmin.group(name="config")
     async def configuration(self, ctx: Context):
         """Configuration options"""
@@ -301,9 +700,12 @@ class Lvladmin:
 
         this doesn't ask for confirmation and does not affect the player database
         """
-        # Clear config defaults
+        # Clear config defaults then move members onto the default curve
+        old_settings = await self._get_settings(ctx.guild)
         await self.config.guild(ctx.guild).clear()
-        await ctx.send("Configuration defaults have been restored")
+        self._invalidate_role_map(ctx.guild)
+        self._gate.set_active(ctx.guild.id, True)
+        await self._send_relevel(ctx, old_settings, "Configuration defaults have been restored")
 
     @configuration.group(name="set")
     async def config_set(self, ctx: Context):
@@ -315,11 +717,17 @@ class Lvladmin:
         """
         Base goal xp - default: 100
 
-        This is the xp needed to reach level 1. Subsequent goals are measured with the current level's value.
+        This is the xp needed to reach level 1. Subsequent goals are measured from it with the guild's curve.
         """
-        # Set XP Goal base
+        # Checks value is positive
+        if value < 1:
+            await ctx.send("The base goal must be at least 1")
+            return
+
+        # Set XP Goal base then recompile the curve and move members onto it
+        old_settings = await self._get_settings(ctx.guild)
         await self.config.guild(ctx.guild).set_raw(self.XP_GOAL_BASE, value=value)
-        await ctx.send("XP goal base value updated")
+        await self._send_relevel(ctx, old_settings, "XP goal base value updated")
 
     @config_set.command(name="gainfactor", aliases=["gf"])
     async def set_xp_gain_factor(self, ctx: Context, value: float):
@@ -328,10 +736,58 @@ class Lvladmin:
 
         XP gained += lvl * this factor
         """
-        # Set XP Gain factor
+        # Checks value is a number the bonus table can hold
+        if not (math.isfinite(value) and abs(value) <= MAX_GOAL):
+            await ctx.send("The gain factor must be a number up to {}".format(MAX_GOAL))
+            return
+
+        # Set XP Gain factor then recompile the curve's bonus table
         await self.config.guild(ctx.guild).set_raw(self.XP_GAIN_FACTOR, value=value)
+        self._invalidate_settings(ctx.guild)
+        await self._get_settings(ctx.guild)
         await ctx.send("XP gain factor value updated")
 
+    @config_set.command(name="curve")
+    async def set_xp_curve(self, ctx: Context, kind: str, *params: float):
+        """
+        XP curve used to calculate goals - default: polynomial 50 5
+
+        The base goal is always the goal of level 0. The possible curves are:
+        polynomial: goal = base + p1 * level + p2 * level^2 + ... (up to 5 values)
+        exponential: goal = base * p1^level (p1 must be at least 1)
+        table: goals of level 1, 2, ... as listed, later levels keep growing by the last difference
+
+        Example: `!la config set curve polynomial 50 5`
+        """
+        # Get curve type
+        kind = kind.lower()
+        if kind not in CURVE_TYPES:
+            await ctx.send("The curve must be one of: {}".format(", ".join(CURVE_TYPES)))
+            return
+
+        # Checks parameters for the curve type, goals past MAX_GOAL are capped so larger values can't be compiled
+        if not all(math.isfinite(p) and p <= MAX_GOAL for p in params):
+            await ctx.send("Curve values must be numbers up to {}".format(MAX_GOAL))
+            return
+        if kind == POLYNOMIAL and not (1 <= len(params) <= 5 and all(p >= 0 for p in params)):
+            await ctx.send("A polynomial curve takes 1 to 5 values that aren't negative")
+            return
+        if kind == EXPONENTIAL and not (len(params) == 1 and params[0] >= 1):
+            await ctx.send("An exponential curve takes a single value of at least 1")
+            return
+        if kind == TABLE and not (1 <= len(params) <= MAX_LEVEL and all(p >= 1 for p in params)):
+            await ctx.send("A table curve takes 1 to {} goals of at least 1".format(MAX_LEVEL))
+            return
+
+        # Set curve then recompile it and move members onto it
+        xp_curve = {
+            self.CURVE_TYPE: kind,
+            self.CURVE_PARAMS: list(params)
+        }
+        old_settings = await self._get_settings(ctx.guild)
+        await self.config.guild(ctx.guild).set_raw(self.XP_CURVE, value=xp_curve)
+        await self._send_relevel(ctx, old_settings, "XP curve updated")
+
     @config_set.command(name="minxp")
     async def set_xp_min(self, ctx: Context, value: int):
         """
@@ -341,6 +797,7 @@ class Lvladmin:
         """
         # Set XP min
         await self.config.guild(ctx.guild).set_raw(self.XP_MIN, value=value)
+        self._invalidate_settings(ctx.guild)
         await ctx.send("Minimum xp per message value updated")
 
     @config_set.command(name="maxxp")
@@ -352,6 +809,7 @@ class Lvladmin:
         """
         # Set XP max
         await self.config.guild(ctx.guild).set_raw(self.XP_MAX, value=value)
+        self._invalidate_settings(ctx.guild)
         await ctx.send("Maximum xp per message value updated")
 
     @config_set.command(name="cooldown", aliases=["cd"])
@@ -363,16 +821,139 @@ class Lvladmin:
         """
         # Set XP cooldown
         await self.config.guild(ctx.guild).set_raw(self.COOLDOWN, value=value)
+        self._invalidate_settings(ctx.guild)
         await ctx.send("XP cooldown value updated")
 
     @config_set.command(name="leaderboard_max", aliases=["lb_max"])
     async def set_leaderboard_max(self, ctx: Context, value: int):
         """
-        Max amount of entries on the leaderboard - default: 20
+        Members per leaderboard page - default: 20
         """
-        # Set Leaderboard entries max
+        if not 1 <= value <= MAX_PAGE_SIZE:
+            await ctx.send("The leaderboard must show between 1 and {} members per page".format(MAX_PAGE_SIZE))
+            return
+
+        # Set Leaderboard entries per page
         await self.config.guild(ctx.guild).set_raw(self.LEADERBOARD_MAX, value=value)
-        await ctx.send("Leaderboard's max entries updated")
+        self._invalidate_settings(ctx.guild)
+        await ctx.send("Leaderboard's members per page updated")
+
+    @checks.is_owner()
+    @config_set.command(name="flushinterval", aliases=["flush"])
+    async def set_flush_interval(self, ctx: Context, value: int):
+        """
+        Seconds member data may wait in memory before being saved - default: 30
+
+        This is a bot-wide setting. Lower values lose less data on a crash, higher values write less often.
+        """
+        # Checks value is positive
+        if value < 1:
+            await ctx.send("The flush interval must be at least 1 second")
+            return
+
+        # Set flush interval, the loop picks it up after its current wait
+        await self.config.set_raw(self.FLUSH_INTERVAL, value=value)
+        await ctx.send("Flush interval value updated")
+
+    @checks.is_owner()
+    @config_set.command(name="backpressure", aliases=["queue"])
+    async def set_backpressure(self, ctx: Context, policy: str, size: int = 1000):
+        """
+        What happens to messages when a message queue is full - default: drop_newest 1000
+
+        This is a bot-wide setting. With drop_newest, messages arriving at a full queue get no XP. With drop_oldest,
+        the oldest waiting message is discarded to make room instead.
+
+        policy: drop_newest or drop_oldest
+
+        size: how many messages a queue may hold
+        """
+        # Checks policy and size
+        policy = policy.lower()
+        if policy not in POLICIES:
+            await ctx.send("The policy must be one of: {}".format(", ".join(POLICIES)))
+            return
+
+        if size < 1:
+            await ctx.send("The queue size must be at least 1")
+            return
+
+        # Set policy and size then apply them right away
+        await self.config.set_raw(self.QUEUE_POLICY, value=policy)
+        await self.config.set_raw(self.QUEUE_SIZE, value=size)
+        self._actors.policy = policy
+        self._actors.max_depth = size
+        await ctx.send("Backpressure policy updated")
+
+    @checks.is_owner()
+    @config_set.command(name="offload")
+    async def set_offload_threshold(self, ctx: Context, value: int):
+        """
+        Member count from which leaderboard rebuilds and reports run in a thread - default: 5000
+
+        This is a bot-wide setting. Smaller guilds are handled right away on the event loop, larger ones in a thread so
+        the bot keeps answering while they're computed.
+        """
+        # Checks value is positive
+        if value < 0:
+            await ctx.send("The offload threshold can't be negative")
+            return
+
+        # Set threshold and apply it right away
+        await self.config.set_raw(self.OFFLOAD_THRESHOLD, value=value)
+        self._offload_threshold = value
+        await ctx.send("Offload threshold updated")
+
+    @checks.is_owner()
+    @config_set.command(name="check")
+    async def set_check_interval(self, ctx: Context, hours: int):
+        """
+        Hours between two checks and repairs of every guild's member data - default: 24
+
+        This is a bot-wide setting. 0 turns the scheduled check off, `!la guild check` still works.
+        """
+        # Checks value is positive
+        if hours < 0:
+            await ctx.send("The check interval can't be negative")
+            return
+
+        # Set interval, the flush loop picks it up
+        await self.config.set_raw(self.CHECK_INTERVAL, value=hours)
+        await ctx.send("Check interval updated")
+
+    @checks.is_owner()
+    @config_set.command(name="storage")
+    async def set_storage(self, ctx: Context, backend: str):
+        """
+        Moves member data to another storage - default: config
+
+        This is a bot-wide setting. sqlite keeps members in a database in the cog's data folder, flushed in batches and
+        indexed by level, which holds up better than Config for large guilds. Members are copied over and also left
+        where they were.
+
+        backend: config or sqlite
+        """
+        # Checks backend
+        backend = backend.lower()
+        if backend not in BACKENDS:
+            await ctx.send("The storage must be one of: {}".format(", ".join(BACKENDS)))
+            return
+
+        if backend == await self.config.get_raw(self.STORAGE):
+            await ctx.send("Member data is already stored in {}".format(backend))
+            return
+
+        # Copy every member then switch
+        async with ctx.typing():
+            started = time.perf_counter()
+            try:
+                count = await self._switch_storage(backend)
+            except Exception as error:
+                log.exception("Failed to move member data to {}".format(backend))
+                await ctx.send("Member data couldn't be moved ({}: {})".format(type(error).__name__, error))
+                return
+
+        await ctx.send("{} members moved to {} in {:.1f}s".format(count, backend, time.perf_counter() - started))
 
     @config_set.command(name="mode", enabled=False, hidden=True)
     async def set_role_mode(self, ctx: Context, value: bool):
@@ -385,6 +966,7 @@ class Lvladmin:
         """
         # TODO : Set single role configuration
         await self.config.guild(ctx.guild).set_raw(self.SINGLE_ROLE, value=value)
+        self._invalidate_settings(ctx.guild)
         await ctx.send("Role mode value updated")
 
     @config_set.command(name="announce")
@@ -396,6 +978,7 @@ class Lvladmin:
         """
         # Set announcement status toggle
         await self.config.guild(ctx.guild).set_raw(self.MAKE_ANNOUNCEMENTS, value=value)
+        self._invalidate_settings(ctx.guild)
         value = "enabled" if await self.config.guild(ctx.guild).make_announcements() else "disabled"
         await ctx.send("Public announcements are now {}".format(value))
 
@@ -409,6 +992,8 @@ class Lvladmin:
         """
         # Set active or not toggle
         await self.config.guild(ctx.guild).set_raw(self.ACTIVE, value=value)
+        self._invalidate_settings(ctx.guild)
+        self._gate.set_active(ctx.guild.id, value)
         value = "enabled" if await self.config.guild(ctx.guild).active() else "disabled"
         await ctx.send("XP tracking is now {}".format(value))
 
@@ -443,6 +1028,7 @@ class Lvladmin:
 
         # Set message
         await self.config.guild(ctx.guild).set_raw(self.LEVEL_UP_MESSAGE, value=message)
+        self._invalidate_settings(ctx.guild)
 
         # If empty, tell no message will be sent
         if message == "":
@@ -484,6 +1070,7 @@ class Lvladmin:
 
         # Set message
         await self.config.guild(ctx.guild).set_raw(self.ROLE_CHANGE_MESSAGE, value=message)
+        self._invalidate_settings(ctx.guild)
 
         # If empty, tell no message will be sent
         if message == "":
@@ -503,12 +1090,26 @@ class Lvladmin:
         """
         Base goal xp
 
-        This is the xp needed to reach level 1. Subsequent goals are measured with the current level's value.
+        This is the xp needed to reach level 1. Subsequent goals are measured from it with the guild's curve.
         """
         # Get XP goal base
         value = await self.config.guild(ctx.guild).get_raw(self.XP_GOAL_BASE)
         await ctx.send("XP goal base: {}".format(value))
 
+    @config_get.command(name="curve")
+    async def get_xp_curve(self, ctx: Context):
+        """
+        XP curve used to calculate goals
+
+        The first goals of the curve are shown along with its definition.
+        """
+        # Get XP curve and the goals it gives
+        xp_curve = await self.config.guild(ctx.guild).get_raw(self.XP_CURVE)
+        settings = await self._get_settings(ctx.guild)
+        goals = ", ".join(str(settings.curve.goal(level)) for level in range(10))
+        params = " ".join("{:g}".format(p) for p in xp_curve[self.CURVE_PARAMS])
+        await ctx.send("XP curve: {} {}\nGoals of levels 0 to 9: {}".format(xp_curve[self.CURVE_TYPE], params, goals))
+
     @config_get.command(name="gainfactor", aliases=["gf"])
     async def get_xp_gain_factor(self, ctx: Context):
         """
@@ -556,11 +1157,57 @@ class Lvladmin:
     @config_get.command(name="leaderboard_max", aliases=["lb_max"])
     async def get_leaderboard_max(self, ctx: Context):
         """
-        Max amount of entries on the leaderboard
+        Members per leaderboard page
         """
         # Get leaderboard max
         value = await self.config.guild(ctx.guild).get_raw(self.LEADERBOARD_MAX)
-        await ctx.send("Leaderboard's max entries: {}".format(value))
+        await ctx.send("Leaderboard's members per page: {}".format(value))
+
+    @config_get.command(name="flushinterval", aliases=["flush"])
+    async def get_flush_interval(self, ctx: Context):
+        """
+        Seconds member data may wait in memory before being saved
+        """
+        # Get flush interval
+        value = await self.config.get_raw(self.FLUSH_INTERVAL)
+        await ctx.send("Flush interval: {}".format(value))
+
+    @config_get.command(name="backpressure", aliases=["queue"])
+    async def get_backpressure(self, ctx: Context):
+        """
+        What happens to messages when a message queue is full
+        """
+        # Get policy and size
+        policy = await self.config.get_raw(self.QUEUE_POLICY)
+        size = await self.config.get_raw(self.QUEUE_SIZE)
+        await ctx.send("Backpressure: {} past {} waiting messages".format(policy, size))
+
+    @config_get.command(name="offload")
+    async def get_offload_threshold(self, ctx: Context):
+        """
+        Member count from which leaderboard rebuilds and reports run in a thread
+        """
+        # Get threshold
+        value = await self.config.get_raw(self.OFFLOAD_THRESHOLD)
+        await ctx.send("Offload threshold: {} members".format(value))
+
+    @config_get.command(name="check")
+    async def get_check_interval(self, ctx: Context):
+        """
+        Hours between two checks and repairs of every guild's member data
+        """
+        # Get interval
+        value = await self.config.get_raw(self.CHECK_INTERVAL)
+        await ctx.send("Check interval: {}".format("{} hours".format(value) if value else "off"))
+
+    @config_get.command(name="storage")
+    async def get_storage(self, ctx: Context):
+        """
+        Where member data is stored
+        """
+        # Get backend
+        value = await self.config.get_raw(self.STORAGE)
+        await ctx.send("Storage: {}".format(value))
 
     @config_get.command(name="mode", enabled=False, hidden=True)
     async def get_role_mode(self, ctx: Context):
@@ -0,0 +1,131 @@
+"""
+Leaderboard pages and the reaction menu that browses them.
+
+Rendered pages are cached per guild and only dropped when the ranks they show change: a member moving from one rank
+to another shifts every member between the two by one place, so only the pages covering that span are affected.
+"""
+import asyncio
+
+import discord
+
+FIRST = "\N{BLACK LEFT-POINTING DOUBLE TRIANGLE}"
+PREVIOUS = "\N{LEFTWARDS BLACK ARROW}"
+NEXT = "\N{BLACK RIGHTWARDS ARROW}"
+LAST = "\N{BLACK RIGHT-POINTING DOUBLE TRIANGLE}"
+CLOSE = "\N{CROSS MARK}"
+CONTROLS = (FIRST, PREVIOUS, NEXT, LAST, CLOSE)
+
+# Longest page that fits an embed description with the longest lines
+MAX_PAGE_SIZE = 25
+MENU_TIMEOUT = 60.0
+
+
+def clamp_page_size(value: int) -> int:
+    return min(max(value, 1), MAX_PAGE_SIZE)
+
+
+def page_count(members: int, page_size: int) -> int:
+    return max(1, -(-members // page_size))
+
+
+class PageCache:
+    """
+    Rendered pages of a guild's leaderboard by page number.
+
+    A page holds ``page_size`` ranks and is kept while those ranks hold the same members at the same levels. Adding or
+    removing a member shifts every rank after it and changes how many pages there are, so it drops all later pages.
+    """
+
+    def __init__(self, page_size: int):
+        self.page_size = page_size
+        self.pages = {}
+
+    def get(self, number: int):
+        return self.pages.get(number)
+
+    def put(self, number: int, page):
+        self.pages[number] = page
+
+    def moved(self, old_rank, new_rank, level_changed: bool = False):
+        """
+        Drops the pages affected by a member going from one one-based rank to another, None when not ranked
+        """
+        if old_rank == new_rank:
+            # Same place, only its own line may have changed
+            if level_changed and old_rank is not None:
+                self.pages.pop((old_rank - 1) // self.page_size, None)
+            return
+
+        if old_rank is None or new_rank is None:
+            # Every later rank shifts and the page count may change, so every page is dropped from there
+            first = ((old_rank or new_rank) - 1) // self.page_size
+            for number in [number for number in self.pages if number >= first]:
+                del self.pages[number]
+            return
+
+        low, high = sorted((old_rank, new_rank))
+        for number in range((low - 1) // self.page_size, (high - 1) // self.page_size + 1):
+            self.pages.pop(number, None)
+
+    def clear(self):
+        self.pages.clear()
+
+
+async def browse(ctx, render, pages, page: int = 0, timeout: float = MENU_TIMEOUT):
+    """
+    Sends a page then lets the command's author turn pages with reactions until the menu times out
+
+    ``render(number)`` returns the embed of a zero-based page and ``pages()`` how many there currently are, both are
+    called again on every turn so the menu follows the leaderboard as it changes.
+    """
+    count = pages()
+    page = min(max(page, 0), count - 1)
+    message = await ctx.send(embed=render(page))
+
+    # A single page has nothing to browse
+    if count == 1:
+        return
+
+    try:
+        for emoji in CONTROLS:
+            await message.add_reaction(emoji)
+    except discord.HTTPException:
+        return
+
+    def check(reaction, user):
+        return reaction.message.id == message.id and user == ctx.author and str(reaction.emoji) in CONTROLS
+
+    while True:
+        try:
+            reaction, user = await ctx.bot.wait_for("reaction_add", check=check, timeout=timeout)
+        except asyncio.TimeoutError:
+            break
+
+        emoji = str(reaction.emoji)
+        if emoji == CLOSE:
+            await message.delete()
+            return
+
+        # Turn the page, wrapping around at both ends
+        count = pages()
+        if emoji == FIRST:
+            page = 0
+        elif emoji == LAST:
+            page = count - 1
+        elif emoji == PREVIOUS:
+            page = (page - 1) % count
+        else:
+            page = (page + 1) % count
+
+        # Removing the author's reaction needs Manage Messages, without it they react again to turn another page
+        try:
+            await message.remove_reaction(reaction.emoji, user)
+        except discord.HTTPException:
+            pass
+
+        await message.edit(embed=render(page))
+
+    try:
+        await message.clear_reactions()
+    except discord.HTTPException:
+        pass
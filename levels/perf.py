@@ -0,0 +1,102 @@
+import time
+from bisect import bisect_left
+
+VALIDATION = "validation"
+MEMBER_FETCH = "member fetch"
+COOLDOWN = "cooldown check"
+PROCESS_XP = "process xp"
+LEVEL_ROLE = "level role"
+ANNOUNCEMENT = "announcement"
+STAGES = (VALIDATION, MEMBER_FETCH, COOLDOWN, PROCESS_XP, LEVEL_ROLE, ANNOUNCEMENT)
+
+# Upper bounds of the latency buckets in seconds, anything slower goes to the last bucket
+BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)
+
+
+class StageHistogram:
+    __slots__ = ("counts", "calls", "total", "reads", "writes")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.calls = 0
+        self.total = 0.0
+        self.reads = 0
+        self.writes = 0
+
+    def add(self, elapsed: float, reads: int, writes: int):
+        self.counts[bisect_left(BUCKETS, elapsed)] += 1
+        self.calls += 1
+        self.total += elapsed
+        self.reads += reads
+        self.writes += writes
+
+    def percentile(self, fraction: float) -> str:
+        """
+        Returns the upper bound of the bucket holding the given fraction of calls
+        """
+        target = fraction * self.calls
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= target:
+                return _format_seconds(bound)
+        return ">" + _format_seconds(BUCKETS[-1])
+
+
+def _format_seconds(seconds: float) -> str:
+    if seconds < 0.001:
+        return "{:.3g}us".format(seconds * 1000000)
+    if seconds < 1:
+        return "{:.3g}ms".format(seconds * 1000)
+    return "{:.3g}s".format(seconds)
+
+
+class PerfMonitor:
+    """
+    Fixed-bucket latency histograms and Config call counts for the stages of the XP pipeline.
+
+    The cog and the member cache bump ``reads`` and ``writes`` on every Config call, and each stage is charged with
+    the calls made between its start and its end. While disabled, ``start`` returns None and ``record`` returns right
+    away, so the handler only pays for an attribute check per stage.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.reads = 0
+        self.writes = 0
+        self.stages = {}
+        self.reset()
+
+    def reset(self):
+        self.stages = {stage: StageHistogram() for stage in STAGES}
+
+    def start(self):
+        if not self.enabled:
+            return None
+        return time.perf_counter(), self.reads, self.writes
+
+    def record(self, stage: str, start):
+        """
+        Charges a stage with the time and Config calls since start and returns the start of the next stage
+        """
+        if start is None:
+            return None
+
+        now = time.perf_counter()
+        self.stages[stage].add(now - start[0], self.reads - start[1], self.writes - start[2])
+        return now, self.reads, self.writes
+
+    def report(self) -> str:
+        lines = ["{:<16}{:>9}{:>10}{:>9}{:>9}{:>11}{:>12}".format("stage", "calls", "avg", "p50", "p99",
+                                                                 "reads/call", "writes/call")]
+        for stage, histogram in self.stages.items():
+            if histogram.calls == 0:
+                lines.append("{:<16}{:>9}".format(stage, 0))
+                continue
+
+            lines.append("{:<16}{:>9}{:>10}{:>9}{:>9}{:>11.3f}{:>12.3f}".format(
+                stage, histogram.calls, _format_seconds(histogram.total / histogram.calls),
+                histogram.percentile(0.5), histogram.percentile(0.99), histogram.reads / histogram.calls,
+                histogram.writes / histogram.calls))
+
+        return "\n".join(lines)
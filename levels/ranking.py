@@ -0,0 +1,282 @@
+from heapq import merge
+from random import random
+
+MAX_HEIGHT = 32
+SORT_CHUNK = 8192
+
+
+def sort_in_chunks(items: list) -> list:
+    """
+    Sorts like ``sorted`` but a chunk at a time then merges them, so no single call holds the GIL for long when it
+    runs in another thread
+    """
+    if len(items) <= SORT_CHUNK:
+        return sorted(items)
+
+    return list(merge(*(sorted(items[start:start + SORT_CHUNK]) for start in range(0, len(items), SORT_CHUNK))))
+
+
+class _Node:
+    __slots__ = ("key", "next", "width")
+
+    def __init__(self, key, height: int):
+        self.key = key
+        self.next = [None] * height
+        self.width = [1] * height
+
+
+class RankIndex:
+    """
+    Indexable skip list of unique, sortable keys.
+
+    Each link stores how many positions it skips, so inserts, removals and rank lookups run in O(log n) and the
+    first N keys are read in O(N).
+    """
+
+    def __init__(self):
+        self.head = _Node(None, MAX_HEIGHT)
+        self.size = 0
+        self.height = 1
+
+    def __len__(self):
+        return self.size
+
+    def _search(self, key):
+        """
+        Returns the last node before key on every level and how many positions were walked on each level
+        """
+        chain = [self.head] * MAX_HEIGHT
+        steps = [0] * MAX_HEIGHT
+        node = self.head
+
+        # Levels above the tallest node only hold the head
+        for level in reversed(range(self.height)):
+            while node.next[level] is not None and node.next[level].key < key:
+                steps[level] += node.width[level]
+                node = node.next[level]
+            chain[level] = node
+
+        return chain, steps
+
+    @staticmethod
+    def _height() -> int:
+        """
+        Picks a random height with a 1/2 chance of growing each level
+        """
+        height = 1
+        while height < MAX_HEIGHT and random() < 0.5:
+            height += 1
+        return height
+
+    def load(self, keys: list):
+        """
+        Replaces the content with already sorted keys in O(n), without searching for each key
+        """
+        self.head = _Node(None, MAX_HEIGHT)
+        self.size = len(keys)
+        self.height = 1
+
+        # Last node and its position on every level, positions start at 1 after the head
+        last = [self.head] * MAX_HEIGHT
+        last_position = [0] * MAX_HEIGHT
+
+        for position, key in enumerate(keys, 1):
+            node = _Node(key, self._height())
+            self.height = max(self.height, len(node.next))
+            for level in range(len(node.next)):
+                last[level].next[level] = node
+                last[level].width[level] = position - last_position[level]
+                last[level], last_position[level] = node, position
+
+        # Links to the end reach one past the last node
+        for level in range(MAX_HEIGHT):
+            last[level].width[level] = self.size + 1 - last_position[level]
+
+    def insert(self, key):
+        chain, steps = self._search(key)
+        height = self._height()
+        node = _Node(key, height)
+        walked = 0
+
+        # New levels start with a head link past every node
+        for level in range(self.height, height):
+            self.head.width[level] = self.size + 1
+        self.height = max(self.height, height)
+
+        # Link the new node and split the widths of the links it cuts
+        for level in range(height):
+            prev = chain[level]
+            node.next[level] = prev.next[level]
+            prev.next[level] = node
+            node.width[level] = prev.width[level] - walked
+            prev.width[level] = walked + 1
+            walked += steps[level]
+
+        # Links passing over the new node are one step longer
+        for level in range(height, self.height):
+            chain[level].width[level] += 1
+
+        self.size += 1
+
+    def clear(self):
+        """
+        Empties the index one node at a time, so no single call frees every node
+        """
+        node, self.head = self.head, _Node(None, MAX_HEIGHT)
+        self.size = 0
+        self.height = 1
+
+        while node is not None:
+            node.next, node = [], node.next[0]
+
+    def remove(self, key):
+        chain, _ = self._search(key)
+        node = chain[0].next[0]
+
+        if node is None or node.key != key:
+            raise KeyError(key)
+
+        # Unlink the node and merge the widths of the links around it
+        for level in range(len(node.next)):
+            prev = chain[level]
+            prev.width[level] += node.width[level] - 1
+            prev.next[level] = node.next[level]
+
+        # Links passing over the node are one step shorter
+        for level in range(len(node.next), self.height):
+            chain[level].width[level] -= 1
+
+        self.size -= 1
+
+    def rank(self, key):
+        """
+        Returns the zero-based position of key or None if it isn't indexed
+        """
+        node = self.head
+        position = 0
+
+        for level in reversed(range(self.height)):
+            while node.next[level] is not None and node.next[level].key < key:
+                position += node.width[level]
+                node = node.next[level]
+
+        node = node.next[0]
+        if node is None or node.key != key:
+            return None
+
+        return position
+
+    def first(self, count: int):
+        """
+        Yields the first count keys in order
+        """
+        return self.slice(0, count)
+
+    def slice(self, start: int, count: int):
+        """
+        Yields count keys in order from the zero-based position start, reached in O(log n)
+        """
+        node = self.head
+        position = -1
+
+        for level in reversed(range(self.height)):
+            while node.next[level] is not None and position + node.width[level] <= start:
+                position += node.width[level]
+                node = node.next[level]
+
+        node = node.next[0] if position < start else node
+        while node is not None and count > 0:
+            yield node.key
+            node = node.next[0]
+            count -= 1
+
+
+class Leaderboard:
+    """
+    Members of a guild ordered by level then XP, highest first.
+
+    Keys are ``(-level, -exp, member_id)`` so ties are broken by member ID and every key is unique.
+    """
+
+    def __init__(self):
+        self.index = RankIndex()
+        self.keys = {}
+
+    def __len__(self):
+        return len(self.index)
+
+    def update(self, member_id: int, level: int, exp: int):
+        key = (-level, -exp, member_id)
+        old_key = self.keys.get(member_id)
+
+        # Nothing to move
+        if old_key == key:
+            return
+
+        if old_key is not None:
+            self.index.remove(old_key)
+
+        self.index.insert(key)
+        self.keys[member_id] = key
+
+    @classmethod
+    def from_members(cls, members):
+        """
+        Returns a leaderboard of ``(member_id, level, exp)`` triples, it only touches its own data so it can be built
+        in another thread
+        """
+        leaderboard = cls()
+        leaderboard.load(members)
+        return leaderboard
+
+    def load(self, members):
+        """
+        Replaces every ranked member with ``(member_id, level, exp)`` triples with one sort
+        """
+        keys = sort_in_chunks([(-level, -exp, member_id) for member_id, level, exp in members])
+        self.index.load(keys)
+        self.keys = {key[2]: key for key in keys}
+
+    def clear(self):
+        self.index.clear()
+        self.keys = {}
+
+    def remove(self, member_id: int):
+        key = self.keys.pop(member_id, None)
+        if key is not None:
+            self.index.remove(key)
+
+    def matches(self, member_id: int, level: int, exp: int) -> bool:
+        """
+        Tells if a member is ranked at the given level and XP
+        """
+        return self.keys.get(member_id) == (-level, -exp, member_id)
+
+    def level(self, member_id: int):
+        """
+        Returns the level a member is ranked at or None if they aren't ranked
+        """
+        key = self.keys.get(member_id)
+        return None if key is None else -key[0]
+
+    def rank(self, member_id: int):
+        """
+        Returns the one-based rank of a member or None if they aren't ranked
+        """
+        key = self.keys.get(member_id)
+        if key is None:
+            return None
+
+        return self.index.rank(key) + 1
+
+    def top(self, count: int):
+        """
+        Returns the IDs of the count highest ranked members
+        """
+        return [key[2] for key in self.index.first(count)]
+
+    def page(self, start: int, count: int):
+        """
+        Returns the IDs of count members from the zero-based rank start
+        """
+        return [key[2] for key in self.index.slice(start, count)]
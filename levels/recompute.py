@@ -0,0 +1,59 @@
+"""
+Moves members from one XP curve to another.
+
+A member's total XP is the XP needed to reach their level on the curve it was earned on plus the XP left over in that
+level. It's placed on the new curve like ``LevelCurve.advance`` does, so nobody loses or gains XP, only the level and
+left over XP it's split into change. Placing a curve on itself moves members whose left over XP is past their goal up
+to the level it reaches. With NumPy the whole guild is placed at once, without it one member at a time.
+"""
+from bisect import bisect_right
+
+from .curve import MAX_LEVEL, LevelCurve
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def place(old: LevelCurve, new: LevelCurve, level: int, exp: int):
+    """
+    Returns the level and left over XP on the new curve of a member's level and left over XP on the old one
+    """
+    total = old.cumulative[min(level, MAX_LEVEL)] + exp
+    new_level = min(max(bisect_right(new.cumulative, total) - 1, 0), MAX_LEVEL)
+    return new_level, total - new.cumulative[new_level]
+
+
+def relevel(old: LevelCurve, new: LevelCurve, members: list):
+    """
+    Places ``(member_id, level, exp)`` triples on the new curve
+
+    Returns ``(member_id, level, exp, new_level, new_exp)`` for the members that change and how many of them changed
+    level.
+    """
+    if not members:
+        return [], 0
+
+    if np is None:
+        changes = []
+        for member_id, level, exp in members:
+            new_level, new_exp = place(old, new, level, exp)
+            if (new_level, new_exp) != (level, exp):
+                changes.append((member_id, level, exp, new_level, new_exp))
+        return changes, sum(1 for change in changes if change[1] != change[3])
+
+    count = len(members)
+    member_id = np.fromiter((member[0] for member in members), dtype=np.int64, count=count)
+    level = np.fromiter((member[1] for member in members), dtype=np.int64, count=count)
+    exp = np.fromiter((member[2] for member in members), dtype=np.int64, count=count)
+
+    # Total XP on the old curve then the level it reaches on the new one
+    total = np.asarray(old.cumulative, dtype=np.int64)[np.minimum(level, MAX_LEVEL)] + exp
+    cumulative = np.asarray(new.cumulative, dtype=np.int64)
+    new_level = np.clip(np.searchsorted(cumulative, total, side="right") - 1, 0, MAX_LEVEL)
+    new_exp = total - cumulative[new_level]
+
+    changed = (new_level != level) | (new_exp != exp)
+    changes = list(zip(*(column[changed].tolist() for column in (member_id, level, exp, new_level, new_exp))))
+    return changes, int(np.count_nonzero(new_level != level))
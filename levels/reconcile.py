@@ -0,0 +1,144 @@
+import asyncio
+import logging
+import time
+
+import discord
+
+log = logging.getLogger("levels.reconcile")
+
+
+class RateLimiter:
+    """
+    Spaces calls evenly so no more than ``rate`` of them start in any ``per`` seconds.
+
+    Member edits share one rate limit bucket per guild, so a job keeps a single limiter for all its workers.
+    """
+
+    def __init__(self, rate: int, per: float):
+        self.interval = per / rate
+        self.next_call = 0.0
+
+    async def acquire(self):
+        now = time.monotonic()
+        wait = self.next_call - now
+        self.next_call = max(now, self.next_call) + self.interval
+
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class RoleReconciler:
+    """
+    Brings every tracked member's level roles in line with their stored level.
+
+    The differences are computed up front from the guild's role map, then applied by a few workers pulling from a
+    bounded queue behind a shared rate limiter. In dry-run mode nothing is edited and only the plan is kept.
+
+    guild only needs ``get_member``, members need ``id``, ``roles`` and ``edit`` and roles need ``id`` and
+    ``is_default``, so stand-ins can be used to try a job without Discord.
+    """
+
+    def __init__(self, guild, role_map, levels: dict, stale_role_ids=(), concurrency: int = 4, rate: int = 10,
+                 per: float = 10.0, dry_run: bool = False):
+        self.guild = guild
+        self.role_map = role_map
+        self.stale_role_ids = set(stale_role_ids)
+        self.concurrency = concurrency
+        self.limiter = RateLimiter(rate, per)
+        self.dry_run = dry_run
+
+        self.changes = self.plan(levels)
+        self.added = sum(1 for _, roles, current in self.changes if set(roles) - set(current))
+        self.removed = sum(1 for _, roles, current in self.changes if set(current) - set(roles))
+        self.done = 0
+        self.failed = set()
+        self.started = None
+
+    @property
+    def total(self) -> int:
+        return len(self.changes)
+
+    def plan(self, levels: dict) -> list:
+        """
+        Returns (member, new roles, current roles) for every member whose roles don't match their level
+        """
+        changes = []
+
+        for member_id, level in levels.items():
+            member = self.guild.get_member(member_id)
+
+            # Skip members who left the guild
+            if member is None:
+                continue
+
+            # Get the role of the member's level, if it was deleted leave the member as is
+            index = self.role_map.target(level)
+            target = self.role_map.roles[index] if index is not None else None
+            if index is not None and target is None:
+                continue
+
+            # Keep every role that isn't an autorole or a removed one then add the target
+            current = [role for role in member.roles if not role.is_default()]
+            roles = [role for role in current if role not in self.role_map and role.id not in self.stale_role_ids]
+            if target is not None:
+                roles.append(target)
+
+            if set(roles) != set(current):
+                changes.append((member, roles, current))
+
+        return changes
+
+    def eta(self) -> float:
+        """
+        Seconds left, from the measured pace or the rate limit before anything finished
+        """
+        processed = self.done + len(self.failed)
+        remaining = self.total - processed
+
+        if processed == 0 or self.started is None:
+            return remaining * self.limiter.interval
+
+        return (time.monotonic() - self.started) / processed * remaining
+
+    def progress(self) -> str:
+        minutes, seconds = divmod(int(self.eta()), 60)
+        return "{}/{} members updated, {} failed, about {}m {:02}s left".format(
+            self.done, self.total, len(self.failed), minutes, seconds)
+
+    async def run(self):
+        if self.dry_run or not self.changes:
+            return
+
+        self.started = time.monotonic()
+        queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        workers = [asyncio.ensure_future(self._worker(queue)) for _ in range(self.concurrency)]
+
+        try:
+            for change in self.changes:
+                await queue.put(change)
+            await queue.join()
+        finally:
+            for worker in workers:
+                worker.cancel()
+
+    async def _worker(self, queue: asyncio.Queue):
+        while True:
+            member, roles, _ = await queue.get()
+
+            try:
+                await self.limiter.acquire()
+                await member.edit(roles=roles, reason="level roles sync")
+                self.done += 1
+
+            # If it fails, count it and move on
+            except discord.HTTPException:
+                log.debug("Permissions denied for role sync of member {}".format(member.id))
+                self.failed.add(member.id)
+
+            # Anything else only fails this member, the job still has to finish
+            except Exception:
+                log.exception("Role sync of member {} failed".format(member.id))
+                self.failed.add(member.id)
+
+            finally:
+                queue.task_done()
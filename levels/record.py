@@ -0,0 +1,58 @@
+"""
+Compact storage format of member records.
+
+A member is stored under a single ``record`` key as a list starting with the schema version followed by the stored
+fields in ``FIELDS`` order. The member ID is already the Config key, the goal comes from the guild's curve, the level
+role from the guild's autoroles and the display name from the guild itself, so none of them are stored.
+"""
+RECORD = "record"
+VERSION = 1
+
+# Same keys as the cog's data access constants
+EXP = "exp"
+LEVEL = "level"
+LAST_TRIGGER = "last_trigger"
+MESSAGE_COUNT = "message_count"
+MESSAGE_WITH_XP = "message_with_xp"
+FIELDS = (EXP, LEVEL, LAST_TRIGGER, MESSAGE_COUNT, MESSAGE_WITH_XP)
+
+# Members stored before versioned records had nine keys and this ID until their first message
+LEGACY_ID = "member_id"
+LEGACY_DEFAULT_ID = "000000000000000000"
+
+
+def new() -> dict:
+    """
+    Returns the in-memory fields of a member seen for the first time
+    """
+    return dict.fromkeys(FIELDS, 0)
+
+
+def pack(data: dict) -> dict:
+    """
+    Turns in-memory fields into the value written to Config
+    """
+    return {RECORD: [VERSION] + [data[field] for field in FIELDS]}
+
+
+def unpack(stored: dict):
+    """
+    Returns the in-memory fields of a stored member or None if it was never initialized
+    """
+    values = stored.get(RECORD)
+
+    # Version 1 is the only one so far, later versions get converted here
+    if values is not None:
+        return dict(zip(FIELDS, values[1:]))
+
+    # Read members in the legacy format until the migration rewrites them
+    if stored.get(LEGACY_ID, LEGACY_DEFAULT_ID) != LEGACY_DEFAULT_ID:
+        data = {field: stored.get(field, 0) for field in FIELDS}
+        data[LAST_TRIGGER] = int(data[LAST_TRIGGER])
+        return data
+
+    return None
+
+
+def is_legacy(stored: dict) -> bool:
+    return stored.get(RECORD) is None and stored.get(LEGACY_ID, LEGACY_DEFAULT_ID) != LEGACY_DEFAULT_ID
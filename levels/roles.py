@@ -0,0 +1,39 @@
+from bisect import bisect_right
+
+
+class RoleMap:
+    """
+    A guild's autoroles compiled for lookups by level.
+
+    ``levels`` is sorted so the role of a level is found with one bisect, and ``roles`` holds the resolved
+    ``discord.Role`` objects, or None for roles deleted from the guild. Maps are rebuilt only when the autoroles or the
+    guild's roles change.
+    """
+    __slots__ = ("levels", "roles", "names", "role_ids")
+
+    def __init__(self, guild, guild_roles: list):
+        guild_roles = sorted(guild_roles, key=lambda role: role["level"])
+        self.levels = [role["level"] for role in guild_roles]
+        self.roles = [guild.get_role(int(role["role_id"])) for role in guild_roles]
+        self.names = [role["role_name"] for role in guild_roles]
+        self.role_ids = {int(role["role_id"]) for role in guild_roles}
+
+    def __len__(self):
+        return len(self.levels)
+
+    def __contains__(self, role):
+        return role.id in self.role_ids
+
+    def target(self, level: int):
+        """
+        Returns the index of the role earned at level or None if it's below every autorole
+        """
+        index = bisect_right(self.levels, level) - 1
+        return index if index >= 0 else None
+
+    def name(self, level: int, default: str) -> str:
+        """
+        Returns the name of the role earned at level, deleted roles included, or default if it's below every autorole
+        """
+        index = self.target(level)
+        return self.names[index] if index is not None else default
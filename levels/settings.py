@@ -0,0 +1,31 @@
+from typing import NamedTuple
+
+from .curve import LevelCurve, compile_curve
+
+
+class GuildSettings(NamedTuple):
+    """
+    Immutable snapshot of the guild configuration read by the XP pipeline.
+
+    Field names match the guild's Config keys so a snapshot can be built from a single ``config.guild(guild).all()``
+    read, except ``curve`` which is compiled from the curve definition, base goal and gain factor. Snapshots are
+    cached per guild and dropped by the admin setters whenever a value changes.
+    """
+    active: bool
+    xp_min: int
+    xp_max: int
+    xp_gain_factor: float
+    xp_goal_base: int
+    cooldown: int
+    make_announcements: bool
+    level_up_message: str
+    role_change_message: str
+    leaderboard_max: int
+    curve: LevelCurve
+
+    @classmethod
+    def from_config(cls, data: dict):
+        xp_curve = data["xp_curve"]
+        curve = compile_curve(data["xp_goal_base"], xp_curve["type"], tuple(xp_curve["params"]),
+                              data["xp_gain_factor"])
+        return cls(curve=curve, **{field: data[field] for field in cls._fields if field != "curve"})
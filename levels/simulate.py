@@ -0,0 +1,138 @@
+"""
+Offline XP progression simulator for tuning guild settings.
+
+Members send messages as Poisson processes at their own hourly rate. A cooldown of ``c`` seconds turns a rate of
+``r`` messages per second into ``r / (1 + r * c)`` messages awarded XP per second, so each step draws how many XP
+messages every member sent, gives each one ``randint(xp_min, xp_max)`` plus the curve's bonus for the member's level
+like ``_process_xp`` does, and places the member's total XP on the compiled curve like ``LevelCurve.advance``. The
+bonus is taken at the level the member had at the start of the step. Nothing here reads or writes Config.
+"""
+from typing import NamedTuple
+
+from .curve import MAX_LEVEL, LevelCurve
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+SYNTHETIC = "synthetic"
+RECORDED = "recorded"
+PROFILES = (SYNTHETIC, RECORDED)
+
+MILESTONES = (1, 5, 10, 20, 30, 50, 75, 100)
+
+
+class SimulationResult(NamedTuple):
+    members: int
+    days: int
+    messages: int
+    xp_messages: int
+    milestones: list
+    reached: list
+    reach_days: list
+    levels: list
+
+
+def synthetic_rates(members: int, daily: int, zipf: float = 1.1):
+    """
+    Returns hourly message rates of members whose activity follows a Zipf distribution
+    """
+    weights = 1 / np.arange(1, members + 1) ** zipf
+    return daily / 24 * weights / weights.sum()
+
+
+def recorded_rates(message_counts: list, daily: int):
+    """
+    Returns hourly message rates spread like the stored message counts of a guild's members
+    """
+    weights = np.asarray(message_counts, dtype=np.float64) + 1
+    return daily / 24 * weights / weights.sum()
+
+
+def simulate(curve: LevelCurve, xp_min: int, xp_max: int, cooldown: int, rates, days: int, step_hours: float = 1.0,
+             milestones: tuple = MILESTONES, seed: int = None) -> SimulationResult:
+    """
+    Simulates days of activity for members sending messages at the given hourly rates
+    """
+    rng = np.random.default_rng(seed)
+    cumulative = np.asarray(curve.cumulative, dtype=np.int64)
+    bonus = np.asarray(curve.bonus, dtype=np.int64)
+    targets = np.asarray([level for level in milestones if level <= MAX_LEVEL], dtype=np.int64)
+
+    rates = np.asarray(rates, dtype=np.float64) / 3600
+    count = len(rates)
+    xp_rates = rates / (1 + rates * cooldown)
+    step = step_hours * 3600
+
+    total = np.zeros(count, dtype=np.int64)
+    level = np.zeros(count, dtype=np.int64)
+    reached_at = np.full((count, len(targets)), -1, dtype=np.int64)
+    members = np.arange(count)
+    steps = int(days * 24 / step_hours)
+    xp_messages = 0
+
+    for index in range(steps):
+        # Draw how many messages of each member got XP in this step
+        awarded = rng.poisson(xp_rates * step)
+        drawn = int(awarded.sum())
+        if drawn == 0:
+            continue
+        xp_messages += drawn
+
+        # Sum one randint per message for each member then add the level bonus of each message
+        gains = np.bincount(np.repeat(members, awarded), weights=rng.integers(xp_min, xp_max + 1, size=drawn),
+                            minlength=count).astype(np.int64)
+        total += gains + awarded * bonus[level]
+
+        # Place total XP on the curve
+        level = np.minimum(np.searchsorted(cumulative, total, side="right") - 1, MAX_LEVEL)
+
+        # Remember the first step each milestone was reached
+        new = (level[:, None] >= targets) & (reached_at < 0)
+        reached_at[new] = index + 1
+
+    # Expected count of every message sent, not only the ones awarded XP
+    messages = int(rates.sum() * steps * step)
+
+    reach_days = []
+    reached = []
+    for column in range(len(targets)):
+        steps_taken = reached_at[:, column][reached_at[:, column] >= 0]
+        reached.append(len(steps_taken))
+        reach_days.append(sorted(steps_taken * step_hours / 24))
+
+    return SimulationResult(members=count, days=days, messages=messages, xp_messages=xp_messages,
+                            milestones=targets.tolist(), reached=reached, reach_days=reach_days,
+                            levels=sorted(level.tolist(), reverse=True))
+
+
+def _percentile(values: list, fraction: float) -> float:
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def report(result: SimulationResult) -> str:
+    """
+    Formats time-to-level percentiles and the shape of the final leaderboard
+    """
+    lines = ["{} members, {} days: about {:,} messages, {:,} awarded XP".format(result.members, result.days,
+                                                                         result.messages, result.xp_messages),
+             "",
+             "{:<8}{:>10}{:>10}{:>10}{:>10}".format("level", "reached", "p10 days", "p50 days", "p90 days")]
+
+    for level, reached, days in zip(result.milestones, result.reached, result.reach_days):
+        if not reached:
+            lines.append("{:<8}{:>10}".format(level, "0%"))
+            continue
+
+        lines.append("{:<8}{:>10}{:>10.1f}{:>10.1f}{:>10.1f}".format(
+            level, "{:.0%}".format(reached / result.members), _percentile(days, 0.1), _percentile(days, 0.5),
+            _percentile(days, 0.9)))
+
+    levels = result.levels
+    lines.append("")
+    lines.append("leaderboard: #1 level {}, #10 level {}, #100 level {}, median level {}, {:.0%} still level 0".format(
+        levels[0], levels[min(9, len(levels) - 1)], levels[min(99, len(levels) - 1)], _percentile(levels, 0.5),
+        levels.count(0) / len(levels)))
+
+    return "\n".join(lines)
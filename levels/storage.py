@@ -0,0 +1,154 @@
+"""
+SQLite storage of member records.
+
+Members are rows of a local database in WAL mode, so a flush writes the dirty rows in one transaction instead of
+rewriting a Config blob per member, and a ``(guild_id, level DESC, exp DESC)`` index answers leaderboard and rank
+queries without reading the whole guild. Every query runs on one thread of its own, in the order it was made, so writes
+never block the event loop and a later write always lands after an earlier one.
+"""
+import asyncio
+import functools
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from . import record
+
+CONFIG = "config"
+SQLITE = "sqlite"
+BACKENDS = (CONFIG, SQLITE)
+
+COLUMNS = ("guild_id", "member_id") + record.FIELDS
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS members ("
+    "guild_id INTEGER NOT NULL, member_id INTEGER NOT NULL, exp INTEGER NOT NULL, level INTEGER NOT NULL, "
+    "last_trigger INTEGER NOT NULL, message_count INTEGER NOT NULL, message_with_xp INTEGER NOT NULL, "
+    "PRIMARY KEY (guild_id, member_id)) WITHOUT ROWID",
+    "CREATE INDEX IF NOT EXISTS members_rank ON members (guild_id, level DESC, exp DESC)"
+)
+
+# Statements are cached by their text, so each of these is only prepared once per connection
+SELECT = "SELECT {} FROM members".format(", ".join(COLUMNS))
+SELECT_MEMBER = SELECT + " WHERE guild_id = ? AND member_id = ?"
+UPSERT = "INSERT OR REPLACE INTO members ({}) VALUES ({})".format(", ".join(COLUMNS), ", ".join("?" * len(COLUMNS)))
+DELETE_MEMBER = "DELETE FROM members WHERE guild_id = ? AND member_id = ?"
+DELETE_GUILD = "DELETE FROM members WHERE guild_id = ?"
+DELETE_ALL = "DELETE FROM members"
+COUNT = "SELECT COUNT(*) FROM members WHERE guild_id = ?"
+TOP = ("SELECT member_id, level, exp FROM members WHERE guild_id = ? "
+       "ORDER BY level DESC, exp DESC, member_id LIMIT ? OFFSET ?")
+RANK = ("SELECT COUNT(*) FROM members WHERE guild_id = ? "
+        "AND (level > ? OR (level = ? AND (exp > ? OR (exp = ? AND member_id < ?))))")
+
+
+class SqliteStore:
+    """
+    Member records in a SQLite database at ``path``.
+
+    Reads return the in-memory fields of ``record``. Rows are copied when a write is made, so the records can keep
+    changing while it runs.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._connection = None
+
+    async def _run(self, func, *args):
+        return await asyncio.get_event_loop().run_in_executor(self._executor, functools.partial(func, *args))
+
+    def _open(self):
+        self._connection = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+
+        # With WAL, a crash can only lose the last transactions, never corrupt the database
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        with self._connection:
+            for statement in SCHEMA:
+                self._connection.execute(statement)
+
+    async def open(self):
+        await self._run(self._open)
+
+    def _close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    async def close(self):
+        await self._run(self._close)
+        self._executor.shutdown(wait=False)
+
+    def _load_all(self) -> dict:
+        guilds = {}
+        for row in self._connection.execute(SELECT):
+            guilds.setdefault(row[0], {})[row[1]] = dict(zip(record.FIELDS, row[2:]))
+        return guilds
+
+    async def load_all(self) -> dict:
+        """
+        Returns the records of every stored member by guild ID then member ID
+        """
+        return await self._run(self._load_all)
+
+    def _get(self, guild_id: int, member_id: int):
+        row = self._connection.execute(SELECT_MEMBER, (guild_id, member_id)).fetchone()
+        return None if row is None else dict(zip(record.FIELDS, row[2:]))
+
+    async def get(self, guild_id: int, member_id: int):
+        """
+        Returns the record of a member or None if it isn't stored
+        """
+        return await self._run(self._get, guild_id, member_id)
+
+    def _write(self, rows: list):
+        with self._connection:
+            self._connection.executemany(UPSERT, rows)
+
+    async def write(self, members):
+        """
+        Stores ``(guild_id, member_id, data)`` records in a single transaction
+        """
+        rows = [(guild_id, member_id, *(data[field] for field in record.FIELDS)) for guild_id, member_id, data in members]
+        if rows:
+            await self._run(self._write, rows)
+
+    def _execute(self, statement: str, parameters: tuple):
+        with self._connection:
+            self._connection.execute(statement, parameters)
+
+    async def delete(self, guild_id: int, member_id: int):
+        await self._run(self._execute, DELETE_MEMBER, (guild_id, member_id))
+
+    async def delete_guild(self, guild_id: int):
+        await self._run(self._execute, DELETE_GUILD, (guild_id,))
+
+    async def clear(self):
+        await self._run(self._execute, DELETE_ALL, ())
+
+    def _fetch(self, statement: str, parameters: tuple) -> list:
+        return self._connection.execute(statement, parameters).fetchall()
+
+    async def count(self, guild_id: int) -> int:
+        return (await self._run(self._fetch, COUNT, (guild_id,)))[0][0]
+
+    async def top(self, guild_id: int, start: int, count: int) -> list:
+        """
+        Returns ``(member_id, level, exp)`` of count members from the zero-based rank start, read from the index
+        """
+        return await self._run(self._fetch, TOP, (guild_id, count, start))
+
+    async def rank(self, guild_id: int, member_id: int):
+        """
+        Returns the one-based rank of a member or None if it isn't stored
+
+        Members ranked above it are counted from the index, ties are broken by member ID like the leaderboard.
+        """
+        data = await self.get(guild_id, member_id)
+        if data is None:
+            return None
+
+        level, exp = data[record.LEVEL], data[record.EXP]
+        above = await self._run(self._fetch, RANK, (guild_id, level, level, exp, exp, member_id))
+        return above[0][0] + 1
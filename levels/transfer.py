@@ -0,0 +1,139 @@
+"""
+Streaming export and import of member records.
+
+Exports are written in chunks either as JSONL, a header line then one member per line, or as a packed binary file,
+a header then one fixed-size record per member. Imports read those two formats and the dumps of other levelers back
+as ``(member_id, fields)`` pairs, where fields are the stored fields of ``record``, one member at a time.
+"""
+import json
+import struct
+
+from . import record
+
+JSONL = "jsonl"
+BINARY = "binary"
+LEVELER = "leveler"
+MEE6 = "mee6"
+EXPORT_FORMATS = (JSONL, BINARY)
+IMPORT_FORMATS = (JSONL, BINARY, LEVELER, MEE6)
+EXTENSIONS = {JSONL: "jsonl", BINARY: "lvl"}
+
+# Magic, format version and guild ID then member ID, exp, level, last trigger, message count and message with xp
+MAGIC = b"LVLS"
+HEADER = struct.Struct("<4sBQ")
+RECORD = struct.Struct("<QqHIII")
+UINT32_MAX = 2 ** 32 - 1
+
+
+class TransferError(Exception):
+    pass
+
+
+def header(fmt: str, guild_id: int) -> bytes:
+    if fmt == BINARY:
+        return HEADER.pack(MAGIC, record.VERSION, guild_id)
+    return (json.dumps({"format": "levels", "version": record.VERSION, "guild_id": guild_id}) + "\n").encode()
+
+
+def dump(fmt: str, members: list) -> bytes:
+    """
+    Serializes a chunk of ``(member_id, fields)`` pairs
+    """
+    if fmt == BINARY:
+        return b"".join(RECORD.pack(member_id, data[record.EXP], data[record.LEVEL],
+                                    min(int(data[record.LAST_TRIGGER]), UINT32_MAX),
+                                    min(data[record.MESSAGE_COUNT], UINT32_MAX),
+                                    min(data[record.MESSAGE_WITH_XP], UINT32_MAX))
+                        for member_id, data in members)
+
+    return "".join(json.dumps(dict(data, member_id=member_id)) + "\n" for member_id, data in members).encode()
+
+
+def _fields(exp=0, level=0, last_trigger=0, message_count=0, message_with_xp=0) -> dict:
+    return {record.EXP: int(exp), record.LEVEL: int(level), record.LAST_TRIGGER: int(last_trigger),
+            record.MESSAGE_COUNT: int(message_count), record.MESSAGE_WITH_XP: int(message_with_xp)}
+
+
+def read_jsonl(file, guild_id: int):
+    """
+    Reads a JSONL export, the guild it came from doesn't matter
+    """
+    first = json.loads(file.readline() or "{}")
+    if first.get("format") != "levels":
+        raise TransferError("This isn't a levels export")
+
+    for line in file:
+        if line.strip():
+            data = json.loads(line)
+            yield int(data["member_id"]), _fields(**{field: data.get(field, 0) for field in record.FIELDS})
+
+
+def read_binary(file, guild_id: int):
+    """
+    Reads a packed binary export
+    """
+    magic, version, _ = HEADER.unpack(file.read(HEADER.size).ljust(HEADER.size, b"\0"))
+    if magic != MAGIC:
+        raise TransferError("This isn't a levels binary export")
+    if version != record.VERSION:
+        raise TransferError("Binary exports of version {} aren't supported".format(version))
+
+    while True:
+        chunk = file.read(RECORD.size * 1024)
+        if len(chunk) % RECORD.size:
+            raise TransferError("The binary export is truncated")
+        if not chunk:
+            return
+
+        for member_id, exp, level, last_trigger, message_count, message_with_xp in RECORD.iter_unpack(chunk):
+            yield member_id, _fields(exp, level, last_trigger, message_count, message_with_xp)
+
+
+def read_leveler(file, guild_id: int):
+    """
+    Reads the users collection of AznStevy's V2 Leveler, as a mongoexport dump or a JSON array
+
+    Users keep their level and current XP on the guild, totals and other guilds are left out.
+    """
+    first = file.read(1)
+    while first.isspace():
+        first = file.read(1)
+
+    if first == "[":
+        users = json.loads(first + file.read())
+    else:
+        users = (json.loads(line) for line in _lines(first, file) if line.strip())
+
+    for user in users:
+        server = user.get("servers", {}).get(str(guild_id))
+        if server is None:
+            continue
+        yield int(user["user_id"]), _fields(exp=server.get("current_exp", 0), level=server.get("level", 0))
+
+
+def read_mee6(file, guild_id: int):
+    """
+    Reads a Mee6-style leaderboard with a ``players`` list, like the pages of Mee6's leaderboard API
+
+    ``detailed_xp`` holds the XP into the current level, players without it start their level from 0.
+    """
+    data = json.load(file)
+    players = data["players"] if isinstance(data, dict) else data
+
+    for player in players:
+        detailed_xp = player.get("detailed_xp") or [0]
+        yield int(player["id"]), _fields(exp=detailed_xp[0], level=player.get("level", 0),
+                                         message_count=player.get("message_count", 0))
+
+
+def _lines(first: str, file):
+    yield first + file.readline()
+    yield from file
+
+
+READERS = {
+    JSONL: read_jsonl,
+    BINARY: read_binary,
+    LEVELER: read_leveler,
+    MEE6: read_mee6
+}
@@ -0,0 +1,267 @@
+"""
+Rolling XP totals of the last 24 hours, 7 days and 30 days.
+
+Each member active in the last 30 days has one array of 24 hourly buckets, 30 daily buckets, the three window totals
+and the totals they're ranked at. XP is added to the current hour and day and to every total in O(1), and the member is
+only marked as pending: rank indexes catch up with pending members when a window is read, so a member sending many
+messages between two reads moves once. Totals are kept up to date by subtracting buckets as they leave their window,
+which only visits the members that gained XP in those buckets. The 24 hour window moves by the hour, the 7 and 30 day
+ones by the day (UTC).
+"""
+import struct
+from array import array
+
+from .ranking import RankIndex
+
+DAY = "day"
+WEEK = "week"
+MONTH = "month"
+WINDOWS = (DAY, WEEK, MONTH)
+LABELS = {DAY: "24 hours", WEEK: "7 days", MONTH: "30 days"}
+
+HOUR_SECONDS = 3600
+DAY_SECONDS = 86400
+HOURS = 24
+DAYS = 30
+WEEK_DAYS = 7
+
+# Layout of a member's array: hourly buckets, daily buckets, the total of each window then the ranked totals
+DAILY = HOURS
+TOTALS = HOURS + DAYS
+TOTAL = {DAY: TOTALS, WEEK: TOTALS + 1, MONTH: TOTALS + 2}
+RANKED = {window: slot + len(WINDOWS) for window, slot in TOTAL.items()}
+SIZE = TOTALS + 2 * len(WINDOWS)
+
+# Buckets and totals are unsigned 32 bit, every one of them is at most the 30 day total which is kept under this
+MAX_XP = 2 ** 32 - 1
+
+# Guild ID, current hour, current day and member count then member ID and its array for each member
+GUILD = struct.Struct("<QqqI")
+MEMBER = struct.Struct("<Q")
+
+
+class WindowCounters:
+    """
+    A guild's rolling XP totals, each window ranked highest first.
+    """
+
+    def __init__(self, now: float):
+        self.reset(now)
+
+    def reset(self, now: float):
+        self.hour = int(now // HOUR_SECONDS)
+        self.day = int(now // DAY_SECONDS)
+        self.buffers = {}
+        self.hourly = [set() for _ in range(HOURS)]
+        self.daily = [set() for _ in range(DAYS)]
+        self.indexes = {window: RankIndex() for window in WINDOWS}
+        self.pending = set()
+
+    def __len__(self):
+        return len(self.buffers)
+
+    def add(self, member_id: int, xp: int, now: float):
+        """
+        Counts XP gained by a member now, up to what the 30 day total can still hold
+        """
+        self.advance(now)
+        if xp <= 0:
+            return
+
+        buffer = self.buffers.get(member_id)
+        if buffer is None:
+            buffer = self.buffers[member_id] = array("I", bytes(4 * SIZE))
+
+        xp = min(xp, MAX_XP - buffer[TOTAL[MONTH]])
+        if not xp:
+            return
+
+        hour = self.hour % HOURS
+        day = self.day % DAYS
+        buffer[hour] += xp
+        buffer[DAILY + day] += xp
+        self.hourly[hour].add(member_id)
+        self.daily[day].add(member_id)
+
+        for window in WINDOWS:
+            buffer[TOTAL[window]] += xp
+        self.pending.add(member_id)
+
+    def advance(self, now: float):
+        """
+        Subtracts the buckets that left their window since the last call
+        """
+        hour = int(now // HOUR_SECONDS)
+        day = int(now // DAY_SECONDS)
+
+        # Nothing is left in any window
+        if day - self.day >= DAYS:
+            self.reset(now)
+            return
+
+        # Hours past the 24 hour window, the slot of hour h last held hour h - 24
+        if hour > self.hour:
+            for passed in range(max(self.hour + 1, hour - HOURS + 1), hour + 1):
+                self._expire(DAY, self.hourly[passed % HOURS], passed % HOURS, clear=True)
+            self.hour = hour
+
+        # Day d - 7 leaves the 7 day window, then the slot of day d that last held day d - 30 is emptied
+        if day > self.day:
+            for passed in range(self.day + 1, day + 1):
+                week_slot = (passed - WEEK_DAYS) % DAYS
+                self._expire(WEEK, self.daily[week_slot], DAILY + week_slot, clear=False)
+                self._expire(MONTH, self.daily[passed % DAYS], DAILY + passed % DAYS, clear=True)
+            self.day = day
+
+            # Let go of members with nothing left in the last 30 days
+            self.sync()
+
+    def _expire(self, window: str, members: set, slot: int, clear: bool):
+        for member_id in list(members):
+            buffer = self.buffers[member_id]
+            xp = buffer[slot]
+            if xp:
+                buffer[TOTAL[window]] -= xp
+                self.pending.add(member_id)
+
+            if clear:
+                buffer[slot] = 0
+                members.discard(member_id)
+
+    def sync(self):
+        """
+        Moves pending members to the rank of their current totals
+        """
+        for member_id in self.pending:
+            buffer = self.buffers[member_id]
+
+            for window in WINDOWS:
+                total = buffer[TOTAL[window]]
+                ranked = buffer[RANKED[window]]
+                if total == ranked:
+                    continue
+
+                index = self.indexes[window]
+                if ranked:
+                    index.remove((-ranked, member_id))
+                if total:
+                    index.insert((-total, member_id))
+                buffer[RANKED[window]] = total
+
+            # Nothing left in the last 30 days
+            if buffer[TOTAL[MONTH]] == 0:
+                del self.buffers[member_id]
+
+        self.pending.clear()
+
+    def discard(self, member_id: int):
+        """
+        Forgets a member's XP in every window
+        """
+        buffer = self.buffers.pop(member_id, None)
+        if buffer is None:
+            return
+
+        for window in WINDOWS:
+            if buffer[RANKED[window]]:
+                self.indexes[window].remove((-buffer[RANKED[window]], member_id))
+        for members in self.hourly + self.daily:
+            members.discard(member_id)
+        self.pending.discard(member_id)
+
+    def count(self, window: str) -> int:
+        """
+        Returns how many members gained XP in the window
+        """
+        self.sync()
+        return len(self.indexes[window])
+
+    def total(self, window: str, member_id: int) -> int:
+        buffer = self.buffers.get(member_id)
+        return 0 if buffer is None else buffer[TOTAL[window]]
+
+    def rank(self, window: str, member_id: int):
+        """
+        Returns the one-based rank of a member in the window or None if they gained no XP in it
+        """
+        self.sync()
+        total = self.total(window, member_id)
+        if not total:
+            return None
+
+        return self.indexes[window].rank((-total, member_id)) + 1
+
+    def page(self, window: str, start: int, count: int) -> list:
+        """
+        Returns ``(member_id, xp)`` pairs of count members from the zero-based rank start
+        """
+        self.sync()
+        return [(member_id, -total) for total, member_id in self.indexes[window].slice(start, count)]
+
+    def dump(self, guild_id: int) -> bytes:
+        chunks = [GUILD.pack(guild_id, self.hour, self.day, len(self.buffers))]
+        for member_id, buffer in self.buffers.items():
+            chunks.append(MEMBER.pack(member_id))
+            chunks.append(buffer.tobytes())
+        return b"".join(chunks)
+
+    @classmethod
+    def load(cls, data: memoryview, offset: int, now: float):
+        """
+        Reads the counters dumped at offset then catches them up with now and returns them with the end offset
+        """
+        guild_id, hour, day, members = GUILD.unpack_from(data, offset)
+        offset += GUILD.size
+        counters = cls(0)
+        counters.hour = hour
+        counters.day = day
+        width = 4 * SIZE
+
+        for _ in range(members):
+            member_id, = MEMBER.unpack_from(data, offset)
+            offset += MEMBER.size
+            buffer = array("I")
+            buffer.frombytes(data[offset:offset + width])
+            offset += width
+
+            # Members whose last XP expired just before the dump
+            if not buffer[TOTAL[MONTH]]:
+                continue
+            counters.buffers[member_id] = buffer
+
+            # Rebuild the bucket sets and rank indexes from the array
+            for slot in range(HOURS):
+                if buffer[slot]:
+                    counters.hourly[slot].add(member_id)
+            for slot in range(DAYS):
+                if buffer[DAILY + slot]:
+                    counters.daily[slot].add(member_id)
+            for window in WINDOWS:
+                buffer[RANKED[window]] = buffer[TOTAL[window]]
+                if buffer[TOTAL[window]]:
+                    counters.indexes[window].insert((-buffer[TOTAL[window]], member_id))
+
+        counters.advance(now)
+        return guild_id, counters, offset
+
+
+def dump_all(counters: dict) -> bytes:
+    """
+    Serializes the counters of every guild
+    """
+    return b"".join(guild_counters.dump(guild_id) for guild_id, guild_counters in counters.items())
+
+
+def load_all(data: bytes, now: float) -> dict:
+    """
+    Reads the counters of every guild
+    """
+    view = memoryview(data)
+    counters = {}
+    offset = 0
+
+    while offset < len(view):
+        guild_id, guild_counters, offset = WindowCounters.load(view, offset, now)
+        counters[guild_id] = guild_counters
+
+    return counters
@@ -1,11 +1,25 @@
 from redbot.core import commands, Config, checks
 from redbot.core.bot import Red
 from redbot.core.commands import Context
+from redbot.core.data_manager import cog_data_path
 from random import randint
 from datetime import datetime
+import asyncio
 import discord
+import functools
+import itertools
 import time
+from operator import itemgetter
 import logging
+from . import eventlog, integrity, record, recompute, transfer, windows
+from .curve import MAX_LEVEL
+from .pages import PageCache, page_count
+from .perf import ANNOUNCEMENT, COOLDOWN, LEVEL_ROLE, MEMBER_FETCH, PROCESS_XP, VALIDATION
+from .ranking import Leaderboard
+from .reconcile import RoleReconciler
+from .roles import RoleMap
+from .settings import GuildSettings
+from .storage import SQLITE, SqliteStore
 
 log = logging.getLogger("X")  # Thanks to Sinbad for the example code for logging
 log.setLevel(logging.DEBUG)
@@ -18,49 +32,79 @@ else:
     console.setLevel(logging.INFO)
 log.addHandler(console)
 
+# Red 3.1 only dispatches events to listeners marked as such, Red 3.0 to every method with the event's name
+listener = getattr(getattr(commands, "Cog", object), "listener", None)
+if listener is None:
+    def listener(name=None):
+        return lambda func: func
+
+
 class X:
 
+    @listener()
     async def on_message(self, message: discord.Message):
 
-        # Checks if bots, dms, and red commands
-        if not await self._is_valid_message(message):
+        # Start timing stages if enabled
+        perf = self._perf
+        stage = perf.start()
+
+        # Checks if bots, dms, ignored channels and red commands
+        valid = self._is_valid_message(message)
+        perf.record(VALIDATION, stage)
+        if not valid:
             return
 
+        # Hand it to the worker of the member's shard without waiting for it
+        self._actors.submit(message.guild.id, message.author.id, message)
+
+    async def _handle_message(self, message: discord.Message):
+        """
+        Processes a valid message in the worker of the member's shard
+
+        Messages of a member are handled one at a time in the order they were sent, so updates can't interleave.
+        """
+        perf = self._perf
+        stage = perf.start()
+
         # Gets configuration data and circumstancial data
         member = message.author
         guild = message.guild
         channel = message.channel
 
-        guild_config = await self._get_guild_config(guild)
-        member_data = await self._get_member_data(guild_config=guild_config, member=member)
+        settings = await self._get_settings(guild)
+        member_data = await self._get_member_data(settings=settings, member=member)
+        stage = perf.record(MEMBER_FETCH, stage)
 
         message_count = await member_data.get_raw(self.MESSAGE_COUNT)
         await member_data.set_raw(self.MESSAGE_COUNT, value=message_count + 1)
 
-        last_trigger = await member_data.get_raw(self.LAST_TRIGGER)
-        curr_time = time.time()
-        cooldown = await guild_config.get_raw(self.COOLDOWN)
-
-        # Checks difference between last message and new message and the cooldown
-        if curr_time - last_trigger <= cooldown:
+        # Checks the member's cooldown in the in-memory table
+        now = time.monotonic()
+        cooling_down = self._cooldowns.is_cooling(guild.id, member.id, now)
+        stage = perf.record(COOLDOWN, stage)
+        if cooling_down:
             return
 
-        old_role = await member_data.get_raw(self.ROLE_NAME)
+        old_level = await member_data.get_raw(self.LEVEL)
 
         # Process XP then returns True or False to trigger next phase
-        level_up = await self._process_xp(guild_config=guild_config,
+        level_up = await self._process_xp(settings=settings,
                                           member_data=member_data,
                                           member=member)
+        self._cooldowns.trigger(guild.id, member.id, settings.cooldown, now)
+        stage = perf.record(PROCESS_XP, stage)
 
         # Checks if level_up is True and if it's supposed to send announcements then does it
-        if level_up and await self.config.guild(guild).make_announcements():
+        if level_up and settings.make_announcements:
 
             # Debug log if it fails at any point
             log.debug("Send level up announcement!")
 
-            # Get member data
+            # Get member data, roles are derived from the levels
             level = await member_data.get_raw(self.LEVEL)
-            new_role = await member_data.get_raw(self.ROLE_NAME)
+            role_map = await self._get_role_map(guild)
+            old_role = role_map.name(old_level, self.DEFAULT_ROLE)
+            new_role = role_map.name(level, self.DEFAULT_ROLE)
 
             # Message variables for custom messages
             message_variables = {
@@ -72,58 +116,23 @@ class X:
             }
 
             # Builds message from custom message
-            level_up_message = (await guild_config.get_raw(self.LEVEL_UP_MESSAGE)).format(**message_variables)
+            level_up_message = settings.level_up_message.format(**message_variables)
 
             # If old and new roles are different then send it
             if old_role != new_role:
-                level_up_message += (await guild_config.get_raw(self.ROLE_CHANGE_MESSAGE)).format(**message_variables)
+                level_up_message += settings.role_change_message.format(**message_variables)
 
-            # If custom message is not empty, send it
+            # If custom message is not empty, queue it without waiting for it to be sent
             if level_up_message != "":
-                await channel.send(level_up_message)
-
-    async def _is_valid_message(self, message: discord.Message): # Checks if message is a user message
-
-        # If bot
-        if message.author.bot:
-            return False
+                self._announcer.announce(channel, level_up_message)
 
-        # If private
-        if not message.guild:
-            return False
-
-        # If XP tracking is off
-        guild_config = await self._get_guild_config(message.guild)
-        if not await guild_config.get_raw(self.ACTIVE):
-            return False
+            perf.record(ANNOUNCEMENT, stage)
 
-        # If channel is ignored
-        channel_config = await self._get_channel_config(message.channel)
-        if await channel_config.get_raw(self.IGNORED_CHANNEL):
-            return False
-
-        # If message starts by prefix (to ignore red command)
-        prefixes = await Config.get_core_conf().prefix()
-        for prefix in prefixes:
-            if message.content.startswith(prefix):
-                return False
-
-        # Else True
-        return True
-
-    async def on_member_update(self, before: discord.Member, after: discord.Member):
-
-        # Handles nickname and username changes
-        if before.display_name == after.display_name:
-            return
-
-        # Get data
-        guild = before.guild
-        guild_config = self.config.guild(guild)
-        member_data = await self._get_member_data(guild_config=guild_config, member=before)
-
-        # Set new username
-        await member_data.set_raw(self.USERNAME, value=after.display_name)
+    def _is_valid_message(self, message: discord.Message):  # Checks if message is a user message
+        """
+        Bots, DMs, inactive guilds, ignored channels and red commands are filtered by the in-memory gate
+        """
+        return self._gate.accepts(message)
 
     async def _get_channel_config(self, channel: discord.TextChannel):
         """
@@ -137,28 +146,38 @@ class X:
         """
         return self.config.guild(guild)
 
+    async def _get_settings(self, guild: discord.Guild) -> GuildSettings:
+        """
+        The guild's settings are read once into an immutable snapshot shared by the whole XP pipeline
+        """
+        settings = self._settings.get(guild.id)
+
+        if settings is None:
+            self._perf.reads += 1
+            settings = GuildSettings.from_config(await self.config.guild(guild).all())
+            self._settings[guild.id] = settings
+
+        return settings
+
+    def _invalidate_settings(self, guild: discord.Guild):
+        """
+        Drops the guild's settings snapshot so the next message reads the new values
+        """
+        self._settings.pop(guild.id, None)
+
     async def _get_member_data(self, **kwargs):
         """
         Each member is represented by a document inside the guild's collection
+
+        The document is served from the member cache and written back to Config by the flush loop. New members get
+        their whole record at once and it goes out with the next flush as a single write.
         """
-        guild_config = kwargs[self.GUILD_CONFIG]
         member = kwargs[self.MEMBER]
-        member_data = self.config.member(member)
-
-        if await member_data.get_raw(self.MEMBER_ID) == self.DEFAULT_ID:
-            new_member = {
-                self.MEMBER_ID: str(member.id),
-                self.USERNAME: member.display_name,
-                self.ROLE_NAME: self.DEFAULT_ROLE,
-                self.EXP: 0,
-                self.LEVEL: 0,
-                self.GOAL: await guild_config.xp_goal_base(),
-                self.LAST_TRIGGER: 0,
-                self.MESSAGE_COUNT: 0,
-                self.MESSAGE_WITH_XP: 0
-            }
-            for k, v in new_member.items():
-                await member_data.set_raw(k, value=v)
+        member_data = await self._members.get(member.guild.id, member.id)
+
+        if not member_data.tracked:
+            member_data.track(record.new())
+            self._update_rank(member_data)
 
         return member_data
 
@@ -168,11 +187,490 @@ class X:
         """
         return await (await self._get_guild_config(guild)).get_raw(self.GUILD_ROLES)
 
-    async def _get_members(self, guild: discord.Guild = None):
+    async def _get_members(self, guild: discord.Guild):
         """
         This gets all the members that have been active and therefore added to the database.
         """
-        return await self.config.all_members(guild)
+        # Wait for the bulk load so the cache holds every stored member
+        await self._ready.wait()
+
+        # Skip entries that were only looked up and never initialized
+        return {str(member_id): entry.data for member_id, entry in self._members.members(guild.id).items()
+                if entry.tracked}
+
+    async def _flush_loop(self):
+        """
+        Preloads the message gate and member cache then periodically writes dirty members back to Config
+        """
+        # Get the backpressure policy of the message queues and when to offload heavy work
+        self._actors.policy = await self.config.get_raw(self.QUEUE_POLICY)
+        self._actors.max_depth = await self.config.get_raw(self.QUEUE_SIZE)
+        self._offload_threshold = await self.config.get_raw(self.OFFLOAD_THRESHOLD)
+
+        # Read members from the SQLite store when it's the one in use
+        if await self.config.get_raw(self.STORAGE) == SQLITE:
+            await self._open_store()
+
+        await self._load_windows()
+        await self._load_gate()
+        await self._members.load_all()
+
+        # Build the leaderboards and restore cooldowns before anything waiting on the load gets to run
+        try:
+            await self._build_ranks()
+            await self._restore_cooldowns()
+        finally:
+            self._ready.set()
+
+        # Rewrite members stored in the legacy format once, they're served from the cache meanwhile
+        if self._members.legacy:
+            try:
+                migrated = await self._members.migrate()
+                log.info("Migrated {} members to compact records".format(migrated))
+            except Exception:
+                log.exception("Failed to migrate members to compact records, the next load tries again")
+
+        # Start the event log with a snapshot of everything loaded, replays can start from there
+        await self._open_events()
+
+        while True:
+            # Get how long unflushed data may wait
+            flush_interval = await self.config.get_raw(self.FLUSH_INTERVAL)
+            await asyncio.sleep(flush_interval)
+
+            # A failing tick is logged and the next one tries again
+            try:
+                await self._tick()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.exception("Flush loop tick failed")
+
+    async def _tick(self):
+        """
+        Writes dirty members and events back then runs the periodic upkeep
+        """
+        await self._members.flush()
+        await self._flush_events()
+
+        # Evict cooldowns of guilds that went quiet since their last trigger
+        self._cooldowns.sweep(time.monotonic())
+
+        # Pick up prefix changes made since the last tick
+        self._gate.compile_prefixes(await Config.get_core_conf().prefix())
+
+        # Rank members who gained XP since the last tick so reading a window only moves a few of them
+        for counters in list(self._windows.values()):
+            counters.sync()
+            await asyncio.sleep(0)
+
+        # Check and repair the member data of every guild now and then
+        check_interval = await self.config.get_raw(self.CHECK_INTERVAL)
+        if check_interval and time.monotonic() - self._checked >= check_interval * 3600:
+            await self._check_all()
+
+        # Save the XP windows now and then, they're rebuilt from that file after a restart
+        if time.monotonic() - self._windows_saved >= self.WINDOWS_SAVE_INTERVAL:
+            data = windows.dump_all(self._windows)
+            await asyncio.get_event_loop().run_in_executor(None, self._save_windows, data)
+
+        # Snapshot the event log now and then so replays don't go through every event since it started
+        if time.monotonic() - self._events_snapshot >= self.EVENTS_SNAPSHOT_INTERVAL:
+            await self._snapshot_events()
+
+    async def _open_store(self):
+        """
+        Opens the SQLite store for the member cache
+        """
+        store = SqliteStore(cog_data_path(self) / self.SQLITE_FILE)
+
+        try:
+            await store.open()
+        except Exception:
+            log.exception("Failed to open the SQLite store, members are read from and written to Config instead")
+            return
+
+        self._members.store = store
+
+    async def _switch_storage(self, backend: str) -> int:
+        """
+        Moves every member to the backend, config or sqlite, then makes it the one in use and returns how many moved
+        """
+        await self._ready.wait()
+        old = self._members.store
+        store = None
+
+        if backend == SQLITE:
+            store = SqliteStore(cog_data_path(self) / self.SQLITE_FILE)
+            await store.open()
+
+        count = await self._members.switch(store)
+        await self.config.set_raw(self.STORAGE, value=backend)
+        if old is not None:
+            await old.close()
+
+        return count
+
+    async def _load_gate(self):
+        """
+        Fills the message gate and the settings snapshots from bulk Config reads
+        """
+        self._gate.compile_prefixes(await Config.get_core_conf().prefix())
+
+        # Get ignored channels
+        for channel_id, channel_data in (await self.config.all_channels()).items():
+            self._gate.set_ignored(int(channel_id), channel_data[self.IGNORED_CHANNEL])
+
+        # Get inactive guilds and settings while at it
+        for guild_id, guild_data in (await self.config.all_guilds()).items():
+            self._gate.set_active(int(guild_id), guild_data[self.ACTIVE])
+            self._settings.setdefault(int(guild_id), GuildSettings.from_config(guild_data))
+
+    def _windows_path(self):
+        return cog_data_path(self) / self.WINDOWS_FILE
+
+    async def _load_windows(self):
+        """
+        Reads the XP windows saved by the last run and moves them up to now
+        """
+        path = self._windows_path()
+        if not path.exists():
+            return
+
+        try:
+            data = await asyncio.get_event_loop().run_in_executor(None, path.read_bytes)
+            loaded = await self._offload(len(data) // (windows.MEMBER.size + 4 * windows.SIZE), windows.load_all,
+                                         data, time.time())
+        except Exception:
+            log.exception("Failed to load the XP windows, they start over empty")
+            return
+
+        # Count XP gained while the file was read on top of it
+        now = time.time()
+        for guild_id, counters in self._windows.items():
+            saved = loaded.setdefault(guild_id, counters)
+            if saved is not counters:
+                for member_id in counters.buffers:
+                    saved.add(member_id, counters.total(windows.MONTH, member_id), now)
+
+        self._windows = loaded
+
+    def _save_windows(self, data: bytes):
+        """
+        Writes dumped XP windows to the data folder, replacing the file at once so a crash can't leave half of it
+        """
+        self._windows_saved = time.monotonic()
+        path = self._windows_path()
+        temporary = path.with_suffix(".tmp")
+
+        try:
+            temporary.write_bytes(data)
+            temporary.replace(path)
+        except OSError:
+            log.exception("Failed to save the XP windows")
+
+    def _log_event(self, kind: int, member_data, delta: int = 0, now: float = None):
+        """
+        Buffers an event with the member's record after a change, the flush loop writes it to the event log
+        """
+        self._events.append(kind, member_data.guild_id, member_data.member_id, member_data.data, delta,
+                            time.time() if now is None else now)
+
+    async def _open_events(self):
+        """
+        Opens the event log in the data folder then snapshots it
+        """
+        try:
+            await asyncio.get_event_loop().run_in_executor(None, self._events.open,
+                                                           cog_data_path(self) / self.EVENTS_FOLDER)
+        except OSError:
+            log.exception("Failed to open the XP event log")
+            return
+
+        await self._snapshot_events()
+
+    def _write_events(self, data: bytes) -> bool:
+        """
+        Appends taken events to the event log and returns whether it worked
+        """
+        try:
+            self._events.flush(data)
+        except OSError:
+            log.exception("Failed to write the XP event log")
+            return False
+
+        return True
+
+    async def _flush_events(self):
+        """
+        Writes buffered events away from the event loop, they go back in front of the buffer if it fails
+        """
+        data = self._events.take()
+        if data and not await asyncio.get_event_loop().run_in_executor(None, self._write_events, data):
+            self._events.buffer[:0] = data
+
+    async def _snapshot_events(self):
+        """
+        Snapshots every cached record at the end of the event log then deletes the snapshots and segments older than
+        the retention
+
+        Events are flushed first so the snapshot follows them, records are copied a guild at a time.
+        """
+        self._events_snapshot = time.monotonic()
+        await self._flush_events()
+
+        records = []
+        for guild_id in list(self._members.guilds):
+            members = await self._snapshot(guild_id, self.LEVEL, self.EXP, self.MESSAGE_COUNT, self.MESSAGE_WITH_XP)
+            records.extend((guild_id, *member) for member in members)
+
+        loop = asyncio.get_event_loop()
+        try:
+            now = time.time()
+            await loop.run_in_executor(None, self._events.snapshot, now, records)
+            await loop.run_in_executor(None, self._events.compact, now, self.EVENTS_RETENTION)
+        except (OSError, eventlog.ReplayError):
+            log.exception("Failed to snapshot the XP event log")
+
+    async def _restore_cooldowns(self):
+        """
+        Carries cooldowns that were still running at the last flush over to the monotonic clock
+        """
+        wall_time = time.time()
+        now = time.monotonic()
+
+        for guild_id, members in list(self._members.guilds.items()):
+            # Guilds still on the default settings aren't in the bulk read of the message gate
+            settings = await self._get_settings(discord.Object(id=guild_id))
+
+            for member_id, entry in members.items():
+                if not entry.tracked:
+                    continue
+
+                remaining = entry.data[self.LAST_TRIGGER] + settings.cooldown - wall_time
+                if remaining > 0:
+                    self._cooldowns.set_expiry(guild_id, member_id, now + remaining)
+
+    def _get_leaderboard(self, guild_id: int) -> Leaderboard:
+        """
+        Each guild has an ordered index of its members by level and XP
+        """
+        leaderboard = self._ranks.get(guild_id)
+
+        if leaderboard is None:
+            leaderboard = self._ranks[guild_id] = Leaderboard()
+
+        return leaderboard
+
+    def _get_windows(self, guild_id: int) -> windows.WindowCounters:
+        """
+        Each guild has rolling XP totals, moved up to now whenever they're read
+        """
+        counters = self._windows.get(guild_id)
+
+        if counters is None:
+            counters = self._windows[guild_id] = windows.WindowCounters(time.time())
+        else:
+            counters.advance(time.time())
+
+        return counters
+
+    def _get_page_cache(self, guild_id: int, page_size: int) -> PageCache:
+        """
+        Each guild keeps the rendered pages of its leaderboard, all dropped when the page size changes
+        """
+        cache = self._pages.get(guild_id)
+
+        if cache is None or cache.page_size != page_size:
+            cache = self._pages[guild_id] = PageCache(page_size)
+
+        return cache
+
+    def _leaderboard_menu(self, guild: discord.Guild, line: str, page_size: int, cached: bool = False,
+                          window: str = None):
+        """
+        Returns the page render and page count functions of a guild's leaderboard menu
+
+        Each member gets a ``line`` formatted with number, ID, LVL, XP and COUNT, or number, ID and GAINED for the XP
+        gained in a window. Cached pages are reused until ranks shown on them change, so only the lifetime leaderboard
+        without per-message statistics should be cached.
+        """
+        def pages():
+            if window is not None:
+                return page_count(self._get_windows(guild.id).count(window), page_size)
+            return page_count(len(self._get_leaderboard(guild.id)), page_size)
+
+        def render(number: int):
+            cache = self._get_page_cache(guild.id, page_size) if cached else None
+            embed = cache.get(number) if cache is not None else None
+
+            if embed is None:
+                embed = self._leaderboard_page(guild, line, number, page_size, window)
+                if cache is not None:
+                    cache.put(number, embed)
+
+            # The page count changes with every member joining the leaderboard, so it's only set when sent
+            embed.set_footer(text="Page {} of {}".format(number + 1, pages()))
+            return embed
+
+        return render, pages
+
+    def _leaderboard_page(self, guild: discord.Guild, line: str, number: int, page_size: int,
+                          window: str = None) -> discord.Embed:
+        """
+        Internal method to format a zero-based page of the leaderboard embed
+        """
+        guild_members = self._members.members(guild.id)
+        start = number * page_size
+
+        # Start building Embed
+        embed = discord.Embed()
+        embed.set_author(name=guild.name + " Leaderboard")
+        embed.set_thumbnail(url=guild.icon_url)
+        embed.timestamp = datetime.utcnow()
+
+        # Windows only know the XP gained in them
+        if window is not None:
+            embed.set_author(name="{} Leaderboard - last {}".format(guild.name, windows.LABELS[window]))
+            embed.description = "\n".join(
+                line.format(number=i, ID=member_id, GAINED=gained)
+                for i, (member_id, gained) in enumerate(self._get_windows(guild.id).page(window, start, page_size),
+                                                        start + 1))
+            return embed
+
+        # Loop through the page's members to create member_list
+        member_list = []
+        for i, member_id in enumerate(self._get_leaderboard(guild.id).page(start, page_size), start + 1):
+            member = guild_members[member_id].data
+            member_list.append(line.format(number=i, ID=member_id, LVL=member[self.LEVEL],
+                                           XP=member[self.MESSAGE_WITH_XP], COUNT=member[self.MESSAGE_COUNT]))
+
+        embed.description = "\n".join(member_list)
+        return embed
+
+    async def _offload(self, size: int, func, *args):
+        """
+        Runs a heavy computation in the default executor once size reaches the offload threshold
+
+        The function must only work on snapshot copies of member data. Below the threshold it runs inline, since
+        handing it to a thread costs more than it saves.
+        """
+        if size < self._offload_threshold:
+            return func(*args)
+
+        return await asyncio.get_event_loop().run_in_executor(None, functools.partial(func, *args))
+
+    async def _snapshot(self, guild_id: int, *fields) -> list:
+        """
+        Copies fields of a guild's tracked members as ``(member_id, *values)`` tuples
+
+        Past the offload threshold, the copy is made a chunk at a time and lets the event loop run in between.
+        """
+        entries = list(self._members.members(guild_id).items())
+        offload = len(entries) >= self._offload_threshold
+        get = itemgetter(*fields)
+        snapshot = []
+
+        for start in range(0, len(entries), self.SNAPSHOT_CHUNK):
+            snapshot.extend((member_id, *get(entry.data)) for member_id, entry in entries[start:start + self.SNAPSHOT_CHUNK]
+                            if entry.tracked)
+            if offload:
+                await asyncio.sleep(0)
+
+        return snapshot
+
+    async def _build_ranks(self):
+        """
+        Indexes every cached member that has been initialized
+        """
+        for guild_id in list(self._members.guilds):
+            await self._build_guild_ranks(guild_id)
+
+    async def _build_guild_ranks(self, guild_id: int):
+        """
+        Indexes a guild's cached members from scratch
+
+        The index is built from a snapshot, off the event loop for large guilds, then members whose rank changed
+        meanwhile are moved before it replaces the current one. If another rebuild or a reset of the guild started in
+        the meantime, this one is out of date and thrown away.
+        """
+        generation = self._rank_generations[guild_id] = self._rank_generations.get(guild_id, 0) + 1
+        changed = self._rank_changes[guild_id] = set()
+
+        try:
+            snapshot = await self._snapshot(guild_id, self.LEVEL, self.EXP)
+            leaderboard = await self._offload(len(snapshot), Leaderboard.from_members, snapshot)
+        finally:
+            # A later rebuild has its own set
+            if self._rank_changes.get(guild_id) is changed:
+                del self._rank_changes[guild_id]
+
+        if self._rank_generations.get(guild_id) != generation:
+            await self._offload(len(leaderboard), leaderboard.clear)
+            return
+
+        # Catch up with members that earned XP or were reset while it was built
+        members = self._members.members(guild_id)
+        for member_id in changed:
+            entry = members.get(member_id)
+            if entry is not None and entry.tracked:
+                leaderboard.update(member_id, entry.data[self.LEVEL], entry.data[self.EXP])
+            else:
+                leaderboard.remove(member_id)
+
+        # Take the old one apart off the event loop too, freeing a large one at once would stall it
+        old = self._ranks.get(guild_id)
+        self._ranks[guild_id] = leaderboard
+        self._pages.pop(guild_id, None)
+        if old is not None:
+            await self._offload(len(old), old.clear)
+
+    def _drop_ranks(self, guild_id: int):
+        """
+        Drops a guild's leaderboard and its pages, rebuilds still running for it are thrown away
+        """
+        self._rank_generations[guild_id] = self._rank_generations.get(guild_id, 0) + 1
+        self._ranks.pop(guild_id, None)
+        self._pages.pop(guild_id, None)
+
+    def _update_rank(self, member_data):
+        """
+        Moves a member to its new place in the guild's leaderboard
+        """
+        leaderboard = self._get_leaderboard(member_data.guild_id)
+        member_id = member_data.member_id
+        level = member_data.data[self.LEVEL]
+        cache = self._pages.get(member_data.guild_id)
+
+        if cache is None:
+            leaderboard.update(member_id, level, member_data.data[self.EXP])
+        else:
+            # Drop the rendered pages where ranks changed
+            old_rank = leaderboard.rank(member_id)
+            old_level = leaderboard.level(member_id)
+            leaderboard.update(member_id, level, member_data.data[self.EXP])
+            cache.moved(old_rank, leaderboard.rank(member_id), old_level != level)
+
+        self._note_rank_change(member_data.guild_id, member_id)
+
+    def _remove_rank(self, guild_id: int, member_id: int):
+        """
+        Takes a member off the guild's leaderboard
+        """
+        leaderboard = self._get_leaderboard(guild_id)
+        cache = self._pages.get(guild_id)
+
+        if cache is not None:
+            cache.moved(leaderboard.rank(member_id), None)
+
+        leaderboard.remove(member_id)
+        self._note_rank_change(guild_id, member_id)
+
+    def _note_rank_change(self, guild_id: int, member_id: int):
+        # Remember it for a rebuild in progress
+        changed = self._rank_changes.get(guild_id)
+        if changed is not None:
+            changed.add(member_id)
 
     async def _process_xp(self, **kwargs):
         """
@@ -190,197 +688,384 @@ class X:
         translates into similar difficulty at low levels but reachable high levels.
         """
         # Get circumstancial data
-        guild_config = kwargs[self.GUILD_CONFIG]
+        settings = kwargs[self.SETTINGS]
         member_data = kwargs[self.MEMBER_DATA]
         member = kwargs[self.MEMBER]
 
         # Get configuration data
-        xp_min = await guild_config.get_raw(self.XP_MIN)
-        xp_max = await guild_config.get_raw(self.XP_MAX)
-        xp_gain_factor = await guild_config.get_raw(self.XP_GAIN_FACTOR)
-        xp_gain = randint(xp_min, xp_max)
-        message_xp = xp_gain + int(xp_gain_factor * (await member_data.get_raw(self.LEVEL)))
+        xp_gain = randint(settings.xp_min, settings.xp_max)
+        message_xp = xp_gain + settings.curve.bonus_xp(await member_data.get_raw(self.LEVEL))
         curr_xp = await member_data.get_raw(self.EXP)
 
-        # Get member data
+        # Get member data, the wall clock trigger only restores cooldowns after a restart and goes out with the flush
+        now = time.time()
         await member_data.set_raw(self.EXP, value=curr_xp + message_xp)
-        await member_data.set_raw(self.LAST_TRIGGER, value=time.time())
+        member_data.data[self.LAST_TRIGGER] = int(now)
+
+        # Count it in the rolling windows
+        self._get_windows(member.guild.id).add(member.id, message_xp, now)
 
         # Get message XP
         message_with_xp = await member_data.get_raw(self.MESSAGE_WITH_XP)
         await member_data.set_raw(self.MESSAGE_WITH_XP, value=message_with_xp + 1)
 
-        # If XP is higher than goal, return True for level up message
-        if await member_data.get_raw(self.EXP) >= await member_data.get_raw(self.GOAL):
+        # If XP is higher than the level's goal on the curve, return True for level up message
+        if await member_data.get_raw(self.EXP) >= settings.curve.goal(await member_data.get_raw(self.LEVEL)):
             log.debug("Leveled up!")
-            await self._level_up(member_data=member_data, member=member)
+            await self._level_up(settings=settings, member_data=member_data, member=member)
+            self._update_rank(member_data)
+            self._log_event(eventlog.MESSAGE, member_data, message_xp, now)
             return True
 
         # Return False to not have level up message
+        self._update_rank(member_data)
+        self._log_event(eventlog.MESSAGE, member_data, message_xp, now)
         return False
 
     async def _level_up(self, **kwargs):
+        """
+        Levels up as many times as the member's XP allows in one step and returns how many levels were gained
+        """
         # Separated for admin commands implementation
+        settings = kwargs[self.SETTINGS]
         member_data = kwargs[self.MEMBER_DATA]
         member = kwargs[self.MEMBER]
 
-        # Calculates left over XP from leveling and set XP
-        await self._level_xp(member_data=member_data)
-
-        # Updates level and sets it
-        await self._level_update(member_data=member_data, member=member)
-
-        # Calculates goal and sets it
-        await self._level_goal(member_data=member_data)
-
-    async def _level_xp(self, **kwargs):
-        # Get member data
-        member_data = kwargs[self.MEMBER_DATA]
-
-        # Calculates left over from leveling
-        curr_xp = await member_data.get_raw(self.EXP)
-        goal = await member_data.get_raw(self.GOAL)
+        # Get current state
+        level = await member_data.get_raw(self.LEVEL)
+        exp = await member_data.get_raw(self.EXP)
 
-        # Set new XP
-        await member_data.set_raw(self.EXP, value=curr_xp - goal)
+        # Calculates new level and left over XP from the guild's curve and sets them at once
+        new_level, new_exp, _ = settings.curve.advance(level, exp)
+        await member_data.update({self.LEVEL: new_level, self.EXP: new_exp})
 
-    async def _level_update(self, **kwargs):
-        # Get member data
-        member_data = kwargs[self.MEMBER_DATA]
-        member = kwargs[self.MEMBER]
+        # Checks roles once for the final level
+        if new_level != level:
+            stage = self._perf.start()
+            await self._level_role(member_data=member_data, member=member)
+            self._perf.record(LEVEL_ROLE, stage)
 
-        # Get current level
-        curr_level = await member_data.get_raw(self.LEVEL)
-
-        # Set new level
-        await member_data.set_raw(self.LEVEL, value=curr_level + 1)
-        await self._level_role(member_data=member_data, member=member)
+        return new_level - level
 
     async def _level_role(self, **kwargs):
         """
         Checks if the member gets a role by leveling up
+
+        The role comes from one bisect on the guild's role map and the whole swap is applied with a single edit.
         """
         # Get data
         member_data = kwargs[self.MEMBER_DATA]
         member: discord.Member = kwargs[self.MEMBER]
-        guild_config = await self._get_guild_config(member.guild)
-        guild_roles = await guild_config.get_raw(self.GUILD_ROLES)
+        role_map = await self._get_role_map(member.guild)
 
-        # Set variable to append to
-        autoroles = []
+        # If no roles
+        if len(role_map) == 0:
+            return
 
         # Get level and roles
         level = await member_data.get_raw(self.LEVEL)
-        role_name = await member_data.get_raw(self.ROLE_NAME)
+        index = role_map.target(level)
 
-        # If no roles
-        if len(guild_roles) == 0:
-            return
+        # If level is smaller than every autorole level, member gets no role
+        if index is None:
+            new_role, new_role_name = None, self.DEFAULT_ROLE
 
-        # Loop through guild_roles and append to autoroles
-        for role in guild_roles:
-            autoroles.append(discord.utils.find(lambda r: str(r.id) == role[self.ROLE_ID], member.guild.roles))
+        # Else get the role of the highest autorole level reached
+        else:
+            new_role, new_role_name = role_map.roles[index], role_map.names[index]
 
-        # Create function for _assign_role
-        async def _assign_role(index):
+            # If it was deleted from the guild, leave the member as is
+            if new_role is None:
+                log.debug(f'Role {new_role_name} of level {role_map.levels[index]} no longer exists')
+                return
 
-            # Set new role
-            _new_role = autoroles[index]
+        # Keep every role that isn't an autorole then add the new one
+        current_roles = [role for role in member.roles if not role.is_default()]
+        roles = [role for role in current_roles if role not in role_map]
+        if new_role is not None:
+            roles.append(new_role)
 
-            # Try to assign it
-            try:
-                # Loop between roles of member to check if they're in autoroles and remove them
-                for _member_role in member.roles:
+        # Try to apply it
+        try:
+            if set(roles) != set(current_roles):
+                await member.edit(roles=roles, reason="level up" if new_role is not None else "levels lost")
 
-                    # If role is in autoroles, remove it
-                    if _member_role in autoroles:
-                        await member.remove_roles(_member_role, reason="level up")
+        # If it fails, log it
+        except discord.HTTPException:
+            log.debug("Permissions denied for role assignement")
 
-                # Add new role
-                await member.add_roles(_new_role, reason="level up")
+    async def _get_role_map(self, guild: discord.Guild) -> RoleMap:
+        """
+        The guild's autoroles are compiled once and rebuilt when they or the guild's roles change
+        """
+        role_map = self._role_maps.get(guild.id)
 
-                # Get new role
-                _new_role = guild_roles[index][self.ROLE_NAME]
+        if role_map is None:
+            self._perf.reads += 1
+            role_map = self._role_maps[guild.id] = RoleMap(guild, await self._get_roles(guild))
 
-                # Set new role data
-                await member_data.set_raw(self.ROLE_NAME, value=_new_role)
+        return role_map
 
-            # If it fails, log it
-            except:
-                log.debug("Permissions denied for role assignement")
+    def _invalidate_role_map(self, guild: discord.Guild):
+        self._role_maps.pop(guild.id, None)
 
-        # If level is smaller than guild_roles level and role isn't default
-        if level < guild_roles[0][self.LEVEL] and role_name != self.DEFAULT_ROLE:
+    @listener()
+    async def on_guild_role_delete(self, role: discord.Role):
+        self._invalidate_role_map(role.guild)
 
-            # Try to remove it
-            try:
+    @listener()
+    async def on_guild_role_update(self, before: discord.Role, after: discord.Role):
+        self._invalidate_role_map(after.guild)
 
-                # Loop between roles of member to check if they're in autoroles and remove them
-                for member_role in member.roles:
+    async def _give_xp(self, **kwargs):
 
-                    # If role is in autoroles, remove it
-                    if member_role in autoroles:
-                        await member.remove_roles(member_role, reason="levels lost")
+        # Get settings, member and xp data
+        settings = kwargs[self.SETTINGS]
+        member_data = kwargs[self.MEMBER_DATA]
+        member = kwargs[self.MEMBER]
+        xp = kwargs[self.EXP]
 
-                # Set new role data
-                await member_data.set_raw(self.ROLE_NAME, value=self.DEFAULT_ROLE)
+        # Calculate XP and set XP
+        exp = await member_data.get_raw(self.EXP)
+        await member_data.set_raw(self.EXP, value=exp + xp)
 
-            # If it fails, log it
-            except:
-                log.debug("Permissions denied for role removal")
+        # Level up as many times as needed in one step and count levels
+        count = await self._level_up(settings=settings, member_data=member_data, member=member)
 
-        # Loop with pairs of old role and next_role
-        for i, (role, next_role) in enumerate(zip(guild_roles, guild_roles[1:] + [None])):
+        # Update leaderboard position and log it
+        self._update_rank(member_data)
+        self._log_event(eventlog.GIVE, member_data, xp)
 
-            # Log loop number, current role, level and next role
-            log.debug(f'Loop : {i} | Current role : {role[self.LEVEL]} | Level: {level} | Next role : {next_role and next_role[self.LEVEL]}')
+        # Return count for message
+        return count
 
-            # If there is next_role, and level is greater than role and smaller than next_role, assign it
-            if next_role and role[self.LEVEL] <= level < next_role[self.LEVEL] and role_name != role[self.ROLE_NAME]:
-                await _assign_role(i)
+    async def _export_members(self, guild: discord.Guild, fmt: str, file, chunk_size: int = 5000):
+        """
+        Writes the guild's members to a file chunk by chunk and returns how many there were
 
-            # If no next_role and level is greater than role and role is not current role name, assign it
-            if not next_role and role[self.LEVEL] <= level and role_name != role[self.ROLE_NAME]:
-                await _assign_role(i)
+        Records are served from the member cache and every chunk is written away from the event loop.
+        """
+        await self._ready.wait()
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, file.write, transfer.header(fmt, guild.id))
 
+        # Copy the records of a chunk then write it
+        count = 0
+        members = ((member_id, entry.data) for member_id, entry in list(self._members.members(guild.id).items())
+                   if entry.tracked)
+        while True:
+            chunk = list(itertools.islice(members, chunk_size))
+            if not chunk:
+                return count
 
-    async def _level_goal(self, **kwargs):
-        # Get member data
-        member_data = kwargs[self.MEMBER_DATA]
+            await loop.run_in_executor(None, file.write, transfer.dump(fmt, chunk))
+            count += len(chunk)
 
-        # Get level data
-        level = await member_data.get_raw(self.LEVEL)
+    async def _import_members(self, guild: discord.Guild, reader, chunk_size: int = 5000):
+        """
+        Loads members from a reader into the member cache and returns how many there were
 
-        # Calculate goal
-        goal = 5 * level ** 2 + 50 * level + 100
+        Chunks are read away from the event loop, then the whole guild is written to Config at once and its leaderboard
+        is rebuilt once. Members imported before a read error are kept.
+        """
+        await self._ready.wait()
+        settings = await self._get_settings(guild)
+        loop = asyncio.get_event_loop()
+        count = 0
 
-        # Set new goal
-        await member_data.set_raw(self.GOAL, value=goal)
+        try:
+            while True:
+                chunk = await loop.run_in_executor(None, list, itertools.islice(reader, chunk_size))
+                if not chunk:
+                    return count
 
-    async def _give_xp(self, **kwargs):
+                for member_id, data in chunk:
+                    # Levels of other levelers are kept, XP past the goal of the level on this guild's curve isn't
+                    level = data[self.LEVEL] = min(max(data[self.LEVEL], 0), MAX_LEVEL)
+                    data[self.EXP] = max(data[self.EXP], 0)
+                    if level < MAX_LEVEL:
+                        data[self.EXP] = min(data[self.EXP], settings.curve.goal(level) - 1)
 
-        # Get member and xp data
-        member_data = kwargs[self.MEMBER_DATA]
-        member = kwargs[self.MEMBER]
-        xp = kwargs[self.EXP]
+                    self._members.put(guild.id, member_id, data)
+                    self._events.append(eventlog.IMPORT, guild.id, member_id, data, 0, time.time())
 
-        # Calculate XP and set XP
-        exp = await member_data.get_raw(self.EXP)
-        exp += xp
-        await member_data.set_raw(self.EXP, value=exp)
+                count += len(chunk)
 
-        # Set count to count
-        count = 0
+        # Write and index once, members read before an error included
+        finally:
+            await self._members.write_guild(guild.id)
+            await self._build_guild_ranks(guild.id)
+
+    async def _recompute_levels(self, guild: discord.Guild, old_settings: GuildSettings):
+        """
+        Moves every member from the curve of the old settings to the configured one and returns how many changed level
 
-        # Get goal
-        goal = await member_data.get_raw(self.GOAL)
+        Members keep their total XP. They're placed on the new curve from one snapshot, in a thread for large guilds,
+        while messages keep using the old settings. Every member is then moved at once, those that gained XP since the
+        snapshot from where they are now, before the new settings take over, so no message sees a member on the other
+        curve. Members that changed are written to Config at once and the leaderboard is rebuilt once.
+        """
+        await self._ready.wait()
+        old_curve = old_settings.curve
+        self._settings[guild.id] = old_settings
+        changed = []
+        moved = 0
+
+        try:
+            self._perf.reads += 1
+            curve = GuildSettings.from_config(await self.config.guild(guild).all()).curve
+            snapshot = await self._snapshot(guild.id, self.LEVEL, self.EXP)
+            changes, _ = await self._offload(len(snapshot), recompute.relevel, old_curve, curve, snapshot)
+
+            placed = {member_id: (new_level, new_exp) for member_id, _, _, new_level, new_exp in changes}
+            before = {member_id: (level, exp) for member_id, level, exp in snapshot}
+            for member_id, entry in self._members.members(guild.id).items():
+                if not entry.tracked:
+                    continue
+
+                # Members that gained XP or joined since the snapshot are placed from where they are now
+                level, exp = entry.data[self.LEVEL], entry.data[self.EXP]
+                if before.get(member_id) != (level, exp):
+                    new_level, new_exp = recompute.place(old_curve, curve, level, exp)
+                elif member_id in placed:
+                    new_level, new_exp = placed[member_id]
+                else:
+                    continue
+
+                if (new_level, new_exp) != (level, exp):
+                    entry.data[self.LEVEL] = new_level
+                    entry.data[self.EXP] = new_exp
+                    self._log_event(eventlog.RECOMPUTE, entry)
+                    changed.append(member_id)
+                    moved += new_level != level
+
+        # The new settings take over once every member is on their curve, members moved before an error are written
+        finally:
+            self._invalidate_settings(guild)
+            if changed:
+                await self._members.write_guild(guild.id, changed)
+                await self._build_guild_ranks(guild.id)
+
+        return moved
+
+    async def _check_all(self):
+        """
+        Repairs the member data of every cached guild the bot is still in and logs what was found
+        """
+        self._checked = time.monotonic()
 
-        # While XP is greater than goal, count and level_up
-        while exp >= goal:
-            await self._level_up(member_data=member_data, member=member)
-            count += 1
-            exp = await member_data.get_raw(self.EXP)
-            goal = await member_data.get_raw(self.GOAL)
+        for guild_id in list(self._members.guilds):
+            guild = self.bot.get_guild(guild_id)
+            if guild is None:
+                continue
 
-        # Return count for message
-        return count
+            try:
+                report = await self._check_guild(guild, repair=True)
+            except Exception:
+                log.exception("Failed to check the member data of guild {}".format(guild_id))
+                continue
+
+            if report.anomalies:
+                log.info("Checked guild {}: {}".format(guild_id, report.format()))
+
+    async def _check_guild(self, guild: discord.Guild, repair: bool = False,
+                           chunk_size: int = 5000) -> integrity.IntegrityReport:
+        """
+        Walks a guild's members a chunk at a time looking for anomalies and optionally repairs them
+
+        Only a chunk of members is looked at between two yields to the event loop. Repaired records are written with a
+        single Config write at the end and their leaderboard entries are moved as they're fixed. Role mismatches are
+        only counted, `!la guild roles sync` fixes them.
+        """
+        await self._ready.wait()
+        started = time.perf_counter()
+        settings = await self._get_settings(guild)
+        role_map = await self._get_role_map(guild)
+        stale_roles = self._stale_roles.get(guild.id, set())
+        leaderboard = self._get_leaderboard(guild.id)
+        members = self._members.members(guild.id)
+        report = integrity.IntegrityReport(guild.id)
+        repaired = []
+
+        member_ids = list(members)
+        for start in range(0, len(member_ids), chunk_size):
+            levels = {}
+
+            for member_id in member_ids[start:start + chunk_size]:
+                entry = members.get(member_id)
+                if entry is None or not entry.tracked:
+                    continue
+
+                # Check the record then where it's ranked and how it's stored
+                data = entry.data
+                kinds = integrity.check(data, settings.curve)
+                if not leaderboard.matches(member_id, data[self.LEVEL], data[self.EXP]):
+                    kinds.append(integrity.RANK)
+                if (guild.id, member_id) in self._members.legacy:
+                    kinds.append(integrity.LEGACY)
+
+                report.add(member_id, kinds)
+                report.scanned += 1
+                levels[member_id] = data[self.LEVEL]
+
+                if repair and kinds:
+                    data.update(integrity.repair(data, settings.curve))
+                    self._update_rank(entry)
+                    self._log_event(eventlog.REPAIR, entry)
+                    repaired.append(member_id)
+
+            # Count members whose level role doesn't match, without editing anyone
+            if len(role_map) or stale_roles:
+                plan = RoleReconciler(guild, role_map, levels, stale_role_ids=stale_roles, dry_run=True)
+                for member, _, _ in plan.changes:
+                    report.add(member.id, (integrity.ROLE,))
+
+            await asyncio.sleep(0)
+
+        # Write every repaired record at once
+        if repaired:
+            await self._members.write_guild(guild.id, repaired)
+            report.repaired = len(repaired)
+
+        report.elapsed = time.perf_counter() - started
+        return report
+
+    async def _rewind_guild(self, guild: discord.Guild, until: float, apply: bool = False):
+        """
+        Rebuilds the guild's member records at a moment from the event log
+
+        Returns how many members had a record then and how many of those differ now. Events still buffered, at most a
+        flush interval old, aren't replayed. With apply, the members that differ get their records back, written with a
+        single Config write, and the leaderboard is rebuilt once. Members without a record then are kept as they are.
+        """
+        await self._ready.wait()
+        if self._events.folder is None:
+            raise eventlog.ReplayError("The event log isn't open")
+
+        replayed = await asyncio.get_event_loop().run_in_executor(None, eventlog.replay, self._events.folder,
+                                                                  guild.id, until)
+        members = self._members.members(guild.id)
+        compared = (self.LEVEL, self.EXP, self.MESSAGE_COUNT, self.MESSAGE_WITH_XP)
+        changed = []
+
+        for member_id, data in replayed.items():
+            entry = members.get(member_id)
+            if entry is None or not entry.tracked or any(entry.data[field] != data[field] for field in compared):
+                changed.append(member_id)
+
+        if apply and changed:
+            now = time.time()
+            for member_id in changed:
+                # Cooldowns keep running from the last message
+                data = replayed[member_id]
+                entry = members.get(member_id)
+                if entry is not None and entry.tracked:
+                    data[self.LAST_TRIGGER] = entry.data[self.LAST_TRIGGER]
+
+                self._members.put(guild.id, member_id, data)
+                self._events.append(eventlog.REWIND, guild.id, member_id, data, 0, now)
+
+            await self._members.write_guild(guild.id, changed)
+            await self._build_guild_ranks(guild.id)
+
+        return len(replayed), len(changed)
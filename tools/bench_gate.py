@@ -0,0 +1,96 @@
+"""
+Measures how many messages per second the levels message gate can reject.
+
+Run from the repository root: ``python -m tools.bench_gate``
+
+The legacy figure replays the old ``_is_valid_message`` logic with its three Config reads replaced by awaited
+in-memory lookups, so it is a lower bound on the old cost: real Config reads are slower.
+"""
+import argparse
+import asyncio
+import random
+import time
+from types import SimpleNamespace
+
+from levels.gate import MessageGate
+
+
+def build_messages(count: int, prefixes: list, guilds: int, channels: int):
+    """
+    Builds a mix of bot messages, commands, ignored-channel messages and plain chat
+    """
+    messages = []
+    for _ in range(count):
+        guild = SimpleNamespace(id=random.randrange(guilds))
+        channel = SimpleNamespace(id=random.randrange(channels))
+        kind = random.random()
+        content = "hello there, how is everyone doing today?"
+        if kind < 0.5:
+            content = random.choice(prefixes) + "level"
+        author = SimpleNamespace(bot=kind > 0.9)
+        messages.append(SimpleNamespace(author=author, guild=guild, channel=channel, content=content))
+    return messages
+
+
+async def legacy_is_valid(message, prefixes, inactive_guilds, ignored_channels):
+    async def read(value):
+        return value
+
+    if message.author.bot:
+        return False
+    if not message.guild:
+        return False
+    if await read(message.guild.id in inactive_guilds):
+        return False
+    if await read(message.channel.id in ignored_channels):
+        return False
+    for prefix in await read(prefixes):
+        if message.content.startswith(prefix):
+            return False
+    return True
+
+
+async def run_legacy(messages, prefixes, inactive_guilds, ignored_channels):
+    rejected = 0
+    for message in messages:
+        if not await legacy_is_valid(message, prefixes, inactive_guilds, ignored_channels):
+            rejected += 1
+    return rejected
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=200000)
+    parser.add_argument("--prefixes", type=int, default=8)
+    parser.add_argument("--guilds", type=int, default=50)
+    parser.add_argument("--channels", type=int, default=500)
+    args = parser.parse_args()
+
+    random.seed(0)
+    prefixes = ["!", "?", "."] + ["p{}!".format(i) for i in range(max(0, args.prefixes - 3))]
+    prefixes = prefixes[:args.prefixes]
+    messages = build_messages(args.messages, prefixes, args.guilds, args.channels)
+    inactive_guilds = set(range(0, args.guilds, 10))
+    ignored_channels = set(range(0, args.channels, 7))
+
+    gate = MessageGate()
+    gate.compile_prefixes(prefixes)
+    gate.inactive_guilds = inactive_guilds
+    gate.ignored_channels = ignored_channels
+
+    start = time.perf_counter()
+    rejected = sum(1 for message in messages if not gate.accepts(message))
+    gate_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    legacy_rejected = asyncio.run(run_legacy(messages, prefixes, inactive_guilds, ignored_channels))
+    legacy_time = time.perf_counter() - start
+
+    assert rejected == legacy_rejected
+    print("{} messages, {} prefixes, {} rejected".format(len(messages), len(prefixes), rejected))
+    print("gate:   {:>12,.0f} messages/sec rejected".format(rejected / gate_time))
+    print("legacy: {:>12,.0f} messages/sec rejected".format(rejected / legacy_time))
+
+
+if __name__ == "__main__":
+    main()
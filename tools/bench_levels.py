@@ -0,0 +1,225 @@
+"""
+Replays a synthetic message stream through the levels cog and reports what each message costs.
+
+Run from the repository root: ``python -m tools.bench_levels``
+
+The cog runs on top of the in-memory Config and Discord stand-ins from ``tools.fakes``. Senders follow a Zipf
+distribution within each guild, a share of messages are commands or come from bots, and a simulated clock moves
+forward by ``--interval`` seconds per message so cooldowns behave like they would live. ``on_message`` only queues
+valid messages, so the handler figures are the cost seen by the event loop and throughput includes waiting for the
+workers to drain. Stage figures are inclusive: ``_handle_message`` contains ``_process_xp`` which contains
+``_level_up`` which contains ``_level_role``.
+"""
+import argparse
+import asyncio
+import random
+import tempfile
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from redbot.core import Config
+
+from levels.levels import Levels
+from tools.fakes import FakeBot, FakeChannel, FakeConfig, FakeCoreConfig, FakeGuild, FakeMember, FakeMessage, FakeRole
+
+STAGES = ("_is_valid_message", "_handle_message", "_process_xp", "_level_up", "_level_role")
+AUTOROLE_LEVELS = (2, 5, 10, 20)
+
+
+class SimClock:
+    """
+    Replaces the time module seen by the cog so a message stream can span hours in seconds
+    """
+
+    def __init__(self):
+        self.now = 1000000.0
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now
+
+
+class StageStats:
+    def __init__(self):
+        self.latencies = []
+        self.reads = 0
+        self.writes = 0
+
+
+def percentile(values: list, fraction: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def instrument(cog, config: FakeConfig, stats: dict):
+    """
+    Wraps the pipeline stages on the cog instance to time them and count their Config calls
+    """
+    counter = config.counter
+
+    def record(name, start, reads, writes):
+        stage = stats[name]
+        stage.latencies.append(time.perf_counter() - start)
+        stage.reads += counter.reads - reads
+        stage.writes += counter.writes - writes
+
+    for name in STAGES:
+        stats[name] = StageStats()
+        method = getattr(cog, name)
+
+        if asyncio.iscoroutinefunction(method):
+            async def wrapper(*args, _name=name, _method=method, **kwargs):
+                start, reads, writes = time.perf_counter(), counter.reads, counter.writes
+                try:
+                    return await _method(*args, **kwargs)
+                finally:
+                    record(_name, start, reads, writes)
+        else:
+            def wrapper(*args, _name=name, _method=method, **kwargs):
+                start, reads, writes = time.perf_counter(), counter.reads, counter.writes
+                try:
+                    return _method(*args, **kwargs)
+                finally:
+                    record(_name, start, reads, writes)
+
+        setattr(cog, name, wrapper)
+
+
+def build_workload(args, config: FakeConfig):
+    """
+    Creates guilds, members and the message stream
+    """
+    guilds = []
+    senders = []
+    weights = [1 / rank ** args.zipf for rank in range(1, args.members + 1)]
+
+    for guild_id in range(1, args.guilds + 1):
+        autoroles = [FakeRole(guild_id * 1000 + level, "Level {}".format(level)) for level in AUTOROLE_LEVELS]
+        guild = FakeGuild(guild_id, autoroles)
+        channel = FakeChannel(guild_id * 1000, guild)
+        members = []
+        for member_id in range(guild_id * 1000000, guild_id * 1000000 + args.members):
+            member = FakeMember(member_id, guild, bot=random.random() < args.bots)
+            guild.add_member(member)
+            members.append(member)
+
+        config.data["guild"][guild_id] = {
+            "cooldown": args.cooldown,
+            "guild_roles": [{"role_id": str(role.id), "role_name": role.name, "level": level,
+                             "description": ""} for role, level in zip(autoroles, AUTOROLE_LEVELS)]
+        }
+        guilds.append(guild)
+        senders.append((channel, members))
+
+    messages = []
+    for _ in range(args.messages):
+        channel, members = random.choice(senders)
+        author = random.choices(members, weights)[0]
+        content = "just chatting about the weather"
+        if random.random() < args.commands:
+            content = random.choice(args.prefixes) + "level"
+        messages.append(FakeMessage(author, channel, content))
+
+    return guilds, messages
+
+
+async def run(args):
+    random.seed(args.seed)
+    config = FakeConfig()
+    clock = SimClock()
+    guilds, messages = build_workload(args, config)
+
+    with tempfile.TemporaryDirectory() as data_path, \
+            patch.object(Config, "get_conf", return_value=config), \
+            patch.object(Config, "get_core_conf", return_value=FakeCoreConfig(args.prefixes)), \
+            patch("levels.x.cog_data_path", return_value=Path(data_path)), \
+            patch("levels.x.time", SimpleNamespace(time=clock.time, monotonic=clock.monotonic)):
+
+        cog = Levels(FakeBot(asyncio.get_event_loop()))
+        cog._announcer.window = 0
+        cog._perf.enabled = args.perf
+        await cog._ready.wait()
+
+        stats = {}
+        if not args.perf:
+            instrument(cog, config, stats)
+
+            # The workers hold the handler they were created with
+            cog._actors.handler = cog._handle_message
+        start_reads, start_writes = config.counter.reads, config.counter.writes
+        latencies = []
+
+        start = time.perf_counter()
+        for i, message in enumerate(messages):
+            clock.now += args.interval
+            handler_start = time.perf_counter()
+            await cog.on_message(message)
+            latencies.append(time.perf_counter() - handler_start)
+
+            # Let workers, background flushes and announcements run now and then
+            if i % 100 == 0:
+                await asyncio.sleep(0)
+        await cog._actors.join()
+        elapsed = time.perf_counter() - start
+
+        # Write back what is still pending so its cost is counted
+        flush_start = config.counter.writes
+        await cog._members.flush()
+        flush_writes = config.counter.writes - flush_start
+
+        cog.cog_unload()
+        await asyncio.sleep(0)
+
+    count = len(messages)
+    reads = config.counter.reads - start_reads
+    writes = config.counter.writes - start_writes
+
+    print("workload: {} guilds x {} members, zipf s={}, cooldown {}s, {:.0%} commands, {:.0%} bots, {} messages, "
+          "{}s apart".format(args.guilds, args.members, args.zipf, args.cooldown, args.commands, args.bots, count,
+                             args.interval))
+    print("handler: {:,.0f} messages/sec, p50 {:.1f}us, p99 {:.1f}us".format(
+        count / elapsed, percentile(latencies, 0.5) * 1e6, percentile(latencies, 0.99) * 1e6))
+    print("config: {:.3f} reads and {:.3f} writes per message ({} written by the final flush)".format(
+        reads / count, writes / count, flush_writes))
+    print(cog._actors.report())
+    print()
+
+    # Show the cog's own stage report instead when it recorded the run
+    if args.perf:
+        print(cog._perf.report())
+        return
+
+    print("{:<20}{:>10}{:>12}{:>12}{:>14}{:>14}".format("stage", "calls", "p50 (us)", "p99 (us)", "reads/call",
+                                                       "writes/call"))
+    for name in STAGES:
+        stage = stats[name]
+        calls = len(stage.latencies)
+        print("{:<20}{:>10}{:>12.1f}{:>12.1f}{:>14.3f}{:>14.3f}".format(
+            name, calls, percentile(stage.latencies, 0.5) * 1e6, percentile(stage.latencies, 0.99) * 1e6,
+            stage.reads / calls if calls else 0, stage.writes / calls if calls else 0))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--guilds", type=int, default=5)
+    parser.add_argument("--members", type=int, default=2000, help="members per guild")
+    parser.add_argument("--messages", type=int, default=50000)
+    parser.add_argument("--zipf", type=float, default=1.1, help="exponent of the sender distribution")
+    parser.add_argument("--cooldown", type=int, default=60)
+    parser.add_argument("--interval", type=float, default=0.05, help="simulated seconds between messages")
+    parser.add_argument("--commands", type=float, default=0.2, help="share of messages starting with a prefix")
+    parser.add_argument("--bots", type=float, default=0.05, help="share of members that are bots")
+    parser.add_argument("--prefixes", nargs="+", default=["!", "?", "red "])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--perf", action="store_true", help="enable the cog's stage recording instead")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Measures how long leaderboard rebuilds and guild reports stall the event loop, inline and offloaded.
+
+Run from the repository root: ``python -m tools.bench_stall``
+
+A ticker coroutine asks to wake up every millisecond and records how late it is, like the gateway heartbeat and every
+other cog would be. The same large guild is ranked and reported once with the offload threshold above its size, so
+everything runs on the event loop, and once below it, so the work runs in the default executor on snapshots.
+"""
+import argparse
+import asyncio
+import random
+import tempfile
+import time
+from pathlib import Path
+from unittest.mock import patch
+
+from redbot.core import Config
+
+from levels.levels import Levels
+from tools.fakes import FakeBot, FakeConfig, FakeCoreConfig, FakeGuild
+
+TICK = 0.001
+
+
+class FakeContext:
+    def __init__(self, guild: FakeGuild):
+        self.guild = guild
+        self.prefix = "!"
+
+    async def send(self, content=None, **kwargs):
+        pass
+
+
+async def ticker(lags: list, stop: asyncio.Event):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(TICK)
+        lags.append(time.perf_counter() - start - TICK)
+
+
+async def measure(cog, ctx: FakeContext, threshold: int) -> tuple:
+    """
+    Returns the wall time and the worst and p99 event loop lag of a rebuild and a report
+    """
+    cog._offload_threshold = threshold
+    lags = []
+    stop = asyncio.Event()
+    task = asyncio.ensure_future(ticker(lags, stop))
+    await asyncio.sleep(0.05)
+    lags.clear()
+
+    start = time.perf_counter()
+    await cog._build_guild_ranks(ctx.guild.id)
+    await cog.guild_distribution.callback(cog, ctx)
+    elapsed = time.perf_counter() - start
+
+    stop.set()
+    await task
+    lags.sort()
+    return elapsed, lags[-1], lags[min(len(lags) - 1, int(0.99 * len(lags)))]
+
+
+async def run(args):
+    random.seed(args.seed)
+    config = FakeConfig()
+    for member_id in range(1, args.members + 1):
+        config.data["member"][(1, member_id)] = {"record": [1, random.randrange(500), random.randrange(60), 0,
+                                                            random.randrange(5000), random.randrange(2000)]}
+
+    with tempfile.TemporaryDirectory() as data_path, \
+            patch.object(Config, "get_conf", return_value=config), \
+            patch.object(Config, "get_core_conf", return_value=FakeCoreConfig(["!"])), \
+            patch("levels.x.cog_data_path", return_value=Path(data_path)):
+        cog = Levels(FakeBot(asyncio.get_event_loop()))
+        await cog._ready.wait()
+        ctx = FakeContext(FakeGuild(1))
+
+        print("{:,} members, {}ms ticks".format(args.members, int(TICK * 1000)))
+        print("{:<12}{:>12}{:>16}{:>16}".format("mode", "wall (ms)", "worst lag (ms)", "p99 lag (ms)"))
+        for mode, threshold in (("inline", args.members + 1), ("offloaded", 0)):
+            elapsed, worst, p99 = await measure(cog, ctx, threshold)
+            print("{:<12}{:>12.1f}{:>16.1f}{:>16.1f}".format(mode, elapsed * 1000, worst * 1000, p99 * 1000))
+
+        cog.cog_unload()
+        await asyncio.sleep(0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--members", type=int, default=200000)
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
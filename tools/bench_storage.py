@@ -0,0 +1,126 @@
+"""
+Compares the Config and SQLite storage of member records.
+
+Run from the repository root: ``python -m tools.bench_storage``
+
+The same guild is stored with Red's JSON Config driver in a temporary folder and in a SQLite store, then the member
+cache loads it, flushes a batch of dirty members and writes the whole guild with each. A top 10 and the rank of a
+member are read from storage too: Config has to read every member of the guild and sort them, SQLite reads the index.
+"""
+import argparse
+import asyncio
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from redbot.core import Config, data_manager
+
+from levels import record
+from levels.cache import MemberCache
+from levels.storage import SqliteStore
+from tools.fakes import ConfigCounter
+
+GUILD_ID = 1
+
+
+def make_config(path: str) -> Config:
+    data_manager.basic_config = {"DATA_PATH": path, "STORAGE_TYPE": "JSON", "STORAGE_DETAILS": {},
+                                 "COG_PATH_APPEND": "cogs", "CORE_PATH_APPEND": "core"}
+    config = Config.get_conf(None, 4712468135468475, cog_name="Levels", force_registration=True)
+    config.register_member(record=None)
+    return config
+
+
+async def timed(coro) -> tuple:
+    start = time.perf_counter()
+    result = await coro
+    return (time.perf_counter() - start) * 1000, result
+
+
+async def config_keys(config: Config) -> dict:
+    """
+    Reads every member of the guild and returns their leaderboard keys
+    """
+    keys = {}
+    for member_id, stored in (await config.all_members()).get(GUILD_ID, {}).items():
+        data = record.unpack(stored)
+        keys[int(member_id)] = (-data[record.LEVEL], -data[record.EXP], int(member_id))
+    return keys
+
+
+async def config_top(config: Config, count: int) -> list:
+    return [key[2] for key in sorted((await config_keys(config)).values())[:count]]
+
+
+async def config_rank(config: Config, member_id: int) -> int:
+    keys = await config_keys(config)
+    return 1 + sum(1 for key in keys.values() if key < keys[member_id])
+
+
+async def measure(cache: MemberCache, dirty: int, rng: random.Random) -> dict:
+    """
+    Returns the time in ms of a load, a flush of dirty members and a write of the whole guild
+    """
+    results = {}
+    results["load"], _ = await timed(cache.load_all())
+
+    members = list(cache.members(GUILD_ID).values())
+    for entry in rng.sample(members, dirty):
+        await entry.set_raw(record.EXP, entry.data[record.EXP] + rng.randrange(15, 26))
+    results["flush"], _ = await timed(cache.flush())
+    results["write_guild"], _ = await timed(cache.write_guild(GUILD_ID))
+    return results
+
+
+async def run(args):
+    rng = random.Random(args.seed)
+    members = {str(member_id): record.pack({record.EXP: rng.randrange(500), record.LEVEL: rng.randrange(60),
+                                            record.LAST_TRIGGER: 0, record.MESSAGE_COUNT: rng.randrange(5000),
+                                            record.MESSAGE_WITH_XP: rng.randrange(2000)})
+               for member_id in range(1, args.members + 1)}
+
+    with tempfile.TemporaryDirectory() as data_path:
+        config = make_config(data_path)
+        await config._get_base_group(config.MEMBER, str(GUILD_ID)).set(members)
+
+        # Copy it to SQLite like `!la config set storage sqlite` does
+        store = SqliteStore(Path(data_path) / "members.sqlite3")
+        await store.open()
+        migrate, _ = await timed(MemberCache(config, ConfigCounter()).switch(store))
+
+        # Config
+        cache = MemberCache(config, ConfigCounter(), max_dirty=args.dirty + 1)
+        config_times = await measure(cache, args.dirty, random.Random(args.seed))
+        config_times["top 10"], top = await timed(config_top(config, 10))
+        member_id = rng.randrange(1, args.members + 1)
+        config_times["rank"], rank = await timed(config_rank(config, member_id))
+
+        # SQLite
+        cache = MemberCache(config, ConfigCounter(), max_dirty=args.dirty + 1)
+        cache.store = store
+        sqlite_times = await measure(cache, args.dirty, random.Random(args.seed))
+        sqlite_times["top 10"], sqlite_top = await timed(store.top(GUILD_ID, 0, 10))
+        sqlite_times["rank"], sqlite_rank = await timed(store.rank(GUILD_ID, member_id))
+        await store.close()
+
+    # Both flushed the same members the same way, so they rank them the same
+    assert [row[0] for row in sqlite_top] == top and sqlite_rank == rank
+
+    print("{:,} members, {} dirty per flush, migration to SQLite took {:.0f}ms".format(args.members, args.dirty,
+                                                                                       migrate))
+    print("{:<14}{:>14}{:>14}".format("operation", "config (ms)", "sqlite (ms)"))
+    for name in config_times:
+        print("{:<14}{:>14.1f}{:>14.1f}".format(name, config_times[name], sqlite_times[name]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--members", type=int, default=20000)
+    parser.add_argument("--dirty", type=int, default=200, help="members changed between two flushes")
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.get_event_loop().run_until_complete(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Runs the member cache against Red's real Config and checks what it stores.
+
+Run from the repository root: ``python -m tools.config_harness``
+
+The stand-ins of tools/fakes.py only mimic Config, so this drives the JSON driver in a temporary folder with the
+member defaults the cog registers. Members in the compact and the legacy format are seeded, then the cache loads them,
+looks up a member that isn't stored, writes some of a guild's members, migrates the legacy ones and moves everything to
+SQLite and back. After each step every stored member must be a real member ID whose record matches the cache.
+"""
+import argparse
+import asyncio
+import random
+import tempfile
+from pathlib import Path
+
+from levels import record
+from levels.cache import MemberCache
+from levels.storage import SqliteStore
+from tools.bench_storage import make_config
+from tools.fakes import ConfigCounter
+
+GUILDS = (1, 2)
+
+
+def legacy(member_id: int, data: dict) -> dict:
+    stored = dict(data, member_id=str(member_id), username="member", goal=100, role_name="Beginner")
+    stored[record.LAST_TRIGGER] = float(data[record.LAST_TRIGGER])
+    return stored
+
+
+async def check(config, cache: MemberCache, step: str):
+    """
+    Compares every member stored in Config with the cache
+    """
+    all_members = await config.all_members()
+    for guild_id in GUILDS:
+        stored = all_members.get(guild_id, {})
+        cached = {member_id: entry.data for member_id, entry in cache.members(guild_id).items() if entry.tracked}
+        assert all(isinstance(member_id, int) for member_id in stored), "{}: a key isn't a member ID".format(step)
+
+        unpacked = {member_id: record.unpack(data) for member_id, data in stored.items()}
+        assert unpacked == cached, "{}: guild {} differs from the cache".format(step, guild_id)
+
+    print("{:<28} ok, {} legacy members left".format(step, len(cache.legacy)))
+
+
+async def run(args):
+    rng = random.Random(args.seed)
+
+    with tempfile.TemporaryDirectory() as data_path:
+        config = make_config(data_path)
+        for guild_id in GUILDS:
+            members = {}
+            for member_id in range(1, args.members + 1):
+                data = {record.EXP: rng.randrange(500), record.LEVEL: rng.randrange(60), record.LAST_TRIGGER: 0,
+                        record.MESSAGE_COUNT: rng.randrange(5000), record.MESSAGE_WITH_XP: rng.randrange(2000)}
+                members[str(member_id)] = legacy(member_id, data) if member_id % 5 == 0 else record.pack(data)
+            await config._get_base_group(config.MEMBER, str(guild_id)).set(members)
+
+        cache = MemberCache(config, ConfigCounter())
+        await cache.load_all()
+        assert all(cache.members(guild_id) for guild_id in GUILDS), "the load failed"
+        await check(config, cache, "load")
+
+        # A member that was never stored
+        entry = await cache.get(GUILDS[0], args.members + 1)
+        assert not entry.tracked
+        await check(config, cache, "lookup of a new member")
+
+        # Only the new member is written, the others changed in the cache go out with it
+        entry.track(record.new())
+        for changed in rng.sample(list(cache.members(GUILDS[0]).values()), args.members // 10):
+            await changed.set_raw(record.EXP, changed.data[record.EXP] + 1)
+        await cache.write_guild(GUILDS[0], [entry.member_id])
+        await check(config, cache, "write of some members")
+
+        await cache.migrate()
+        assert not cache.legacy
+        await check(config, cache, "migration")
+
+        store = SqliteStore(Path(data_path) / "members.sqlite3")
+        await store.open()
+        await cache.switch(store)
+        stored = await store.load_all()
+        assert all(stored[guild_id] == {member_id: entry.data for member_id, entry in cache.members(guild_id).items()
+                                        if entry.tracked} for guild_id in GUILDS), "the store differs from the cache"
+
+        await cache.switch(None)
+        await store.close()
+        await check(config, cache, "switch to SQLite and back")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--members", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.get_event_loop().run_until_complete(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
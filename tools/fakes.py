@@ -0,0 +1,282 @@
+"""
+In-memory stand-ins for Red's Config and the discord.py objects the levels cog touches.
+
+They only implement what the cog uses and count every Config read and write, so tools can drive the cog without a
+bot, a Discord connection or a data directory.
+"""
+import asyncio
+import copy
+
+import discord
+
+
+class ConfigCounter:
+    def __init__(self):
+        self.reads = 0
+        self.writes = 0
+
+
+class FakeValue:
+    def __init__(self, group, key):
+        self.group = group
+        self.key = key
+
+    async def __call__(self):
+        return await self.group.get_raw(self.key)
+
+    async def set(self, value):
+        await self.group.set_raw(self.key, value=value)
+
+
+class FakeGroup:
+    """
+    A Config group stored as a plain dict and merged with its defaults on read
+    """
+
+    def __init__(self, config, store: dict, key, defaults: dict):
+        self._config = config
+        self._store = store
+        self._key = key
+        self._defaults = defaults
+
+    def _data(self):
+        data = copy.deepcopy(self._defaults)
+        data.update(copy.deepcopy(self._store.get(self._key, {})))
+        return data
+
+    async def get_raw(self, *keys):
+        self._config.counter.reads += 1
+        data = self._data()
+        for key in keys:
+            data = data[key]
+        return data
+
+    async def set_raw(self, *keys, value):
+        self._config.counter.writes += 1
+        data = self._store.setdefault(self._key, {})
+        for key in keys[:-1]:
+            data = data.setdefault(key, {})
+        data[keys[-1]] = copy.deepcopy(value)
+
+    async def all(self):
+        self._config.counter.reads += 1
+        return self._data()
+
+    async def set(self, value):
+        self._config.counter.writes += 1
+        self._store[self._key] = copy.deepcopy(value)
+
+    async def clear(self):
+        self._config.counter.writes += 1
+        self._store.pop(self._key, None)
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return FakeValue(self, name)
+
+
+class FakeMemberScope:
+    """
+    The members of a guild as one group, like ``Config._get_base_group(Config.MEMBER, guild_id)``
+
+    Reads merge the member defaults into the map of members like Red 3.1 does, so they show up as fake members.
+    """
+
+    def __init__(self, config, guild_id: int):
+        self._config = config
+        self._guild_id = guild_id
+
+    async def all(self):
+        self._config.counter.reads += 1
+        data = copy.deepcopy(self._config.defaults["member"])
+        data.update({str(member_id): copy.deepcopy(stored) for (guild_id, member_id), stored
+                     in self._config.data["member"].items() if guild_id == self._guild_id})
+        return data
+
+    async def set(self, value):
+        self._config.counter.writes += 1
+        store = self._config.data["member"]
+        for key in [key for key in store if key[0] == self._guild_id]:
+            del store[key]
+        for member_id, data in value.items():
+            store[(self._guild_id, int(member_id))] = copy.deepcopy(data)
+
+
+class FakeConfig:
+    """
+    Stand-in for ``redbot.core.Config`` covering the global, guild, channel and member scopes
+    """
+    MEMBER = "MEMBER"
+
+    def __init__(self):
+        self.counter = ConfigCounter()
+        self.defaults = {"global": {}, "guild": {}, "channel": {}, "member": {}}
+        self.data = {"global": {}, "guild": {}, "channel": {}, "member": {}}
+        self._global = FakeGroup(self, self.data["global"], None, self.defaults["global"])
+
+    def register_global(self, force_registration=False, **defaults):
+        self.defaults["global"].update(defaults)
+
+    def register_guild(self, force_registration=False, **defaults):
+        self.defaults["guild"].update(defaults)
+
+    def register_channel(self, force_registration=False, **defaults):
+        self.defaults["channel"].update(defaults)
+
+    def register_member(self, force_registration=False, **defaults):
+        self.defaults["member"].update(defaults)
+
+    def _group(self, scope: str, key):
+        return FakeGroup(self, self.data[scope], key, self.defaults[scope])
+
+    async def get_raw(self, *keys):
+        return await self._global.get_raw(*keys)
+
+    async def set_raw(self, *keys, value):
+        await self._global.set_raw(*keys, value=value)
+
+    def guild(self, guild):
+        return self._group("guild", guild.id)
+
+    def guild_from_id(self, guild_id: int):
+        return self._group("guild", guild_id)
+
+    def channel(self, channel):
+        return self._group("channel", channel.id)
+
+    def channel_from_id(self, channel_id: int):
+        return self._group("channel", channel_id)
+
+    def member(self, member):
+        return self._group("member", (member.guild.id, member.id))
+
+    def _get_base_group(self, category: str, guild_id: str, member_id: str = None):
+        if member_id is None:
+            return FakeMemberScope(self, int(guild_id))
+        return self._group("member", (int(guild_id), int(member_id)))
+
+    def _all(self, scope: str):
+        all_data = {}
+        for key, stored in self.data[scope].items():
+            data = copy.deepcopy(self.defaults[scope])
+            data.update(copy.deepcopy(stored))
+            all_data[key] = data
+        return all_data
+
+    async def all_guilds(self):
+        self.counter.reads += 1
+        return self._all("guild")
+
+    async def all_channels(self):
+        self.counter.reads += 1
+        return self._all("channel")
+
+    async def all_members(self, guild=None):
+        self.counter.reads += 1
+        all_members = {}
+        for (guild_id, member_id), data in self._all("member").items():
+            all_members.setdefault(guild_id, {})[member_id] = data
+
+        if guild is not None:
+            return all_members.get(guild.id, {})
+        return all_members
+
+    async def clear_all_members(self, guild=None):
+        self.counter.writes += 1
+        for key in [key for key in self.data["member"] if guild is None or key[0] == guild.id]:
+            del self.data["member"][key]
+
+
+class FakeCoreConfig:
+    """
+    Stand-in for ``Config.get_core_conf()`` exposing the bot prefixes
+    """
+
+    def __init__(self, prefixes: list):
+        self.prefixes = prefixes
+
+    async def prefix(self):
+        return list(self.prefixes)
+
+
+class FakeRole:
+    def __init__(self, role_id: int, name: str):
+        self.id = role_id
+        self.name = name
+
+    def is_default(self):
+        return self.id == 0
+
+    def __repr__(self):
+        return self.name
+
+
+class FakeResponse:
+    status = 403
+    reason = "Forbidden"
+
+
+class FakeMember:
+    def __init__(self, member_id: int, guild, roles: list = None, forbidden: bool = False, bot: bool = False):
+        self.id = member_id
+        self.guild = guild
+        self.bot = bot
+        self.display_name = "member{}".format(member_id)
+        self.mention = "<@{}>".format(member_id)
+        self.roles = roles if roles is not None else [guild.default_role]
+        self.forbidden = forbidden
+        self.edits = 0
+
+    async def edit(self, roles=None, reason=None):
+        # Give the event loop a chance to interleave tasks like a real request would
+        await asyncio.sleep(0)
+        if self.forbidden:
+            raise discord.Forbidden(FakeResponse(), "Missing Permissions")
+        self.edits += 1
+        self.roles = [self.guild.default_role] + list(roles)
+
+
+class FakeGuild:
+    def __init__(self, guild_id: int, roles: list = ()):
+        self.id = guild_id
+        self.name = "guild{}".format(guild_id)
+        self.icon_url = ""
+        self.default_role = FakeRole(0, "@everyone")
+        self.roles = {role.id: role for role in (self.default_role,) + tuple(roles)}
+        self.members = {}
+
+    def add_member(self, member: FakeMember):
+        self.members[member.id] = member
+
+    def get_role(self, role_id: int):
+        return self.roles.get(role_id)
+
+    def get_member(self, member_id: int):
+        return self.members.get(member_id)
+
+
+class FakeChannel:
+    def __init__(self, channel_id: int, guild: FakeGuild):
+        self.id = channel_id
+        self.guild = guild
+        self.mention = "<#{}>".format(channel_id)
+        self.sent = 0
+
+    async def send(self, content=None, **kwargs):
+        self.sent += 1
+
+
+class FakeMessage:
+    __slots__ = ("author", "guild", "channel", "content")
+
+    def __init__(self, author: FakeMember, channel: FakeChannel, content: str):
+        self.author = author
+        self.guild = channel.guild
+        self.channel = channel
+        self.content = content
+
+
+class FakeBot:
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
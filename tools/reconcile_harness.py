@@ -0,0 +1,84 @@
+"""
+Runs a level role sync against a stand-in guild and checks the result.
+
+Run from the repository root: ``python -m tools.reconcile_harness``
+
+Members get random levels and random level roles, some of them from a removed autorole, then the sync is planned in
+dry-run mode and applied. Every member must end up with exactly the role of their level, and a few members whose
+edits fail with Forbidden must be reported as failed and left untouched.
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from levels.reconcile import RoleReconciler
+from levels.roles import RoleMap
+from tools.fakes import FakeGuild, FakeMember, FakeRole
+
+
+def build(member_count: int):
+    autoroles = [FakeRole(100 + i, "Level {}".format(level)) for i, level in enumerate((5, 10, 20, 40))]
+    removed = FakeRole(200, "Removed")
+    other = FakeRole(300, "Other")
+    guild = FakeGuild(1, [removed, other] + autoroles)
+    guild_roles = [{"role_id": str(role.id), "role_name": role.name, "level": int(role.name.split()[1])}
+                   for role in autoroles]
+
+    levels = {}
+    for member_id in range(1, member_count + 1):
+        roles = [guild.default_role] + random.sample(autoroles + [removed, other], random.randrange(3))
+        guild.add_member(FakeMember(member_id, guild, roles, forbidden=member_id % 50 == 0))
+        levels[member_id] = random.randrange(60)
+
+    # Some tracked members left the guild
+    for member_id in range(member_count + 1, member_count + 11):
+        levels[member_id] = random.randrange(60)
+
+    return guild, RoleMap(guild, guild_roles), levels, removed
+
+
+def check(guild, role_map, levels, failed):
+    for member in guild.members.values():
+        if member.id in failed:
+            assert member.edits == 0
+            continue
+
+        index = role_map.target(levels[member.id])
+        expected = {role_map.roles[index].id} if index is not None else set()
+        level_roles = {role.id for role in member.roles if role in role_map or role.id == 200}
+        assert level_roles == expected, (member.id, levels[member.id], member.roles)
+
+
+async def main(member_count: int, rate: int):
+    random.seed(0)
+    guild, role_map, levels, removed = build(member_count)
+
+    dry_run = RoleReconciler(guild, role_map, levels, stale_role_ids={removed.id}, dry_run=True)
+    await dry_run.run()
+    assert all(member.edits == 0 for member in guild.members.values())
+    print("dry run: {} to update, {} gain a role, {} lose one, estimated {:.1f}s".format(
+        dry_run.total, dry_run.added, dry_run.removed, dry_run.eta()))
+
+    reconciler = RoleReconciler(guild, role_map, levels, stale_role_ids={removed.id}, rate=rate, per=1.0)
+    start = time.perf_counter()
+    await reconciler.run()
+    elapsed = time.perf_counter() - start
+
+    check(guild, role_map, levels, reconciler.failed)
+    assert reconciler.done + len(reconciler.failed) == dry_run.total
+    print("run: {} updated, {} failed in {:.2f}s ({:.0f} edits/s, limit {}/s)".format(
+        reconciler.done, len(reconciler.failed), elapsed, reconciler.total / elapsed, rate))
+
+    # A second pass finds nothing left except the members that couldn't be edited
+    again = RoleReconciler(guild, role_map, levels, stale_role_ids={removed.id}, dry_run=True)
+    assert {member.id for member, _, _ in again.changes} == reconciler.failed
+    print("second pass: {} left, all of them failed before".format(again.total))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--members", type=int, default=500)
+    parser.add_argument("--rate", type=int, default=1000, help="edits per second allowed by the limiter")
+    args = parser.parse_args()
+    asyncio.run(main(args.members, args.rate))